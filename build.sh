@@ -2,6 +2,12 @@
 
 pip install -r requirements.txt
 
+python manage.py export_model_bundle
+
+python manage.py build_crop_envelopes
+
+python manage.py build_lookup_grid
+
 python manage.py collectstatic --noinput
 
 python manage.py migrate
\ No newline at end of file
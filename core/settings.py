@@ -90,10 +90,37 @@ WSGI_APPLICATION = "core.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# Run on every new SQLite connection. WAL lets readers proceed while one
+# writer commits; busy_timeout makes writers wait for the lock instead of
+# failing with "database is locked". cache_size is negative KiB.
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(128 * 1024 * 1024))),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-20000")),
+}
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # Seconds to keep a connection open across requests; 0 closes it
+        # after every request
+        "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", "600")),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "init_command": ";".join(
+                f"PRAGMA {name}={value}" for name, value in SQLITE_PRAGMAS.items()
+            ),
+            # Opt-in: IMMEDIATE takes the write lock when any atomic block
+            # starts, read-only ones included, so it waits in busy_timeout
+            # instead of failing on a lock upgrade, at the cost of
+            # serializing those blocks (`manage.py benchmark sqlite`).
+            # Blocks that read before they write use write_atomic()
+            # (predictions/models.py), which takes the lock first either way.
+            "transaction_mode": os.getenv("SQLITE_TRANSACTION_MODE") or None,
+        },
     }
 }
 
@@ -181,3 +208,89 @@ AZURE_SPEECH_REGION = os.environ.get("AZURE_SPEECH_REGION", "")
 # ── OpenWeatherMap  (for weather + crop alerts) ───────────────────────────────
 OPENWEATHER_API_KEY = os.environ.get("OPENWEATHER_API_KEY", "")
 
+
+# ── Crop prediction ──────────────────────────────────────────────────────────
+PREDICTION_BATCH_MAX_SIZE = int(os.getenv("PREDICTION_BATCH_MAX_SIZE", "5000"))
+PREDICTION_SENSITIVITY_MAX_POINTS = int(os.getenv("PREDICTION_SENSITIVITY_MAX_POINTS", "20000"))
+
+# /api/predict/what-if/ answers from the lookup grid only when the grid's
+# top crop matched the model on at least this share of sweep points when
+# it was built (build_lookup_grid reports it); otherwise the model runs.
+PREDICTION_WHAT_IF_MIN_AGREEMENT = float(os.getenv("PREDICTION_WHAT_IF_MIN_AGREEMENT", "0.99"))
+
+# /api/history/ page size: default when ?limit= is absent, and its cap
+PREDICTION_HISTORY_PAGE_SIZE = int(os.getenv("PREDICTION_HISTORY_PAGE_SIZE", "50"))
+PREDICTION_HISTORY_MAX_PAGE_SIZE = int(os.getenv("PREDICTION_HISTORY_MAX_PAGE_SIZE", "200"))
+# Rows fetched and emitted per block by /api/history/export/
+PREDICTION_EXPORT_CHUNK_SIZE = int(os.getenv("PREDICTION_EXPORT_CHUNK_SIZE", "2000"))
+# /api/history/trends/: widest range in buckets, and how long closed
+# buckets stay cached (they only change when history is edited)
+PREDICTION_TRENDS_MAX_BUCKETS = int(os.getenv("PREDICTION_TRENDS_MAX_BUCKETS", "400"))
+PREDICTION_TRENDS_CACHE_TTL = int(os.getenv("PREDICTION_TRENDS_CACHE_TTL", "86400"))
+
+# Retention: `manage.py archive_history` moves predictions and voice
+# queries older than AFTER_DAYS (whole months only) into compressed
+# per-user monthly HistoryArchive rows. CODEC is "gzip" or "zstd" (needs
+# the zstandard package); BATCH_SIZE bounds each DELETE, including
+# /api/history/reset/.
+HISTORY_ARCHIVE = {
+    "AFTER_DAYS": int(os.getenv("HISTORY_ARCHIVE_AFTER_DAYS", "365")),
+    "CODEC": os.getenv("HISTORY_ARCHIVE_CODEC", "gzip"),
+    "BATCH_SIZE": int(os.getenv("HISTORY_ARCHIVE_BATCH_SIZE", "1000")),
+}
+
+# Opt-in: coalesce concurrent single predictions into one model call
+ML_MICROBATCH = {
+    "ENABLED": os.getenv("ML_MICROBATCH_ENABLED", "False") == "True",
+    "MAX_BATCH_SIZE": int(os.getenv("ML_MICROBATCH_MAX_BATCH_SIZE", "32")),
+    "MAX_WAIT_MS": float(os.getenv("ML_MICROBATCH_MAX_WAIT_MS", "2")),
+}
+
+# Opt-in: write Prediction and VoiceQuery rows from request handlers in
+# batches from a background thread (core/write_behind.py). When the
+# queue is full, callers wait up to PUT_TIMEOUT_MS, then save directly.
+# The queue is per process: with more than one worker process a read on
+# another worker can miss a user's queued rows for up to
+# FLUSH_INTERVAL_MS, so read-your-writes only holds for a single process.
+WRITE_BEHIND = {
+    "ENABLED": os.getenv("WRITE_BEHIND_ENABLED", "False") == "True",
+    "MAX_BATCH_SIZE": int(os.getenv("WRITE_BEHIND_MAX_BATCH_SIZE", "500")),
+    "FLUSH_INTERVAL_MS": float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL_MS", "200")),
+    "MAX_QUEUE": int(os.getenv("WRITE_BEHIND_MAX_QUEUE", "10000")),
+    "PUT_TIMEOUT_MS": float(os.getenv("WRITE_BEHIND_PUT_TIMEOUT_MS", "1000")),
+}
+
+# Opt-in LRU + TTL cache of model outputs (top crops, contributions), per
+# worker process; the input-dependent parts of the response are rebuilt per
+# request. Inputs are rounded to PRECISION (the dashboard slider steps) for
+# the key, so a hit returns the model output of a nearby input.
+PREDICTION_CACHE = {
+    "ENABLED": os.getenv("PREDICTION_CACHE_ENABLED", "False") == "True",
+    "MAX_ENTRIES": int(os.getenv("PREDICTION_CACHE_MAX_ENTRIES", "10000")),
+    "TTL_SECONDS": float(os.getenv("PREDICTION_CACHE_TTL_SECONDS", "3600")),
+    "PRECISION": {
+        "N": 1,
+        "P": 1,
+        "K": 1,
+        "temperature": 0.5,
+        "humidity": 0.5,
+        "ph": 0.1,
+        "rainfall": 1,
+    },
+}
+
+# Opt-in: answer from the nearest earlier prediction of the same model
+# version when every input is within TOLERANCE of it
+PREDICTION_NEIGHBOUR_INDEX = {
+    "ENABLED": os.getenv("PREDICTION_NEIGHBOUR_INDEX_ENABLED", "False") == "True",
+    "CAPACITY": int(os.getenv("PREDICTION_NEIGHBOUR_INDEX_CAPACITY", "50000")),
+    "TOLERANCE": {
+        "N": 2,
+        "P": 2,
+        "K": 2,
+        "temperature": 0.5,
+        "humidity": 1,
+        "ph": 0.1,
+        "rainfall": 3,
+    },
+}
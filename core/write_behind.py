@@ -0,0 +1,308 @@
+"""
+Optional write-behind buffer for request-path logging rows.
+
+Views hand finished model instances to save_later() instead of saving
+them. A background thread writes them with one bulk_create per model,
+flushing when max_batch_size rows are waiting or the oldest has waited
+flush_interval_ms, so concurrent requests stop queueing one by one on
+the database write lock.
+
+The queue is bounded: when it is full, save_later() blocks for up to
+put_timeout_ms and then saves the row itself, slowing callers down
+rather than dropping anything. Pending rows are counted per user;
+flush_user() waits for a user's rows to land, so a history read right
+after a prediction still sees it. Everything left is flushed at
+interpreter exit.
+
+The buffer lives in the worker process, and flush_user() only drains
+that process's queue. Under several worker processes (gunicorn
+--workers > 1) a read served by another worker can miss rows the
+user's previous request left queued for up to flush_interval_ms, so
+read-your-writes holds only for a single process. Keep write-behind
+off unless the site runs one process, or can accept that lag.
+Rows are stamped when they are written, not when they were queued, so
+a late row lands in the period that is current at write time and
+never in one the trends cache has already closed.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+logger = logging.getLogger(__name__)
+
+# Queued to cut the worker's wait short
+_WAKE = object()
+
+
+class WriteBehindBuffer:
+
+    def __init__(self, max_batch_size=500, flush_interval_ms=200.0,
+                 max_queue=10000, put_timeout_ms=1000.0):
+        if max_batch_size < 1 or max_queue < 1:
+            raise ValueError("max_batch_size and max_queue must be at least 1")
+
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_queue = max_queue
+        self.put_timeout = put_timeout_ms / 1000.0
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._written = threading.Condition(self._lock)
+        self._worker = None
+        self._closed = False
+
+        # (model label, user id) -> rows queued but not yet written
+        self._pending = Counter()
+
+        self._batch_sizes = Counter()
+        self._rows = 0
+        self._overflows = 0
+        self._errors = 0
+        self._max_queue_depth = 0
+
+    def save_later(self, instance):
+        """
+        Queues an unsaved model instance for a bulk insert. Saves it
+        synchronously once closed or if the queue stays full.
+        """
+        if self._closed:
+            instance.save()
+            return
+
+        key = self._key(instance)
+        with self._lock:
+            self._pending[key] += 1
+
+        self._ensure_worker()
+        try:
+            self._queue.put(instance, timeout=self.put_timeout)
+        except queue.Full:
+            with self._written:
+                self._overflows += 1
+                self._done([key])
+            instance.save()
+            return
+
+        depth = self._queue.qsize()
+        if depth > self._max_queue_depth:
+            self._max_queue_depth = depth
+
+    def flush_user(self, user_id, timeout=5.0):
+        """
+        Waits until every row queued for user_id is written. Returns
+        False if that took longer than timeout seconds.
+        """
+        with self._written:
+            if not any(uid == user_id for _, uid in self._pending):
+                return True
+
+        self._wake()
+        with self._written:
+            return self._written.wait_for(
+                lambda: not any(uid == user_id for _, uid in self._pending),
+                timeout,
+            )
+
+    def flush(self, timeout=5.0):
+        """Waits until every queued row is written."""
+        self._wake()
+        with self._written:
+            return self._written.wait_for(lambda: not self._pending, timeout)
+
+    def close(self, timeout=10.0):
+        """
+        Stops accepting rows (later ones are saved directly), flushes
+        the queue and stops the worker. Registered with atexit.
+        """
+        self._closed = True
+        worker = self._worker
+        if worker is not None and worker.is_alive():
+            self.flush(timeout)
+            self._queue.put(None)
+            worker.join(timeout)
+
+        # Worker never started or did not finish in time
+        leftovers = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None and item is not _WAKE:
+                leftovers.append(item)
+        if leftovers:
+            self._write(leftovers)
+
+    def stats(self):
+        with self._lock:
+            batches = sum(self._batch_sizes.values())
+            return {
+                "max_batch_size": self.max_batch_size,
+                "flush_interval_ms": self.flush_interval * 1000.0,
+                "max_queue": self.max_queue,
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+                "pending_rows": sum(self._pending.values()),
+                "batches": batches,
+                "rows": self._rows,
+                "overflows": self._overflows,
+                "errors": self._errors,
+                "mean_batch_size": round(self._rows / batches, 2) if batches else 0,
+            }
+
+    @staticmethod
+    def _key(instance):
+        return instance._meta.label, instance.user_id
+
+    def _wake(self):
+        try:
+            self._queue.put_nowait(_WAKE)
+        except queue.Full:
+            # The worker has a full batch to write anyway
+            pass
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run,
+                    name="write-behind",
+                    daemon=True,
+                )
+                self._worker.start()
+
+    def _collect(self):
+        """
+        Up to max_batch_size rows; None once close() asks the worker
+        to stop.
+        """
+        first = self._queue.get()
+        if first is None:
+            return None
+        if first is _WAKE:
+            return []
+
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            if item is _WAKE:
+                break
+            batch.append(item)
+
+        return batch
+
+    def _run(self):
+        try:
+            while True:
+                batch = self._collect()
+                if batch is None:
+                    return
+                if batch:
+                    # As around a request: drop connections past
+                    # CONN_MAX_AGE or left broken by a failed write
+                    close_old_connections()
+                    self._write(batch)
+                    close_old_connections()
+        finally:
+            connection.close()
+
+    def _write(self, batch):
+        by_model = {}
+        for instance in batch:
+            by_model.setdefault(type(instance), []).append(instance)
+
+        for model, instances in by_model.items():
+            try:
+                model.objects.bulk_create(instances)
+            except Exception:
+                logger.exception(
+                    "write-behind bulk insert of %d %s rows failed; "
+                    "saving them one by one", len(instances), model._meta.label,
+                )
+                with self._lock:
+                    self._errors += 1
+                for instance in instances:
+                    try:
+                        instance.save()
+                    except Exception:
+                        logger.exception("write-behind dropped a %s row", model._meta.label)
+
+        with self._written:
+            self._batch_sizes[len(batch)] += 1
+            self._rows += len(batch)
+            self._done([self._key(instance) for instance in batch])
+
+    def _done(self, keys):
+        # Caller holds self._lock
+        for key in keys:
+            self._pending[key] -= 1
+            if self._pending[key] <= 0:
+                del self._pending[key]
+        self._written.notify_all()
+
+
+_buffer = None
+_init_lock = threading.Lock()
+
+
+def get_write_buffer():
+    """
+    Returns the shared WriteBehindBuffer, or None when write-behind is off.
+    """
+    global _buffer
+
+    config = settings.WRITE_BEHIND
+    if not config["ENABLED"]:
+        return None
+
+    if _buffer is None:
+        with _init_lock:
+            if _buffer is None:
+                _buffer = WriteBehindBuffer(
+                    max_batch_size=config["MAX_BATCH_SIZE"],
+                    flush_interval_ms=config["FLUSH_INTERVAL_MS"],
+                    max_queue=config["MAX_QUEUE"],
+                    put_timeout_ms=config["PUT_TIMEOUT_MS"],
+                )
+                atexit.register(_buffer.close)
+    return _buffer
+
+
+def save_later(instance):
+    """Saves instance now, or through the write-behind buffer when it is on."""
+    buffer = get_write_buffer()
+    if buffer is None:
+        instance.save()
+    else:
+        buffer.save_later(instance)
+
+
+def flush_user(user):
+    """
+    Makes the user's buffered rows visible before a read of their
+    history. No-op when write-behind is off.
+    """
+    buffer = get_write_buffer()
+    if buffer is not None and not buffer.flush_user(user.id):
+        logger.warning("write-behind flush for user %s timed out", user.id)
@@ -0,0 +1,118 @@
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-row predictions into one batched call.
+
+    Callers block in submit() while a background thread drains the queue,
+    flushing when max_batch_size rows are waiting or the oldest row has
+    waited max_wait_ms. predict_batch receives a list of rows and must
+    return one result per row, in order.
+    """
+
+    def __init__(self, predict_batch, max_batch_size=32, max_wait_ms=2.0):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+
+        self._batch_sizes = Counter()
+        self._max_queue_depth = 0
+        self._rows = 0
+        self._errors = 0
+
+    def submit(self, row):
+        """Queues one row and waits for its own result."""
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((row, future))
+
+        depth = self._queue.qsize()
+        if depth > self._max_queue_depth:
+            self._max_queue_depth = depth
+
+        return future.result()
+
+    def stats(self):
+        with self._lock:
+            batches = sum(self._batch_sizes.values())
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+                "batches": batches,
+                "rows": self._rows,
+                "errors": self._errors,
+                "mean_batch_size": round(self._rows / batches, 2) if batches else 0,
+                "batch_size_histogram": {
+                    str(size): count
+                    for size, count in sorted(self._batch_sizes.items())
+                },
+            }
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run,
+                    name="ml-microbatcher",
+                    daemon=True,
+                )
+                self._worker.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            rows = [row for row, _ in batch]
+
+            try:
+                results = list(self.predict_batch(rows))
+                if len(results) != len(rows):
+                    # Rows and results can no longer be paired; fail them all
+                    raise RuntimeError(
+                        f"predict_batch returned {len(results)} results "
+                        f"for {len(rows)} rows"
+                    )
+            except Exception as exc:
+                with self._lock:
+                    self._errors += 1
+                for _, future in batch:
+                    future.set_exception(exc)
+                continue
+
+            with self._lock:
+                self._batch_sizes[len(batch)] += 1
+                self._rows += len(batch)
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
@@ -0,0 +1,93 @@
+"""
+Uncompressed on-disk form of a CompiledForest.
+
+Each tree array is written as its own raw .npy file next to a small
+manifest.json, so load_bundle() can memory-map them read-only. Every
+gunicorn worker that maps the same files shares one page-cache copy
+instead of holding a private unpickled forest.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from .compiled import CompiledForest
+
+MANIFEST = "manifest.json"
+FORMAT_VERSION = 1
+
+ARRAYS = (
+    "feature",
+    "threshold",
+    "children_left",
+    "children_right",
+    "value",
+    "roots",
+)
+
+
+def bundle_exists(path):
+    return os.path.isfile(os.path.join(path, MANIFEST))
+
+
+def export_bundle(forest, features, path, source=None):
+    """
+    Writes a CompiledForest and its feature order to `path`.
+    """
+    os.makedirs(path, exist_ok=True)
+
+    for name in ARRAYS:
+        np.save(
+            os.path.join(path, f"{name}.npy"),
+            np.ascontiguousarray(getattr(forest, name)),
+            allow_pickle=False,
+        )
+
+    manifest = {
+        "format": FORMAT_VERSION,
+        "source": source,
+        "features": list(features),
+        "classes": [str(c) for c in forest.classes_],
+        "feature_importances": [float(v) for v in forest.feature_importances_],
+        "max_depth": forest.max_depth,
+        "n_trees": forest.n_trees,
+        "arrays": list(ARRAYS),
+    }
+
+    # Written last: a bundle without a manifest is ignored by the loader
+    with open(os.path.join(path, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+
+def load_bundle(path, mmap=True):
+    """
+    Returns (CompiledForest, features) for a bundle written by export_bundle.
+    """
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+
+    if manifest.get("format") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported model bundle format: {manifest.get('format')}")
+
+    # np.asarray drops the memmap subclass (and its per-index overhead)
+    # while still sharing the mapped pages
+    arrays = {
+        name: np.asarray(np.load(
+            os.path.join(path, f"{name}.npy"),
+            mmap_mode="r" if mmap else None,
+            allow_pickle=False,
+        ))
+        for name in ARRAYS
+    }
+
+    forest = CompiledForest(
+        max_depth=manifest["max_depth"],
+        classes=np.array(manifest["classes"], dtype=object),
+        feature_importances=np.array(manifest["feature_importances"]),
+        **arrays,
+    )
+
+    return forest, manifest["features"]
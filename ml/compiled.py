@@ -0,0 +1,251 @@
+import numpy as np
+
+
+class CompiledForest:
+    """
+    A random forest flattened into contiguous NumPy arrays.
+
+    Every tree's nodes live in the same feature/threshold/children arrays,
+    addressed by global node index; roots[t] is the first node of tree t.
+    Leaves point at themselves. All (row, tree) paths are pushed down one
+    level at a time with vectorized gathers, dropping each path from the
+    working set as soon as it reaches a leaf.
+
+    Exposes the parts of the scikit-learn classifier interface that
+    ml.predictor relies on (classes_, feature_importances_,
+    predict_proba) and reproduces its probabilities exactly.
+    """
+
+    # rows evaluated at once; bounds the per-level index temporaries
+    CHUNK_ROWS = 1024
+
+    def __init__(self, feature, threshold, children_left, children_right,
+                 value, roots, max_depth, classes, feature_importances):
+        self.feature = feature
+        self.threshold = threshold
+        self.children_left = children_left
+        self.children_right = children_right
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.classes_ = classes
+        self.feature_importances_ = feature_importances
+        self.n_features_in_ = len(feature_importances)
+        self.is_leaf = children_left == np.arange(len(children_left))
+
+    @classmethod
+    def from_sklearn(cls, forest):
+        """
+        Builds the arrays from a fitted single-output
+        RandomForestClassifier / ExtraTreesClassifier.
+        """
+        if getattr(forest, "n_outputs_", 1) != 1:
+            raise ValueError("Only single-output forests can be compiled")
+
+        trees = [estimator.tree_ for estimator in forest.estimators_]
+
+        sizes = np.array([tree.node_count for tree in trees])
+        offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+
+        feature = []
+        threshold = []
+        children_left = []
+        children_right = []
+        value = []
+
+        for tree, offset in zip(trees, offsets):
+            nodes = np.arange(tree.node_count)
+            is_leaf = tree.children_left == -1
+
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(np.where(is_leaf, np.inf, tree.threshold))
+            children_left.append(
+                np.where(is_leaf, nodes, tree.children_left) + offset
+            )
+            children_right.append(
+                np.where(is_leaf, nodes, tree.children_right) + offset
+            )
+
+            # Same normalisation as DecisionTreeClassifier.predict_proba
+            tree_value = tree.value[:, 0, :]
+            normalizer = tree_value.sum(axis=1, keepdims=True)
+            normalizer[normalizer == 0.0] = 1.0
+            value.append(tree_value / normalizer)
+
+        return cls(
+            feature=np.concatenate(feature).astype(np.intp),
+            threshold=np.concatenate(threshold).astype(np.float64),
+            children_left=np.concatenate(children_left).astype(np.intp),
+            children_right=np.concatenate(children_right).astype(np.intp),
+            value=np.concatenate(value).astype(np.float64),
+            roots=offsets.astype(np.intp),
+            max_depth=max(tree.max_depth for tree in trees),
+            classes=np.asarray(forest.classes_),
+            feature_importances=np.asarray(forest.feature_importances_),
+        )
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def apply(self, X, roots=None):
+        """
+        Returns the leaf reached by every row in every tree,
+        as an (n_rows, n_trees) array of global node indices.
+        """
+        roots = self.roots if roots is None else roots
+        n_rows, n_trees = X.shape[0], len(roots)
+
+        nodes = np.tile(roots, n_rows)
+        offsets = np.repeat(np.arange(n_rows) * X.shape[1], n_trees)
+        flat_X = X.ravel()
+
+        active = np.flatnonzero(~self.is_leaf[nodes])
+        while active.size:
+            current = nodes[active]
+            values = flat_X[offsets[active] + self.feature[current]]
+            current = np.where(
+                values <= self.threshold[current],
+                self.children_left[current],
+                self.children_right[current],
+            )
+            nodes[active] = current
+            active = active[~self.is_leaf[current]]
+
+        return nodes.reshape(n_rows, n_trees)
+
+    def predict_proba(self, X):
+        X = self._validate(X)
+        proba = np.empty((X.shape[0], len(self.classes_)))
+
+        for start in range(0, X.shape[0], self.CHUNK_ROWS):
+            chunk = X[start:start + self.CHUNK_ROWS]
+            proba[start:start + len(chunk)] = self._sum_leaves(self.apply(chunk))
+
+        proba /= self.n_trees
+        return proba
+
+    def predict_proba_anytime(self, X, chunk_trees=10):
+        """
+        Evaluates trees in chunks and stops for each row once its top
+        class can no longer change: every remaining tree adds at most 1
+        to any class total, so a lead larger than the number of trees
+        left is final. The first chunk is just over half the forest,
+        the earliest point at which that can happen.
+
+        Returns (proba, trees_evaluated). proba averages the evaluated
+        trees only; the top class always matches full evaluation.
+
+        Not used for serving: on this model rows still need most of the
+        forest, which `manage.py benchmark anytime` reports.
+        """
+        X = self._validate(X)
+        n_rows, n_trees = X.shape[0], self.n_trees
+
+        totals = np.zeros((n_rows, len(self.classes_)))
+        evaluated = np.zeros(n_rows, dtype=np.intp)
+        pending = np.arange(n_rows)
+
+        start = 0
+        size = n_trees // 2 + 1
+        while pending.size and start < n_trees:
+            roots = self.roots[start:start + size]
+            totals[pending] += self._sum_leaves(self.apply(X[pending], roots))
+
+            start += len(roots)
+            evaluated[pending] = start
+
+            if len(self.classes_) > 1:
+                ranked = np.partition(totals[pending], -2, axis=1)
+                lead = ranked[:, -1] - ranked[:, -2]
+                # small slack for rounding in the running sums
+                pending = pending[lead <= (n_trees - start) + 1e-9]
+            else:
+                pending = pending[:0]
+
+            size = chunk_trees
+
+        return totals / evaluated[:, None], evaluated
+
+    def feature_contributions(self, X, class_index):
+        """
+        Per-row local feature contributions to one class (Saabas).
+
+        Along each tree's decision path, the change in the node's class
+        probability from parent to child is credited to the parent's
+        split feature; averaged over trees. For every row,
+        bias + contributions.sum() equals its predicted probability of
+        class_index[row].
+
+        Returns (bias, contributions) with shapes (n_rows,) and
+        (n_rows, n_features).
+        """
+        X = self._validate(X)
+        class_index = np.asarray(class_index, dtype=np.intp)
+        n_rows, n_features = X.shape
+        n_trees = self.n_trees
+
+        nodes = np.tile(self.roots, n_rows)
+        rows = np.repeat(np.arange(n_rows), n_trees)
+        offsets = rows * n_features
+        classes = class_index[rows]
+        flat_X = X.ravel()
+
+        bias = self.value[self.roots][:, class_index].mean(axis=0)
+        totals = np.zeros(n_rows * n_features)
+
+        active = np.flatnonzero(~self.is_leaf[nodes])
+        while active.size:
+            current = nodes[active]
+            split = self.feature[current]
+            values = flat_X[offsets[active] + split]
+            child = np.where(
+                values <= self.threshold[current],
+                self.children_left[current],
+                self.children_right[current],
+            )
+
+            cls = classes[active]
+            totals += np.bincount(
+                offsets[active] + split,
+                weights=self.value[child, cls] - self.value[current, cls],
+                minlength=totals.size,
+            )
+
+            nodes[active] = child
+            active = active[~self.is_leaf[child]]
+
+        return bias, totals.reshape(n_rows, n_features) / n_trees
+
+    def _sum_leaves(self, leaves):
+        # Trees are added in order, matching the forest's running sum
+        # bit for bit. Few rows: one gather; many rows: one tree at a time
+        # keeps the temporaries small.
+        if leaves.shape[0] < leaves.shape[1]:
+            return self.value[leaves].sum(axis=1)
+
+        total = np.zeros((leaves.shape[0], self.value.shape[1]))
+        for tree_leaves in np.ascontiguousarray(leaves.T):
+            total += self.value[tree_leaves]
+        return total
+
+    def _validate(self, X):
+        # Trees compare float32 inputs against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(
+                f"Expected input of shape (n, {self.n_features_in_}), "
+                f"got {X.shape}"
+            )
+        return X
+
+
+def compile_model(model):
+    """
+    Returns a CompiledForest for tree ensembles, or None if the model
+    cannot be flattened (callers then fall back to the model itself).
+    """
+    try:
+        return CompiledForest.from_sklearn(model)
+    except (AttributeError, ValueError):
+        return None
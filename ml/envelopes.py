@@ -0,0 +1,341 @@
+"""
+Per-crop requirement envelopes: the range of every feature over which
+the model recommends each crop.
+
+There is no training data in the repository, so envelopes are found by
+probing the model. Every tree leaf that votes for a crop bounds a box of
+the feature space; points drawn inside those boxes are scored by the
+whole forest, and the crop's envelope spans, per feature, the central
+quantiles of the points it wins with a majority of the trees. (The plain
+bounding box reaches the edge of most feature ranges: a few confident
+points always land far from where the crop is usually recommended.)
+
+Queries never touch the model. For each feature the envelope endpoints
+split the axis into segments, each holding a bitmask of the crops whose
+interval covers it; the crops feasible for a sample are the AND of its
+seven segment masks.
+
+A crop the model never recommends confidently has no envelope: it is
+never feasible, and its bounds are reported as None.
+"""
+
+import bisect
+import os
+
+import numpy as np
+
+from .predictor import FEATURE_RANGES, registry
+
+ENVELOPE_FILE = "crop_envelopes.npz"
+
+DEFAULT_SAMPLES_PER_LEAF = 16
+
+# A probe counts for a crop only when the crop wins with at least this
+# probability; the forest still picks some winner far outside the data.
+DEFAULT_MIN_CONFIDENCE = 0.5
+
+# Envelope bounds: these quantiles of a crop's confident probes, per feature
+DEFAULT_QUANTILES = (0.01, 0.99)
+
+# Rows scored per predict_proba call while probing
+PROBE_CHUNK_ROWS = 65536
+
+
+def leaf_boxes(forest, low, high):
+    """
+    (box_low, box_high), each (n_nodes, n_features): the region of
+    [low, high] that reaches every node. Right children hold
+    x > threshold; the box keeps the threshold as a closed bound.
+    """
+    n_nodes = len(forest.feature)
+    box_low = np.tile(np.asarray(low, dtype=np.float64), (n_nodes, 1))
+    box_high = np.tile(np.asarray(high, dtype=np.float64), (n_nodes, 1))
+
+    frontier = forest.roots[~forest.is_leaf[forest.roots]]
+    while frontier.size:
+        split = forest.feature[frontier]
+        threshold = forest.threshold[frontier]
+        left = forest.children_left[frontier]
+        right = forest.children_right[frontier]
+
+        for child in (left, right):
+            box_low[child] = box_low[frontier]
+            box_high[child] = box_high[frontier]
+
+        box_high[left, split] = np.minimum(box_high[frontier, split], threshold)
+        box_low[right, split] = np.maximum(box_low[frontier, split], threshold)
+
+        children = np.concatenate([left, right])
+        frontier = children[~forest.is_leaf[children]]
+
+    return box_low, box_high
+
+
+def _bounds(rows, n_features, fill):
+    # Crops without an envelope come as None rows from snapshots
+    return np.array(
+        [[fill] * n_features if row is None else row for row in rows],
+        dtype=np.float64,
+    ).reshape(len(rows), n_features)
+
+
+def _segment_masks(low, high):
+    # Segment k covers [edges[k - 1], edges[k]); a crop's closed interval
+    # [lo, hi] contributes the edges lo and nextafter(hi). Crops without
+    # an envelope (low=inf, high=-inf) cover no segment.
+    finite = np.isfinite(low) & np.isfinite(high)
+    edges = np.unique(np.concatenate([
+        low[finite], np.nextafter(high[finite], np.inf)
+    ]))
+
+    masks = [0]
+    for start in edges:
+        inside = np.flatnonzero((low <= start) & (start <= high))
+        masks.append(sum(1 << int(c) for c in inside))
+
+    return edges, masks
+
+
+class CropEnvelopes:
+
+    def __init__(self, model_version, features, classes, low, high):
+        self.model_version = model_version
+        self.features = list(features)
+        self.classes = np.asarray(classes, dtype=object)
+        self.low = _bounds(low, len(self.features), np.inf)
+        self.high = _bounds(high, len(self.features), -np.inf)
+
+        if len(self.classes) > 64:
+            raise ValueError("Too many classes for 64-bit crop masks")
+
+        self.class_index = {str(crop): i for i, crop in enumerate(self.classes)}
+        self.has_envelope = (self.low <= self.high).all(axis=1)
+
+        self.edges = []
+        self.masks = []
+        for j in range(len(self.features)):
+            edges, masks = _segment_masks(self.low[:, j], self.high[:, j])
+            self.edges.append(edges)
+            self.masks.append(np.array(masks, dtype=np.uint64))
+
+        self._edge_lists = [edges.tolist() for edges in self.edges]
+        self._mask_lists = [masks.tolist() for masks in self.masks]
+
+    @classmethod
+    def build(cls, version, samples_per_leaf=DEFAULT_SAMPLES_PER_LEAF,
+              min_confidence=DEFAULT_MIN_CONFIDENCE, quantiles=DEFAULT_QUANTILES,
+              ranges=None, seed=0):
+        """
+        Probes `version` inside the leaf boxes voting for each crop,
+        clipped to `ranges`. A crop's envelope spans the `quantiles` of
+        the points the forest assigns to it with at least
+        min_confidence, feature by feature.
+        """
+        forest = version.compiled
+        if forest is None:
+            raise ValueError("Building envelopes needs the compiled forest")
+
+        ranges = ranges or FEATURE_RANGES
+        range_low = [ranges[feature][0] for feature in version.features]
+        range_high = [ranges[feature][1] for feature in version.features]
+
+        box_low, box_high = leaf_boxes(forest, range_low, range_high)
+
+        leaves = np.flatnonzero(forest.is_leaf)
+        leaves = leaves[(box_low[leaves] <= box_high[leaves]).all(axis=1)]
+        votes = forest.value[leaves].argmax(axis=1)
+
+        rng = np.random.default_rng(seed)
+        n_classes, n_features = len(version.classes), len(version.features)
+
+        low = np.full((n_classes, n_features), np.inf)
+        high = np.full((n_classes, n_features), -np.inf)
+        points = [[] for _ in range(n_classes)]
+
+        estimator = version.estimator_for(PROBE_CHUNK_ROWS)
+        leaves_per_chunk = max(1, PROBE_CHUNK_ROWS // samples_per_leaf)
+
+        for start in range(0, len(leaves), leaves_per_chunk):
+            chunk = leaves[start:start + leaves_per_chunk]
+            origin = np.repeat(chunk, samples_per_leaf)
+            expected = np.repeat(votes[start:start + len(chunk)], samples_per_leaf)
+
+            X = rng.uniform(box_low[origin], box_high[origin])
+            # Score what the model sees, so envelopes hold exact inputs
+            X = X.astype(np.float32).astype(np.float64)
+
+            proba = estimator.predict_proba(X)
+            won = (
+                (proba.argmax(axis=1) == expected)
+                & (proba[np.arange(len(X)), expected] >= min_confidence)
+            )
+            for c in np.unique(expected[won]):
+                points[c].append(X[won & (expected == c)])
+
+        for c, chunks in enumerate(points):
+            if chunks:
+                # inverted_cdf picks probe values, which the model saw exactly
+                low[c], high[c] = np.quantile(
+                    np.concatenate(chunks), quantiles, axis=0, method="inverted_cdf"
+                )
+
+        return cls(
+            model_version=version.name,
+            features=version.features,
+            classes=version.classes,
+            low=low,
+            high=high,
+        )
+
+    def save(self, path):
+        np.savez(
+            path,
+            model_version=np.array(self.model_version),
+            features=np.array(self.features),
+            classes=np.array([str(c) for c in self.classes]),
+            low=self.low,
+            high=self.high,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                model_version=str(data["model_version"]),
+                features=[str(f) for f in data["features"]],
+                classes=[str(c) for c in data["classes"]],
+                low=data["low"],
+                high=data["high"],
+            )
+
+    def snapshot(self):
+        """
+        A JSON-serializable copy; from_snapshot() rebuilds the index.
+        Crops without an envelope have None instead of bounds.
+        """
+        return {
+            "model_version": self.model_version,
+            "features": self.features,
+            "classes": [str(c) for c in self.classes],
+            "low": [
+                row if present else None
+                for row, present in zip(self.low.tolist(), self.has_envelope)
+            ],
+            "high": [
+                row if present else None
+                for row, present in zip(self.high.tolist(), self.has_envelope)
+            ],
+        }
+
+    @classmethod
+    def from_snapshot(cls, data):
+        return cls(**data)
+
+    def envelope_row(self, crop):
+        """crop's row in low/high, or None if it has no envelope."""
+        i = self.class_index.get(str(crop))
+        if i is None or not self.has_envelope[i]:
+            return None
+        return i
+
+    def envelope(self, crop):
+        """
+        {feature: (low, high)} for crop, or None for an unknown crop or
+        one without an envelope.
+        """
+        i = self.envelope_row(crop)
+        if i is None:
+            return None
+        return {
+            feature: (float(self.low[i, j]), float(self.high[i, j]))
+            for j, feature in enumerate(self.features)
+        }
+
+    def feasible_mask(self, input_data):
+        mask = (1 << len(self.classes)) - 1
+        for feature, edges, masks in zip(self.features, self._edge_lists, self._mask_lists):
+            mask &= masks[bisect.bisect_right(edges, float(input_data[feature]))]
+            if not mask:
+                break
+        return mask
+
+    def feasible_masks(self, X):
+        """
+        feasible_mask for every row of X (columns in self.features order),
+        as a uint64 array.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        mask = np.full(len(X), (1 << len(self.classes)) - 1, dtype=np.uint64)
+        for j, (edges, masks) in enumerate(zip(self.edges, self.masks)):
+            mask &= masks[np.searchsorted(edges, X[:, j], side="right")]
+        return mask
+
+    def crops_in(self, mask):
+        return [str(crop) for i, crop in enumerate(self.classes) if mask >> i & 1]
+
+    def feasible(self, input_data):
+        """Crops whose envelope contains input_data on every feature."""
+        return self.crops_in(self.feasible_mask(input_data))
+
+    def violations(self, input_data, crop):
+        """
+        Features of input_data outside crop's envelope, as
+        {"feature", "value", "low", "high"} dicts. A crop without an
+        envelope fails every feature, with low and high None.
+        """
+        i = self.class_index[str(crop)]
+        present = bool(self.has_envelope[i])
+        violations = []
+        for j, feature in enumerate(self.features):
+            value = input_data[feature]
+            if not self.low[i, j] <= value <= self.high[i, j]:
+                violations.append({
+                    "feature": feature,
+                    "value": value,
+                    "low": float(self.low[i, j]) if present else None,
+                    "high": float(self.high[i, j]) if present else None,
+                })
+        return violations
+
+
+_envelopes = {}
+
+
+def envelope_path(version):
+    return os.path.join(version.path, ENVELOPE_FILE)
+
+
+def _load(name, directory):
+    envelopes = _envelopes.get(name)
+    if envelopes is None:
+        path = os.path.join(directory, ENVELOPE_FILE)
+        if not os.path.isfile(path):
+            return None
+
+        envelopes = CropEnvelopes.load(path)
+        if envelopes.model_version != name:
+            return None
+        _envelopes[name] = envelopes
+    return envelopes
+
+
+def get_envelopes(version):
+    """
+    The envelope index built for `version`, or None if there is none.
+    """
+    return _load(version.name, version.path)
+
+
+def envelopes_for(model_version):
+    """
+    get_envelopes by version name, for code holding only the name.
+    Reads the version's directory without loading its model; None for
+    unknown versions.
+    """
+    if model_version in _envelopes:
+        return _envelopes[model_version]
+    try:
+        directory = registry.path_for(model_version)
+    except LookupError:
+        return None
+    return _load(model_version, directory)
@@ -0,0 +1,314 @@
+"""
+Precomputed top-crop answers over a quantized grid of the feature space.
+
+The grid evaluates the model once, offline, at every combination of
+evenly spaced points per feature and keeps only the winning class
+(uint8) and its probability (float16). What-if sweeps then become array
+slices: vary one feature for a curve, two for a heatmap, with every
+other feature snapped to its nearest grid point.
+
+Snapping moves the held features by up to half a bin, which is often
+enough to change the top crop. build() therefore measures how often a
+sweep from the grid agrees with the model at the unsnapped input and
+stores the rate with the grid; what_if() only answers from grids that
+reach the caller's min_agreement.
+"""
+
+import os
+import time
+
+import numpy as np
+
+from .predictor import FEATURE_RANGES, registry
+from .sensitivity import sweep_matrix
+
+GRID_FILE = "lookup_grid.npz"
+
+DEFAULT_BINS = 8
+
+# Rows scored per predict_proba call while building
+BUILD_CHUNK_ROWS = 65536
+
+# Random inputs whose one-feature sweeps measure the grid's agreement
+AGREEMENT_SAMPLES = 500
+
+
+class LookupGrid:
+
+    def __init__(self, model_version, features, axes, top_class, confidence, classes,
+                 agreement=None):
+        self.model_version = model_version
+        self.features = list(features)
+        self.axes = [np.asarray(axis, dtype=float) for axis in axes]
+        self.top_class = top_class
+        self.confidence = confidence
+        self.classes = np.asarray(classes, dtype=object)
+        # Share of sweep points matching the model; None if never measured
+        self.agreement = agreement
+
+    @classmethod
+    def build(cls, version, bins=DEFAULT_BINS, ranges=None,
+              agreement_samples=AGREEMENT_SAMPLES, seed=0):
+        """
+        Evaluates `version` at every grid point, then measures the
+        grid's agreement with it. `bins` is either one count for all
+        features or a {feature: count} mapping.
+        """
+        ranges = ranges or FEATURE_RANGES
+
+        axes = []
+        for feature in version.features:
+            count = bins.get(feature, DEFAULT_BINS) if isinstance(bins, dict) else bins
+            if count < 2:
+                raise ValueError(f"{feature} needs at least 2 bins")
+            low, high = ranges[feature]
+            axes.append(np.linspace(low, high, count))
+
+        if len(version.classes) > 256:
+            raise ValueError("Too many classes to store as uint8")
+
+        shape = tuple(len(axis) for axis in axes)
+        size = int(np.prod(shape))
+
+        top_class = np.empty(size, dtype=np.uint8)
+        confidence = np.empty(size, dtype=np.float16)
+
+        estimator = version.estimator_for(BUILD_CHUNK_ROWS)
+
+        for start in range(0, size, BUILD_CHUNK_ROWS):
+            flat = np.arange(start, min(start + BUILD_CHUNK_ROWS, size))
+            coords = np.unravel_index(flat, shape)
+            X = np.column_stack([axis[c] for axis, c in zip(axes, coords)])
+
+            proba = estimator.predict_proba(X)
+            winners = proba.argmax(axis=1)
+            top_class[flat] = winners
+            confidence[flat] = proba[np.arange(len(flat)), winners]
+
+        grid = cls(
+            model_version=version.name,
+            features=version.features,
+            axes=axes,
+            top_class=top_class.reshape(shape),
+            confidence=confidence.reshape(shape),
+            classes=version.classes,
+        )
+        grid.agreement = grid.measure_agreement(version, agreement_samples, seed)
+        return grid
+
+    def measure_agreement(self, version, samples=AGREEMENT_SAMPLES, seed=0):
+        """
+        Share of points on one-feature sweeps where the grid's top crop
+        matches the model's, over `samples` random inputs inside the
+        grid and every feature. The model sees the inputs as given; the
+        grid holds them at their nearest grid points, as sweep() does.
+        """
+        if list(version.features) != self.features:
+            raise ValueError("Grid and model features differ")
+
+        rng = np.random.default_rng(seed)
+        points = rng.uniform(
+            [axis[0] for axis in self.axes],
+            [axis[-1] for axis in self.axes],
+            size=(samples, len(self.axes)),
+        )
+        positions = np.column_stack([
+            np.abs(axis[None, :] - points[:, [dim]]).argmin(axis=1)
+            for dim, axis in enumerate(self.axes)
+        ])
+
+        matches = total = 0
+        for dim, axis in enumerate(self.axes):
+            steps = np.tile(np.arange(len(axis)), samples)
+
+            cells = np.repeat(positions, len(axis), axis=0)
+            cells[:, dim] = steps
+            grid_top = self.top_class[tuple(cells.T)]
+
+            X = np.repeat(points, len(axis), axis=0)
+            X[:, dim] = axis[steps]
+            model_top = version.estimator_for(len(X)).predict_proba(X).argmax(axis=1)
+
+            matches += int((grid_top == model_top).sum())
+            total += len(X)
+
+        return matches / total
+
+    def save(self, path):
+        np.savez(
+            path,
+            model_version=np.array(self.model_version),
+            features=np.array(self.features),
+            classes=np.array([str(c) for c in self.classes]),
+            top_class=self.top_class,
+            confidence=self.confidence,
+            agreement=np.array(np.nan if self.agreement is None else self.agreement),
+            **{f"axis_{i}": axis for i, axis in enumerate(self.axes)},
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            features = [str(f) for f in data["features"]]
+            # Grids saved before agreement was measured have none
+            agreement = float(data["agreement"]) if "agreement" in data.files else np.nan
+            return cls(
+                model_version=str(data["model_version"]),
+                features=features,
+                axes=[data[f"axis_{i}"] for i in range(len(features))],
+                top_class=data["top_class"],
+                confidence=data["confidence"],
+                classes=[str(c) for c in data["classes"]],
+                agreement=None if np.isnan(agreement) else agreement,
+            )
+
+    @property
+    def nbytes(self):
+        return (
+            self.top_class.nbytes
+            + self.confidence.nbytes
+            + sum(axis.nbytes for axis in self.axes)
+        )
+
+    def covers(self, input_data):
+        """True if every feature lies inside the grid's range."""
+        return all(
+            axis[0] <= input_data[feature] <= axis[-1]
+            for feature, axis in zip(self.features, self.axes)
+        )
+
+    def _snap(self, input_data):
+        return [
+            int(np.abs(axis - input_data[feature]).argmin())
+            for feature, axis in zip(self.features, self.axes)
+        ]
+
+    def snapped(self, input_data):
+        """input_data moved to its nearest grid point, by feature."""
+        return {
+            feature: float(axis[position])
+            for feature, axis, position in zip(
+                self.features, self.axes, self._snap(input_data)
+            )
+        }
+
+    def sweep(self, input_data, vary):
+        """
+        Slices the grid along the features in `vary` (one or two),
+        holding the rest at the grid points nearest input_data.
+        Returns (axes, class_indices, confidences).
+        """
+        position = self._snap(input_data)
+        dims = [self.features.index(feature) for feature in vary]
+
+        index = tuple(
+            slice(None) if dim in dims else position[dim]
+            for dim in range(len(self.features))
+        )
+        top_class = self.top_class[index]
+        confidence = self.confidence[index]
+
+        # Slicing keeps the grid's axis order; callers expect `vary` order
+        if len(dims) == 2 and dims[0] > dims[1]:
+            top_class = top_class.T
+            confidence = confidence.T
+
+        return [self.axes[dim] for dim in dims], top_class, confidence.astype(float)
+
+
+def exact_sweep(version, input_data, vary, axes):
+    """
+    Scores the same sweep as LookupGrid.sweep with the model itself.
+    """
+    X, shape = sweep_matrix(version, input_data, vary, axes)
+
+    proba = version.estimator_for(len(X)).predict_proba(X)
+    winners = proba.argmax(axis=1)
+    confidence = proba[np.arange(len(X)), winners]
+
+    return winners.reshape(shape), confidence.reshape(shape)
+
+
+_grids = {}
+
+
+def grid_path(version):
+    return os.path.join(version.path, GRID_FILE)
+
+
+def get_grid(version):
+    """
+    The lookup grid built for `version`, or None if there is none.
+    """
+    grid = _grids.get(version.name)
+    if grid is None:
+        path = grid_path(version)
+        if not os.path.isfile(path):
+            return None
+
+        grid = LookupGrid.load(path)
+        if grid.model_version != version.name:
+            return None
+        _grids[version.name] = grid
+    return grid
+
+
+def what_if(input_data, vary, points=None, exact=False, version=None,
+            min_agreement=1.0):
+    """
+    Answers a one- or two-feature what-if sweep around input_data.
+
+    Uses the precomputed grid when one exists for the model version,
+    its measured agreement is at least min_agreement and input_data
+    lies inside it; otherwise (or with exact=True) evaluates the sweep
+    with the model. `points` sets the sweep resolution for model
+    evaluation and defaults to the grid's.
+
+    "snapped_inputs" holds the values the grid used for the features
+    not varied, or None when the model answered at input_data itself.
+    """
+    version = version or registry.current()
+    grid = get_grid(version)
+
+    start = time.perf_counter()
+
+    use_grid = (
+        grid is not None
+        and not exact
+        and grid.agreement is not None
+        and grid.agreement >= min_agreement
+        and grid.covers(input_data)
+    )
+
+    snapped_inputs = None
+    if use_grid:
+        axes, top_class, confidence = grid.sweep(input_data, vary)
+        snapped_inputs = {
+            feature: value
+            for feature, value in grid.snapped(input_data).items()
+            if feature not in vary
+        }
+        source = "grid"
+    else:
+        axes = []
+        for feature in vary:
+            if grid is not None and points is None:
+                axes.append(grid.axes[grid.features.index(feature)])
+            else:
+                low, high = FEATURE_RANGES[feature]
+                axes.append(np.linspace(low, high, points or 50))
+        top_class, confidence = exact_sweep(version, input_data, vary, axes)
+        source = "model"
+
+    return {
+        "model_version": version.name,
+        "source": source,
+        "features": list(vary),
+        "axes": axes,
+        "classes": version.classes,
+        "top_class": top_class,
+        "confidence": confidence,
+        "snapped_inputs": snapped_inputs,
+        "grid_agreement": grid.agreement if grid is not None else None,
+        "elapsed_ms": (time.perf_counter() - start) * 1000,
+    }
@@ -1,57 +1,153 @@
-import joblib
 import numpy as np
 import os
 
+from .registry import FEATURE_NAME_MAP, ModelRegistry
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-model = joblib.load(os.path.join(BASE_DIR, "crop_model.pkl"))
-features = joblib.load(os.path.join(BASE_DIR, "features.pkl"))
-
-FEATURE_NAME_MAP = {
-    "N": "Nitrogen",
-    "P": "Phosphorus",
-    "K": "Potassium",
-    "temperature": "Temperature",
-    "humidity": "Humidity",
-    "ph": "Soil pH",
-    "rainfall": "Rainfall"
+MODEL_PATH = os.path.join(BASE_DIR, "crop_model.pkl")
+FEATURES_PATH = os.path.join(BASE_DIR, "features.pkl")
+
+# Written by `manage.py export_model_bundle`; memory-mapped when present
+BUNDLE_DIR = os.path.join(BASE_DIR, "crop_model_bundle")
+
+# Versioned models; the files above are served as "base" until one is added
+MODEL_REGISTRY_DIR = os.getenv(
+    "ML_MODEL_REGISTRY_DIR", os.path.join(BASE_DIR, "models")
+)
+
+registry = ModelRegistry(
+    MODEL_REGISTRY_DIR,
+    fallback_path=BASE_DIR,
+    poll_interval=float(os.getenv("ML_MODEL_POLL_SECONDS", "5")),
+)
+
+TOP_K = 3
+
+# Span of the crop recommendation training data for each feature
+FEATURE_RANGES = {
+    "N": (0, 140),
+    "P": (5, 145),
+    "K": (5, 205),
+    "temperature": (8, 44),
+    "humidity": (14, 100),
+    "ph": (3.5, 10),
+    "rainfall": (20, 300),
 }
 
-def predict_crop(input_data):
+
+def current_version():
+    return registry.current()
+
+
+def build_input_matrix(input_rows, features):
     """
-    input_data: dict with keys
-    N, P, K, temperature, humidity, ph, rainfall
+    Stacks input dicts into an (N, len(features)) matrix
+    in the feature order the model was trained on.
     """
+    return np.array(
+        [[row[feature] for feature in features] for row in input_rows],
+        dtype=float
+    ).reshape(len(input_rows), len(features))
 
-    input_list = [input_data[feature] for feature in features]
-    input_array = np.array(input_list).reshape(1, -1)
 
-    probabilities = model.predict_proba(input_array)[0]
-    classes = model.classes_
+def top_k_indices(probabilities, k=TOP_K):
+    """
+    Returns the indices of the k most probable classes for every row,
+    highest first, without sorting the full probability matrix.
+    """
+    k = min(k, probabilities.shape[1])
+    candidates = np.argpartition(probabilities, -k, axis=1)[:, -k:]
+    order = np.argsort(
+        -np.take_along_axis(probabilities, candidates, axis=1),
+        axis=1,
+        kind="stable"
+    )
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def predict_proba(input_rows, version=None):
+    """
+    Class probabilities for input_rows as an (N, n_classes) matrix.
+    """
+    version = version or registry.current()
+    input_array = build_input_matrix(input_rows, version.features)
+    return version.estimator_for(len(input_rows)).predict_proba(input_array)
+
 
-    top_3_idx = np.argsort(probabilities)[-3:][::-1]
-    top_3_predictions = [
-        {
-            "crop": classes[i],
-            "confidence": round(float(probabilities[i]), 3)
-        }
-        for i in top_3_idx
+def local_feature_importance(version, input_array, class_index):
+    """
+    Per-row feature contributions to each row's class_index, most
+    supportive first. Falls back to the version's global importances
+    when the model has no compiled forest to trace.
+    """
+    if version.compiled is None:
+        return [version.feature_importance] * len(input_array)
+
+    _, contributions = version.compiled.feature_contributions(input_array, class_index)
+
+    return [
+        sorted(
+            [
+                {
+                    "feature": FEATURE_NAME_MAP.get(feature, feature),
+                    "importance": round(float(value), 3)
+                }
+                for feature, value in zip(version.features, row)
+            ],
+            key=lambda x: x["importance"],
+            reverse=True
+        )
+        for row in contributions
     ]
 
-    importances = model.feature_importances_
-    feature_importance = sorted(
-        [
-            {
-                "feature": FEATURE_NAME_MAP.get(features[i], features[i]),
-                "importance": round(float(importances[i]), 3)
-            }
-            for i in range(len(features))
-        ],
-        key=lambda x: x["importance"],
-        reverse=True
-    )
 
-    return {
-        "top_3_crops": top_3_predictions,
-        "feature_importance": feature_importance
-    }
\ No newline at end of file
+def _format_results(version, input_array, probabilities):
+    classes = version.classes
+    top_idx = top_k_indices(probabilities)
+    feature_importance = local_feature_importance(version, input_array, top_idx[:, 0])
+
+    results = []
+    for row_probabilities, row_top_idx, row_importance in zip(
+        probabilities, top_idx, feature_importance
+    ):
+        results.append({
+            "top_3_crops": [
+                {
+                    "crop": classes[i],
+                    "confidence": round(float(row_probabilities[i]), 3)
+                }
+                for i in row_top_idx
+            ],
+            "feature_importance": row_importance,
+            "model_version": version.name
+        })
+
+    return results
+
+
+def predict_crop_batch(input_rows, version=None):
+    """
+    input_rows: list of dicts with the same keys as predict_crop.
+    Runs a single predict_proba over the whole matrix and returns
+    one predict_crop-shaped result per row.
+    """
+
+    if not input_rows:
+        return []
+
+    version = version or registry.current()
+
+    input_array = build_input_matrix(input_rows, version.features)
+    probabilities = version.estimator_for(len(input_rows)).predict_proba(input_array)
+
+    return _format_results(version, input_array, probabilities)
+
+
+def predict_crop(input_data, version=None):
+    """
+    input_data: dict with keys
+    N, P, K, temperature, humidity, ph, rainfall
+    """
+
+    return predict_crop_batch([input_data], version)[0]
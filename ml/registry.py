@@ -0,0 +1,282 @@
+"""
+Versioned crop models on disk, swapped in without restarting workers.
+
+Layout:
+
+    ml/models/
+        CURRENT             <- name of the version new requests should use
+        2026-03-01/
+            crop_model.pkl, features.pkl   and/or   crop_model_bundle/
+        2026-04-15/
+            ...
+
+Callers take one ModelVersion from ModelRegistry.current() and use it
+for the whole request, so a swap only affects requests that start after
+it. When ml/models/ holds no versions, the model files directly under
+ml/ are served as the "base" version.
+"""
+
+import logging
+import os
+import threading
+import time
+
+import joblib
+
+from .bundle import bundle_exists, load_bundle
+from .compiled import compile_model
+
+logger = logging.getLogger(__name__)
+
+MODEL_FILE = "crop_model.pkl"
+FEATURES_FILE = "features.pkl"
+BUNDLE_DIRNAME = "crop_model_bundle"
+CURRENT_FILE = "CURRENT"
+
+# Above this many rows scikit-learn's own tree traversal is faster
+COMPILED_MAX_ROWS = 256
+
+FEATURE_NAME_MAP = {
+    "N": "Nitrogen",
+    "P": "Phosphorus",
+    "K": "Potassium",
+    "temperature": "Temperature",
+    "humidity": "Humidity",
+    "ph": "Soil pH",
+    "rainfall": "Rainfall"
+}
+
+
+class ModelVersion:
+    """
+    One loaded model plus the metadata derived from it at load time.
+    """
+
+    def __init__(self, name, path, model, features, compiled=None):
+        self.name = name
+        self.path = path
+        self.model = model
+        self.features = list(features)
+        self.compiled = compiled
+        self.loaded_at = time.time()
+
+        source = compiled if compiled is not None else model
+        self.classes = source.classes_
+        self.importances = source.feature_importances_
+        self.feature_importance = sorted(
+            [
+                {
+                    "feature": FEATURE_NAME_MAP.get(feature, feature),
+                    "importance": round(float(self.importances[i]), 3)
+                }
+                for i, feature in enumerate(self.features)
+            ],
+            key=lambda x: x["importance"],
+            reverse=True
+        )
+
+    @classmethod
+    def load(cls, name, path):
+        """
+        Prefers the memory-mapped bundle, falling back to the pickles.
+        """
+        bundle_dir = os.path.join(path, BUNDLE_DIRNAME)
+
+        if bundle_exists(bundle_dir):
+            compiled, features = load_bundle(bundle_dir)
+            return cls(name, path, compiled, features, compiled=compiled)
+
+        model = joblib.load(os.path.join(path, MODEL_FILE))
+        features = joblib.load(os.path.join(path, FEATURES_FILE))
+        return cls(name, path, model, features, compiled=compile_model(model))
+
+    def estimator_for(self, n_rows):
+        """
+        The compiled forest for small inputs, the original model for
+        large batches (identical when only the bundle was loaded).
+        """
+        if self.compiled is not None and n_rows <= COMPILED_MAX_ROWS:
+            return self.compiled
+        return self.model
+
+    def describe(self):
+        return {
+            "name": self.name,
+            "path": self.path,
+            "compiled": self.compiled is not None,
+            "n_classes": len(self.classes),
+            "loaded_at": self.loaded_at,
+        }
+
+
+class ModelRegistry:
+    """
+    Tracks the model versions under `root` and which one is active.
+
+    current() is cheap: at most every `poll_interval` seconds it re-reads
+    the CURRENT pointer, and if it names a different version that version
+    is loaded on a background thread while the old one keeps serving.
+    Once a version is swapped in, the others are dropped from memory;
+    requests still holding one finish with it.
+    """
+
+    def __init__(self, root, fallback_path, fallback_name="base", poll_interval=5.0):
+        self.root = root
+        self.fallback_path = fallback_path
+        self.fallback_name = fallback_name
+        self.poll_interval = poll_interval
+
+        self._lock = threading.Lock()
+        self._loaded = {}
+        self._active = None
+        self._loading = None
+        # Name being loaded, and the one to load after it (latest wins)
+        self._loading_name = None
+        self._queued = None
+        self._pointer = None
+        self._last_poll = 0.0
+
+    # -- discovery -------------------------------------------------------
+
+    def versions(self):
+        """Names of the versions present on disk, oldest first."""
+        if not os.path.isdir(self.root):
+            return []
+
+        return sorted(
+            name for name in os.listdir(self.root)
+            if self._is_version_dir(os.path.join(self.root, name))
+        )
+
+    def path_for(self, name):
+        path = os.path.join(self.root, name)
+        if self._is_version_dir(path):
+            return path
+        if name == self.fallback_name:
+            return self.fallback_path
+        raise LookupError(f"Unknown model version: {name}")
+
+    def _is_version_dir(self, path):
+        return os.path.isdir(path) and (
+            bundle_exists(os.path.join(path, BUNDLE_DIRNAME))
+            or os.path.isfile(os.path.join(path, MODEL_FILE))
+        )
+
+    def _read_pointer(self):
+        try:
+            with open(os.path.join(self.root, CURRENT_FILE)) as f:
+                name = f.read().strip()
+        except OSError:
+            name = ""
+
+        if name:
+            return name
+
+        versions = self.versions()
+        return versions[-1] if versions else self.fallback_name
+
+    # -- loading ---------------------------------------------------------
+
+    def get(self, name):
+        """
+        Returns a loaded version by name, loading it synchronously if needed.
+        """
+        version = self._loaded.get(name)
+        if version is not None:
+            return version
+
+        version = ModelVersion.load(name, self.path_for(name))
+        with self._lock:
+            return self._loaded.setdefault(name, version)
+
+    def current(self):
+        """The version new requests should use."""
+        if self._active is None:
+            with self._lock:
+                if self._active is None:
+                    self._pointer = self._read_pointer()
+                    self._last_poll = time.monotonic()
+            self._active = self.get(self._pointer)
+            return self._active
+
+        if time.monotonic() - self._last_poll >= self.poll_interval:
+            self._poll()
+
+        return self._active
+
+    def activate(self, name, wait=False):
+        """
+        Loads `name` in the background and swaps it in once ready. If
+        another version is loading, `name` is loaded after it, replacing
+        any version already waiting; with wait=True this returns once
+        `name` has been loaded or has failed to.
+        """
+        with self._lock:
+            if self._loading_name is not None:
+                thread = self._loading
+                if name != self._loading_name:
+                    self._queued = name
+            else:
+                thread = threading.Thread(
+                    target=self._load_queue,
+                    args=(name,),
+                    name=f"model-load-{name}",
+                    daemon=True,
+                )
+                self._loading = thread
+                self._loading_name = name
+                thread.start()
+
+        if wait:
+            thread.join()
+
+    def publish(self, name):
+        """
+        Points CURRENT at `name`; every worker picks it up on its next poll.
+        """
+        self.path_for(name)
+        os.makedirs(self.root, exist_ok=True)
+
+        tmp = os.path.join(self.root, f".{CURRENT_FILE}.tmp")
+        with open(tmp, "w") as f:
+            f.write(name + "\n")
+        os.replace(tmp, os.path.join(self.root, CURRENT_FILE))
+
+    def _poll(self):
+        with self._lock:
+            self._last_poll = time.monotonic()
+
+        pointer = self._read_pointer()
+        if pointer != self._active.name:
+            self.activate(pointer)
+
+    def _load_queue(self, name):
+        while name is not None:
+            self._load_and_swap(name)
+            with self._lock:
+                name, self._queued = self._queued, None
+                self._loading_name = name
+
+    def _load_and_swap(self, name):
+        try:
+            version = self.get(name)
+        except Exception:
+            logger.exception("Failed to load model version %s", name)
+            return
+
+        with self._lock:
+            self._pointer = name
+            self._active = version
+            self._loaded = {name: version}
+
+        logger.info("Model version %s is now active", name)
+
+    def stats(self):
+        active = self._active
+        return {
+            "active": active.describe() if active is not None else None,
+            "loaded": sorted(self._loaded),
+            "on_disk": self.versions(),
+            "loading": self._loading_name,
+            "queued": self._queued,
+        }
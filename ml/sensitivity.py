@@ -0,0 +1,79 @@
+"""
+Sensitivity of the recommendation to one or two input features.
+
+The whole sweep is built as a single matrix (the base sample repeated,
+with the swept columns filled from a grid of values) and scored with one
+predict_proba call.
+"""
+
+import numpy as np
+
+from .predictor import build_input_matrix, registry
+
+
+def sweep_matrix(version, input_data, vary, axes):
+    """
+    Returns (X, shape): one row per point of the grid spanned by `axes`,
+    in the feature order of `version`, and the grid's shape.
+    """
+    mesh = np.meshgrid(*axes, indexing="ij")
+
+    X = np.repeat(
+        build_input_matrix([input_data], version.features), mesh[0].size, axis=0
+    )
+    for feature, values in zip(vary, mesh):
+        X[:, version.features.index(feature)] = values.ravel()
+
+    return X, mesh[0].shape
+
+
+def decision_boundaries(top_class):
+    """
+    Points where the top class changes between neighbouring sweep values,
+    as (axis, index, from_class, to_class) with the change lying between
+    index and index + 1 along that axis.
+    """
+    boundaries = []
+
+    for axis in range(top_class.ndim):
+        before = np.take(top_class, np.arange(top_class.shape[axis] - 1), axis=axis)
+        after = np.take(top_class, np.arange(1, top_class.shape[axis]), axis=axis)
+
+        for position in zip(*np.nonzero(before != after)):
+            boundaries.append(
+                (axis, position, int(before[position]), int(after[position]))
+            )
+
+    return boundaries
+
+
+def sensitivity(input_data, ranges, min_probability=0.05, version=None):
+    """
+    ranges: list of one or two (feature, start, stop, steps).
+
+    Returns the sweep axes, the probability surface of every class that
+    reaches min_probability anywhere in the sweep, the top class at each
+    point and the decision boundaries between them.
+    """
+    version = version or registry.current()
+
+    vary = [feature for feature, _, _, _ in ranges]
+    axes = [np.linspace(start, stop, steps) for _, start, stop, steps in ranges]
+
+    X, shape = sweep_matrix(version, input_data, vary, axes)
+    proba = version.estimator_for(len(X)).predict_proba(X)
+
+    top_class = proba.argmax(axis=1).reshape(shape)
+    relevant = np.flatnonzero(proba.max(axis=0) >= min_probability)
+
+    return {
+        "model_version": version.name,
+        "features": vary,
+        "axes": axes,
+        "classes": version.classes,
+        "curves": {
+            int(i): proba[:, i].reshape(shape) for i in relevant
+        },
+        "top_class": top_class,
+        "boundaries": decision_boundaries(top_class),
+    }
@@ -1,68 +1,54 @@
-def analyze_suitability(input_data):
-    """
-    Returns structured suitability breakdown
+from .thresholds import SUITABILITY, classify_rows
+
+
+def analyze_suitability_batch(input_rows, crops=None, envelopes=None):
     """
+    Returns one structured suitability breakdown per row,
+    classifying each feature column in a single pass.
 
-    analysis = {}
+    With `crops` (one per row) and a CropEnvelopes index, every entry
+    also reports the crop's envelope for that feature and whether the
+    value lies inside it.
+    """
+    outcomes = classify_rows([table for _, _, table in SUITABILITY], input_rows)
 
-    # Rainfall
-    rainfall = input_data["rainfall"]
-    if 100 <= rainfall <= 200:
-        status, level = "Ideal", "good"
-    elif 60 <= rainfall < 100 or 200 < rainfall <= 250:
-        status, level = "Acceptable", "moderate"
-    else:
-        status, level = "Low Suitability", "poor"
+    results = [{} for _ in input_rows]
 
-    analysis["Rainfall"] = {
-        "status": status,
-        "level": level,
-        "value": f"{rainfall} mm"
-    }
+    for (label, value_format, table), indices in zip(SUITABILITY, outcomes):
+        for result, input_data, index in zip(results, input_rows, indices):
+            status, level = table.outcomes[index]
+            value = input_data[table.feature]
 
-    # Temperature
-    temp = input_data["temperature"]
-    if 20 <= temp <= 30:
-        status, level = "Optimal", "good"
-    elif 15 <= temp < 20 or 30 < temp <= 35:
-        status, level = "Moderate", "moderate"
-    else:
-        status, level = "High Risk", "poor"
+            result[label] = {
+                "status": status,
+                "level": level,
+                "value": value if value_format is None else value_format.format(value)
+            }
 
-    analysis["Temperature"] = {
-        "status": status,
-        "level": level,
-        "value": f"{temp} °C"
-    }
+    if crops is not None and envelopes is not None:
+        lows, highs = envelopes.low.tolist(), envelopes.high.tolist()
+        columns = [
+            (label, table.feature, envelopes.features.index(table.feature))
+            for label, _, table in SUITABILITY
+        ]
 
-    # Soil pH
-    ph = input_data["ph"]
-    if 6 <= ph <= 7.5:
-        status, level = "Balanced", "good"
-    elif 5.5 <= ph < 6 or 7.5 < ph <= 8:
-        status, level = "Slightly Off", "moderate"
-    else:
-        status, level = "Unsuitable", "poor"
+        for result, input_data, crop in zip(results, input_rows, crops):
+            i = envelopes.envelope_row(crop)
+            if i is None:
+                continue
 
-    analysis["Soil pH"] = {
-        "status": status,
-        "level": level,
-        "value": ph
-    }
+            for label, feature, j in columns:
+                low, high = lows[i][j], highs[i][j]
+                entry = result[label]
+                entry["crop_range"] = [round(low, 2), round(high, 2)]
+                entry["within_crop_range"] = low <= input_data[feature] <= high
 
-    # Nitrogen
-    nitrogen = input_data["N"]
-    if nitrogen >= 80:
-        status, level = "Sufficient", "good"
-    elif 50 <= nitrogen < 80:
-        status, level = "Moderate", "moderate"
-    else:
-        status, level = "Low", "poor"
+    return results
 
-    analysis["Nitrogen"] = {
-        "status": status,
-        "level": level,
-        "value": f"{nitrogen} kg/ha"
-    }
 
-    return analysis
+def analyze_suitability(input_data, crop=None, envelopes=None):
+    """
+    Returns structured suitability breakdown
+    """
+    crops = None if crop is None else [crop]
+    return analyze_suitability_batch([input_data], crops, envelopes)[0]
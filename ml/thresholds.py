@@ -0,0 +1,190 @@
+"""
+Declarative value bands behind the suitability breakdown, the
+explanation text and the advisory checks.
+
+Each BandTable maps one feature's value onto an outcome: bands are
+written as intervals ("[100, 200]", "(150, inf)", ...), the first band
+containing the value wins and `default` covers everything else. A table
+is compiled once into sorted NumPy bin edges, so a whole column of
+samples is classified with a single np.digitize call.
+"""
+
+import bisect
+import re
+
+import numpy as np
+
+# Below this many rows, classifying value by value beats np.digitize
+SCALAR_ROWS = 32
+
+_INTERVAL = re.compile(r"^\s*([\[(])\s*([^,\s]+)\s*,\s*([^\]\s)]+)\s*([\])])\s*$")
+
+
+def parse_interval(spec):
+    """
+    "[a, b)" -> (a, b, include_low, include_high). inf/-inf are unbounded.
+    """
+    match = _INTERVAL.match(spec)
+    if match is None:
+        raise ValueError(f"Invalid interval: {spec!r}")
+
+    left, low, high, right = match.groups()
+    return float(low), float(high), left == "[", right == "]"
+
+
+def in_interval(value, interval):
+    low, high, include_low, include_high = interval
+    above = low <= value if include_low else low < value
+    below = value <= high if include_high else value < high
+    return above and below
+
+
+class BandTable:
+
+    def __init__(self, feature, bands, default=None):
+        self.feature = feature
+        self.intervals = [parse_interval(spec) for spec, _ in bands]
+        self.outcomes = [outcome for _, outcome in bands] + [default]
+        self.default_index = len(bands)
+        self._compile()
+
+    def _compile(self):
+        # Every finite endpoint p becomes two edges, p and the next float
+        # above it, so digitize separates "below p", "exactly p" and
+        # "above p". Each bin then takes the outcome of one point inside it.
+        points = sorted({
+            bound
+            for low, high, _, _ in self.intervals
+            for bound in (low, high)
+            if np.isfinite(bound)
+        })
+
+        edges = []
+        representatives = [points[0] - 1.0 if points else 0.0]
+        for i, point in enumerate(points):
+            edges += [point, np.nextafter(point, np.inf)]
+            following = points[i + 1] if i + 1 < len(points) else point + 2.0
+            representatives += [point, (point + following) / 2]
+
+        self.edges = np.array(edges, dtype=np.float64)
+        self.bin_outcome = np.array(
+            [self._first_match(value) for value in representatives],
+            dtype=np.intp,
+        )
+        self._edge_list = self.edges.tolist()
+        self._bin_list = self.bin_outcome.tolist()
+
+    def _first_match(self, value):
+        for i, interval in enumerate(self.intervals):
+            if in_interval(value, interval):
+                return i
+        return self.default_index
+
+    def classify(self, values):
+        """
+        Outcome index (into self.outcomes) for every value.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        index = self.bin_outcome[np.digitize(values, self.edges)]
+        # NaN fails every comparison, so it never falls inside a band
+        return np.where(np.isnan(values), self.default_index, index)
+
+    def index(self, value):
+        """
+        classify() for a single value, without the NumPy call overhead.
+        """
+        value = float(value)
+        if value != value:
+            return self.default_index
+        return self._bin_list[bisect.bisect_right(self._edge_list, value)]
+
+    def lookup(self, value):
+        return self.outcomes[self.index(value)]
+
+
+def classify_rows(tables, input_rows):
+    """
+    Outcome indices over all input_rows, one sequence per table.
+    """
+    if len(input_rows) < SCALAR_ROWS:
+        return [
+            [table.index(row[table.feature]) for row in input_rows]
+            for table in tables
+        ]
+
+    return [
+        table.classify([row[table.feature] for row in input_rows]).tolist()
+        for table in tables
+    ]
+
+
+# Shared by the suitability breakdown and the explanation
+OPTIMAL_TEMPERATURE = "[20, 30]"
+BALANCED_PH = "[6, 7.5]"
+
+
+# (label, value format, bands); outcomes are (status, level).
+# A value format of None reports the raw value.
+SUITABILITY = [
+    ("Rainfall", "{} mm", BandTable("rainfall", [
+        ("[100, 200]", ("Ideal", "good")),
+        ("[60, 100)", ("Acceptable", "moderate")),
+        ("(200, 250]", ("Acceptable", "moderate")),
+    ], default=("Low Suitability", "poor"))),
+
+    ("Temperature", "{} °C", BandTable("temperature", [
+        (OPTIMAL_TEMPERATURE, ("Optimal", "good")),
+        ("[15, 20)", ("Moderate", "moderate")),
+        ("(30, 35]", ("Moderate", "moderate")),
+    ], default=("High Risk", "poor"))),
+
+    ("Soil pH", None, BandTable("ph", [
+        (BALANCED_PH, ("Balanced", "good")),
+        ("[5.5, 6)", ("Slightly Off", "moderate")),
+        ("(7.5, 8]", ("Slightly Off", "moderate")),
+    ], default=("Unsuitable", "poor"))),
+
+    ("Nitrogen", "{} kg/ha", BandTable("N", [
+        ("[80, inf)", ("Sufficient", "good")),
+        ("[50, 80)", ("Moderate", "moderate")),
+    ], default=("Low", "poor"))),
+]
+
+
+# Reasons in the explanation text, in order; None adds no reason
+EXPLANATION = [
+    BandTable("rainfall", [
+        ("(150, inf)", "high rainfall conditions"),
+        ("(-inf, 60)", "low rainfall conditions"),
+    ], default="moderate rainfall levels"),
+
+    BandTable("temperature", [
+        (OPTIMAL_TEMPERATURE, "optimal temperature range"),
+        ("(35, inf)", "high temperature conditions"),
+    ]),
+
+    BandTable("ph", [
+        (BALANCED_PH, "near-neutral soil pH ideal for nutrient absorption"),
+        ("(-inf, 5.5)", "acidic soil conditions"),
+    ]),
+]
+
+
+# Conditions checked by the advisory engine
+ADVISORY = {
+    "dry_soil": BandTable("rainfall", [("(-inf, 80)", True)], default=False),
+    "hot_for_dry_soil": BandTable("temperature", [("(32, inf)", True)], default=False),
+    "critical_ph": BandTable("ph", [
+        ("(-inf, 5.0)", True),
+        ("(8.0, inf)", True),
+    ], default=False),
+    "heatwave": BandTable("temperature", [("[35, inf)", True)], default=False),
+    "fungal_humidity": BandTable("humidity", [("[85, inf)", True)], default=False),
+    "excess_rainfall": BandTable("rainfall", [("[300, inf)", True)], default=False),
+    "irrigation_rainfall": BandTable("rainfall", [("(-inf, 150)", True)], default=False),
+    "low_nitrogen": BandTable("N", [("(-inf, 50)", True)], default=False),
+}
+
+
+def advisory_flag(name, value):
+    return ADVISORY[name].lookup(value)
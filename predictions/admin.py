@@ -1,7 +1,7 @@
 from django.contrib import admin
 
 # Register your models here.
-from .models import Prediction
+from .models import HistoryArchive, Prediction
 
 
 @admin.register(Prediction)
@@ -21,3 +21,14 @@ class PredictionAdmin(admin.ModelAdmin):
     list_filter = ("user", "created_at")
     search_fields = ("user__username",)
     ordering = ("-created_at",)
+
+
+@admin.register(HistoryArchive)
+class HistoryArchiveAdmin(admin.ModelAdmin):
+    list_display = ("user", "kind", "month", "row_count", "codec", "updated_at")
+    list_filter = ("kind", "codec")
+    search_fields = ("user__username",)
+    ordering = ("-month",)
+    # The compressed rows are only readable through archive_history
+    exclude = ("data",)
+    readonly_fields = ("user", "kind", "month", "row_count", "codec")
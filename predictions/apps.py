@@ -2,4 +2,6 @@ from django.apps import AppConfig
 
 
 class PredictionsConfig(AppConfig):
+    # Prediction and HistoryArchive were created with AutoField ids
+    default_auto_field = "django.db.models.AutoField"
     name = "predictions"
@@ -0,0 +1,146 @@
+"""
+Moves old predictions and voice queries out of the live tables, lists
+the archive, or restores it.
+
+    python manage.py archive_history
+    python manage.py archive_history --days 90 --kind prediction
+    python manage.py archive_history --list --user alice
+    python manage.py archive_history --restore --user alice --month 2025-03
+
+Archiving takes every row older than --days (HISTORY_ARCHIVE
+["AFTER_DAYS"] by default), rounded down to whole months, into one
+compressed HistoryArchive row per user, kind and month. --restore moves
+the selected partitions back into the live tables.
+"""
+
+from datetime import date
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models.functions import Length
+
+from predictions.models import HistoryArchive
+from predictions.services.archive import (
+    ARCHIVED,
+    CODECS,
+    archive_cutoff,
+    archive_history,
+    restore_partition,
+)
+
+
+def parse_month(value):
+    try:
+        return date.fromisoformat(f"{value}-01")
+    except ValueError:
+        raise CommandError(f"--month must be YYYY-MM, not {value!r}")
+
+
+class Command(BaseCommand):
+    help = "Archives, lists or restores old prediction and voice history."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            help="Archive rows older than this many days "
+                 "(default HISTORY_ARCHIVE['AFTER_DAYS']).",
+        )
+        parser.add_argument(
+            "--kind",
+            choices=sorted(ARCHIVED),
+            help="Only predictions or only voice queries.",
+        )
+        parser.add_argument("--user", help="Only this username.")
+        parser.add_argument("--codec", choices=sorted(CODECS))
+        parser.add_argument(
+            "--month",
+            help="With --list or --restore: only this month (YYYY-MM).",
+        )
+
+        action = parser.add_mutually_exclusive_group()
+        action.add_argument(
+            "--list",
+            action="store_true",
+            help="List archived partitions instead of archiving.",
+        )
+        action.add_argument(
+            "--restore",
+            action="store_true",
+            help="Move archived partitions back into the live tables.",
+        )
+
+    def handle(self, *args, **options):
+        user = None
+        if options["user"]:
+            try:
+                user = User.objects.get(username=options["user"])
+            except User.DoesNotExist:
+                raise CommandError(f"Unknown user: {options['user']}")
+
+        kinds = [options["kind"]] if options["kind"] else list(ARCHIVED)
+
+        if options["list"] or options["restore"]:
+            partitions = HistoryArchive.objects.filter(kind__in=kinds).defer("data")
+            if user is not None:
+                partitions = partitions.filter(user=user)
+            if options["month"]:
+                partitions = partitions.filter(month=parse_month(options["month"]))
+            partitions = partitions.order_by("user_id", "kind", "month")
+
+            if options["list"]:
+                self.list_partitions(partitions)
+            else:
+                self.restore_partitions(partitions)
+            return
+
+        days = options["days"]
+        if days is None:
+            days = settings.HISTORY_ARCHIVE["AFTER_DAYS"]
+        if days < 0:
+            raise CommandError("--days must not be negative")
+        cutoff = archive_cutoff(days)
+
+        for kind in kinds:
+            partitions = rows = 0
+            try:
+                for user_id, month, moved in archive_history(
+                    kind,
+                    cutoff,
+                    user_ids=None if user is None else [user.id],
+                    codec=options["codec"],
+                ):
+                    partitions += 1
+                    rows += moved
+                    self.stdout.write(f"{kind} user {user_id} {month:%Y-%m}: {moved} rows")
+            except ImproperlyConfigured as exc:
+                raise CommandError(str(exc))
+
+            self.stdout.write(self.style.SUCCESS(
+                f"Archived {rows} {kind} rows older than {cutoff} "
+                f"into {partitions} partitions"
+            ))
+
+    def list_partitions(self, partitions):
+        partitions = partitions.annotate(size=Length("data"))
+        for partition in partitions:
+            self.stdout.write(
+                f"{partition.kind:<10} user {partition.user_id:<6} "
+                f"{partition.month:%Y-%m}  {partition.row_count:>7} rows  "
+                f"{partition.size / 1024:9.1f} KiB {partition.codec}"
+            )
+        self.stdout.write(f"{len(partitions)} partitions")
+
+    def restore_partitions(self, partitions):
+        rows = 0
+        pks = list(partitions.values_list("pk", flat=True))
+        for pk in pks:
+            try:
+                rows += restore_partition(pk)
+            except ImproperlyConfigured as exc:
+                raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            f"Restored {rows} rows from {len(pks)} partitions"
+        ))
@@ -0,0 +1,1012 @@
+"""
+predictions/management/commands/benchmark.py
+--------------------------------------------
+Micro-benchmarks for the prediction pipeline.
+
+    python manage.py benchmark batch --rows 1000
+"""
+
+import itertools
+import json
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from ml.predictor import FEATURE_RANGES
+
+
+def random_inputs(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    columns = {
+        feature: rng.uniform(low, high, size=rows)
+        for feature, (low, high) in FEATURE_RANGES.items()
+    }
+    return [
+        {feature: float(values[i]) for feature, values in columns.items()}
+        for i in range(rows)
+    ]
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def bench_batch(command, options):
+    from predictions.services.prediction_pipeline import (
+        run_batch_prediction,
+        run_prediction,
+    )
+
+    rows = random_inputs(options["rows"])
+
+    _, single = timed(lambda: [run_prediction(row) for row in rows])
+    _, batch = timed(run_batch_prediction, rows)
+
+    command.stdout.write(f"rows:            {len(rows)}")
+    command.stdout.write(f"single requests: {single / len(rows) * 1e6:9.1f} us/row")
+    command.stdout.write(f"one batch:       {batch / len(rows) * 1e6:9.1f} us/row")
+    command.stdout.write(f"speedup:         {single / batch:9.1f}x")
+
+
+def bench_microbatch(command, options):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from ml.batching import MicroBatcher
+    from ml.predictor import predict_crop, predict_crop_batch
+
+    rows = random_inputs(options["rows"])
+    threads = options["threads"]
+    batcher = MicroBatcher(
+        predict_crop_batch,
+        max_batch_size=options["batch_size"],
+        max_wait_ms=options["wait_ms"],
+    )
+
+    for label, fn in (("direct", predict_crop), ("micro-batched", batcher.submit)):
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            _, elapsed = timed(lambda: list(pool.map(fn, rows)))
+        command.stdout.write(
+            f"{label:14} {len(rows) / elapsed:9.0f} predictions/s ({threads} threads)"
+        )
+
+    stats = batcher.stats()
+    command.stdout.write(f"mean batch size: {stats['mean_batch_size']}")
+    command.stdout.write(f"max queue depth: {stats['max_queue_depth']}")
+    command.stdout.write(f"batch sizes:     {stats['batch_size_histogram']}")
+
+
+def latency_percentiles(fn, X, repeats):
+    samples = []
+    for i in range(repeats):
+        row = X[i % len(X)].reshape(1, -1)
+        start = time.perf_counter()
+        fn(row)
+        samples.append(time.perf_counter() - start)
+    return np.percentile(samples, [50, 99]) * 1e6
+
+
+def bench_compiled(command, options):
+    import os
+
+    import joblib
+
+    from ml.predictor import build_input_matrix, current_version
+    from ml.registry import MODEL_FILE
+
+    version = current_version()
+    compiled_model = version.compiled
+    if compiled_model is None:
+        raise CommandError("The loaded model cannot be compiled")
+
+    model = joblib.load(os.path.join(version.path, MODEL_FILE))
+
+    X = build_input_matrix(random_inputs(options["rows"]), version.features)
+
+    expected = model.predict_proba(X)
+    actual = compiled_model.predict_proba(X)
+    command.stdout.write(
+        f"parity over {len(X)} rows: "
+        f"{'identical' if np.array_equal(expected, actual) else 'MISMATCH'} "
+        f"(max abs diff {np.abs(expected - actual).max():.3g})"
+    )
+
+    repeats = min(len(X), 200)
+    for label, fn in (
+        ("sklearn", model.predict_proba),
+        ("compiled", compiled_model.predict_proba),
+    ):
+        p50, p99 = latency_percentiles(fn, X, repeats)
+        command.stdout.write(f"{label:9} single row  p50 {p50:9.1f} us  p99 {p99:9.1f} us")
+
+
+MEMORY_PROBE = """
+import sys
+sys.path.insert(0, {root!r})
+if {bundle!r}:
+    from ml.bundle import load_bundle
+    model, _ = load_bundle({bundle!r})
+else:
+    import joblib
+    model = joblib.load({pickle!r})
+model.predict_proba([[90, 42, 43, 20.8, 82, 6.5, 202.9]])
+print("ready", flush=True)
+sys.stdin.readline()
+fields = {{}}
+for name in ("/proc/self/status", "/proc/self/smaps_rollup"):
+    try:
+        with open(name) as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                fields[key] = rest.split()[0] if rest.split() else ""
+    except OSError:
+        pass
+print(fields.get("VmRSS", "0"), fields.get("Pss", "0"), flush=True)
+"""
+
+
+def bench_memory(command, options):
+    import subprocess
+    import sys
+
+    from django.conf import settings
+
+    from ml.bundle import bundle_exists
+    from ml.predictor import BUNDLE_DIR, MODEL_PATH
+
+    if not bundle_exists(BUNDLE_DIR):
+        raise CommandError("Run `manage.py export_model_bundle` first")
+
+    workers = options["workers"]
+
+    for label, bundle in (("pickle", ""), ("mmap bundle", BUNDLE_DIR)):
+        script = MEMORY_PROBE.format(
+            root=str(settings.BASE_DIR), bundle=bundle, pickle=MODEL_PATH
+        )
+        procs = [
+            subprocess.Popen(
+                [sys.executable, "-W", "ignore", "-c", script],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+            )
+            for _ in range(workers)
+        ]
+        for proc in procs:
+            proc.stdout.readline()
+
+        # All workers are alive at once, so shared pages are split between them
+        rss, pss = [], []
+        for proc in procs:
+            out, _ = proc.communicate("report\n")
+            worker_rss, worker_pss = out.split()
+            rss.append(int(worker_rss) / 1024)
+            pss.append(int(worker_pss) / 1024)
+
+        command.stdout.write(
+            f"{label:12} RSS/worker {np.mean(rss):7.1f} MiB   "
+            f"PSS/worker {np.mean(pss):7.1f} MiB   ({workers} workers)"
+        )
+
+
+def bench_lookup_grid(command, options):
+    from ml.lookup_grid import LookupGrid, exact_sweep
+    from ml.predictor import current_version
+
+    version = current_version()
+
+    grid, build = timed(LookupGrid.build, version, options["bins"])
+    command.stdout.write(
+        f"build:   {grid.top_class.size:,} points in {build:.2f}s, "
+        f"{grid.nbytes / 1e6:.2f} MB, agreement {grid.agreement:.1%}"
+    )
+
+    inputs = random_inputs(200)
+    for vary in (["rainfall"], ["rainfall", "temperature"]):
+        lookups = []
+        exact = []
+        matches = points = 0
+        for row in inputs:
+            (axes, grid_top, _), elapsed = timed(grid.sweep, row, vary)
+            lookups.append(elapsed)
+            (model_top, _), elapsed = timed(exact_sweep, version, row, vary, axes)
+            exact.append(elapsed)
+
+            matches += int((grid_top == model_top).sum())
+            points += grid_top.size
+
+        label = " x ".join(vary)
+        command.stdout.write(
+            f"{label:22} grid p50 {np.median(lookups) * 1e6:8.1f} us   "
+            f"model p50 {np.median(exact) * 1e6:9.1f} us   "
+            f"agreement {matches / points:.1%}"
+        )
+
+
+def bench_sensitivity(command, options):
+    from ml.sensitivity import sensitivity
+
+    base = random_inputs(1)[0]
+    side = int(np.sqrt(options["rows"]))
+
+    for ranges in (
+        [("ph", 3.5, 10, options["rows"])],
+        [("rainfall", 20, 300, side), ("ph", 3.5, 10, side)],
+    ):
+        sensitivity(base, ranges)
+        samples = [timed(sensitivity, base, ranges)[1] for _ in range(5)]
+        points = int(np.prod([steps for _, _, _, steps in ranges]))
+        label = " x ".join(feature for feature, _, _, _ in ranges)
+        command.stdout.write(
+            f"{label:16} {points:7,} points  median {np.median(samples) * 1000:7.1f} ms"
+        )
+
+
+def bench_anytime(command, options):
+    from ml.predictor import build_input_matrix, current_version
+
+    version = current_version()
+    forest = version.compiled
+    if forest is None:
+        raise CommandError("Anytime evaluation needs the compiled forest")
+
+    X = build_input_matrix(random_inputs(options["rows"]), version.features)
+
+    exact = forest.predict_proba(X)
+    anytime, evaluated = forest.predict_proba_anytime(X)
+
+    agreement = (exact.argmax(axis=1) == anytime.argmax(axis=1)).mean()
+    command.stdout.write(
+        f"trees evaluated: mean {evaluated.mean():.1f} / {forest.n_trees}, "
+        f"median {np.median(evaluated):.0f}"
+    )
+    command.stdout.write(f"top-1 agreement: {agreement:.2%}")
+    command.stdout.write(
+        f"max confidence shift: {np.abs(exact - anytime).max(axis=1).max():.3f}"
+    )
+
+    repeats = min(len(X), 300)
+    for label, fn in (
+        ("exact", forest.predict_proba),
+        ("anytime", forest.predict_proba_anytime),
+    ):
+        p50, p99 = latency_percentiles(fn, X, repeats)
+        command.stdout.write(f"{label:8} single row  p50 {p50:8.1f} us  p99 {p99:8.1f} us")
+
+    for label, fn in (
+        ("exact", forest.predict_proba),
+        ("anytime", forest.predict_proba_anytime),
+    ):
+        _, elapsed = timed(fn, X)
+        command.stdout.write(f"{label:8} {len(X)} rows   {elapsed / len(X) * 1e6:8.1f} us/row")
+
+
+def bench_contributions(command, options):
+    from ml.predictor import build_input_matrix, current_version
+
+    version = current_version()
+    forest = version.compiled
+    if forest is None:
+        raise CommandError("Feature contributions need the compiled forest")
+
+    X = build_input_matrix(random_inputs(options["rows"]), version.features)
+    top = forest.predict_proba(X).argmax(axis=1)
+
+    def contributions(rows):
+        return forest.feature_contributions(rows, top[:len(rows)])
+
+    bias, values = contributions(X)
+    proba = forest.predict_proba(X)[np.arange(len(X)), top]
+    command.stdout.write(
+        f"max |bias + sum - proba|: {np.abs(bias + values.sum(axis=1) - proba).max():.2e}"
+    )
+
+    repeats = min(len(X), 300)
+    p50, p99 = latency_percentiles(contributions, X, repeats)
+    command.stdout.write(f"single row  p50 {p50:8.1f} us  p99 {p99:8.1f} us")
+
+    _, elapsed = timed(contributions, X)
+    command.stdout.write(f"{len(X)} rows   {elapsed / len(X) * 1e6:8.1f} us/row")
+
+
+def bench_thresholds(command, options):
+    from ml.explainer import generate_explanation, generate_explanations
+    from ml.suitability import analyze_suitability, analyze_suitability_batch
+
+    rows = random_inputs(options["rows"])
+    crops = ["rice"] * len(rows)
+    importances = [[{"feature": "Rainfall", "importance": 0.3}]] * len(rows)
+
+    def per_row():
+        for row, crop, importance in zip(rows, crops, importances):
+            analyze_suitability(row)
+            generate_explanation(row, crop, importance)
+
+    def batched():
+        analyze_suitability_batch(rows)
+        generate_explanations(rows, crops, importances)
+
+    _, single = timed(per_row)
+    _, batch = timed(batched)
+
+    command.stdout.write(f"rows:      {len(rows)}")
+    command.stdout.write(f"per row:   {single / len(rows) * 1e6:9.1f} us/row")
+    command.stdout.write(f"one batch: {batch / len(rows) * 1e6:9.1f} us/row")
+
+
+def bench_envelopes(command, options):
+    from ml.envelopes import CropEnvelopes
+    from ml.predictor import build_input_matrix, current_version
+
+    version = current_version()
+
+    envelopes, elapsed = timed(CropEnvelopes.build, version)
+    command.stdout.write(f"build:           {elapsed:9.2f} s")
+
+    rows = random_inputs(options["rows"])
+    X = build_input_matrix(rows, version.features)
+
+    top = version.model.predict_proba(X).argmax(axis=1).astype(np.uint64)
+    masks = envelopes.feasible_masks(X)
+    covered = ((masks >> top) & np.uint64(1)).astype(bool)
+    sizes = [bin(int(mask)).count("1") for mask in masks]
+
+    command.stdout.write(f"top crop inside: {covered.mean():9.2%}")
+    command.stdout.write(f"feasible crops:  {np.mean(sizes):9.2f} mean of {len(envelopes.classes)}")
+
+    crop = str(envelopes.classes[0])
+    _, feasible = timed(lambda: [envelopes.feasible(row) for row in rows])
+    _, violations = timed(lambda: [envelopes.violations(row, crop) for row in rows])
+    _, batch = timed(envelopes.feasible_masks, X)
+
+    command.stdout.write(f"feasible:        {feasible / len(rows) * 1e6:9.1f} us/row")
+    command.stdout.write(f"violations:      {violations / len(rows) * 1e6:9.1f} us/row")
+    command.stdout.write(f"batch masks:     {batch / len(rows) * 1e6:9.2f} us/row")
+
+
+def fill_history(user, total, rows, results):
+    """
+    Tops the user's history up to `total` predictions cycling through
+    rows/results. Callers wrap this in a rolled-back transaction.
+    """
+    from predictions.models import Prediction
+
+    existing = Prediction.objects.filter(user=user).count()
+    Prediction.objects.bulk_create([
+        Prediction(
+            user=user,
+            nitrogen=row["N"], phosphorus=row["P"], potassium=row["K"],
+            temperature=row["temperature"], humidity=row["humidity"],
+            rainfall=row["rainfall"], ph=row["ph"],
+            result=results[i % len(results)],
+        )
+        for i, row in zip(range(existing, total), itertools.cycle(rows))
+    ], batch_size=1000)
+
+
+def bench_history(command, options):
+    from django.contrib.auth.models import User
+    from django.db import transaction
+
+    from predictions.services.history import history_page
+    from predictions.services.prediction_pipeline import run_batch_prediction
+
+    rows = random_inputs(min(options["rows"], 1000))
+    results = run_batch_prediction(rows)
+    fields = ["id", "inputs", "top_prediction", "created_at"]
+
+    # Everything below is rolled back
+    with transaction.atomic():
+        user = User.objects.create(username="__benchmark_history__")
+
+        for total in (1000, 10000, options["history_rows"]):
+            fill_history(user, total, rows, results)
+
+            (page, cursor), first = timed(history_page, user, fields, 50)
+            for _ in range(total // 50 // 2):
+                _, cursor = history_page(user, ["id", "created_at"], 50, cursor)
+            _, deep = timed(history_page, user, fields, 50, cursor)
+            (full, _), everything = timed(
+                history_page, user, ["id", "inputs", "result", "created_at"], total
+            )
+
+            command.stdout.write(
+                f"{total:>7} rows: first page {first * 1000:6.1f} ms, "
+                f"middle page {deep * 1000:6.1f} ms, "
+                f"page bytes {len(json.dumps(page)):>6}; "
+                f"unpaginated {everything * 1000:8.1f} ms, "
+                f"{len(json.dumps(full)) / 1e6:6.1f} MB"
+            )
+
+        transaction.set_rollback(True)
+
+
+def bench_export(command, options):
+    import tracemalloc
+
+    from django.contrib.auth.models import User
+    from django.db import transaction
+    from django.test import RequestFactory
+
+    from predictions.services.prediction_pipeline import run_batch_prediction
+    from predictions.views import export_prediction_history
+
+    rows = random_inputs(min(options["rows"], 1000))
+    results = run_batch_prediction(rows)
+    total = options["history_rows"]
+    ceiling = options["memory_ceiling_mb"]
+
+    # Everything below is rolled back
+    with transaction.atomic():
+        user = User.objects.create(username="__benchmark_export__")
+        fill_history(user, total, rows, results)
+
+        failed = []
+        for export_format in ("ndjson", "csv"):
+            request = RequestFactory().get(
+                "/api/history/export/", {"format": export_format}
+            )
+            request.user = user
+
+            tracemalloc.start()
+            start = time.perf_counter()
+
+            response = export_prediction_history(request)
+            size = lines = 0
+            for block in response.streaming_content:
+                size += len(block)
+                lines += block.count(b"\n")
+
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            peak_mb = peak / 2**20
+            command.stdout.write(
+                f"{export_format:6} {lines:>8} lines, {size / 1e6:6.1f} MB in "
+                f"{elapsed:5.1f}s (traced), peak memory {peak_mb:5.1f} MB"
+            )
+            if peak_mb > ceiling:
+                failed.append(export_format)
+
+        transaction.set_rollback(True)
+
+    if failed:
+        raise CommandError(
+            f"{', '.join(failed)} export exceeded {ceiling} MB for {total} rows"
+        )
+    command.stdout.write(f"peak memory under {ceiling} MB for {total} rows")
+
+
+def bench_insights(command, options):
+    from django.contrib.auth.models import User
+    from django.db import connection, transaction
+    from django.test import RequestFactory
+    from django.test.utils import CaptureQueriesContext
+
+    from predictions.models import Prediction, UserInsightSummary
+    from predictions.services.prediction_pipeline import run_batch_prediction
+    from predictions.views import user_insights
+
+    rows = random_inputs(min(options["rows"], 1000))
+    results = run_batch_prediction(rows)
+
+    # Everything below is rolled back
+    with transaction.atomic():
+        user = User.objects.create(username="__benchmark_insights__")
+        request = RequestFactory().get("/api/insights/")
+        request.user = user
+
+        for total in (1000, 10000, options["history_rows"]):
+            fill_history(user, total, rows, results)
+
+            with CaptureQueriesContext(connection) as queries:
+                _, elapsed = timed(user_insights, request)
+            _, recompute = timed(UserInsightSummary.compute, user.id)
+
+            command.stdout.write(
+                f"{total:>7} rows: {elapsed * 1000:7.1f} ms, {len(queries)} queries; "
+                f"recomputed from history {recompute * 1000:7.1f} ms"
+            )
+
+        # Cost of keeping the summary current on every write
+        writes = 200
+        created, create = timed(lambda: [
+            Prediction.objects.create(
+                user=user,
+                nitrogen=row["N"], phosphorus=row["P"], potassium=row["K"],
+                temperature=row["temperature"], humidity=row["humidity"],
+                rainfall=row["rainfall"], ph=row["ph"],
+                result=results[i],
+            )
+            for i, row in enumerate(rows[:writes])
+        ])
+        _, delete = timed(lambda: [prediction.delete() for prediction in created])
+        _, bulk = timed(fill_history, user, total + len(rows), rows, results)
+        _, rebuild = timed(UserInsightSummary.rebuild, user.id)
+
+        command.stdout.write(f"create:          {create / writes * 1000:7.2f} ms/row")
+        command.stdout.write(f"delete:          {delete / writes * 1000:7.2f} ms/row")
+        command.stdout.write(f"bulk_create:     {bulk / len(rows) * 1000:7.3f} ms/row")
+        command.stdout.write(f"rebuild:         {rebuild * 1000:7.1f} ms")
+
+        transaction.set_rollback(True)
+
+
+def bench_trends(command, options):
+    from datetime import timedelta
+
+    from django.contrib.auth.models import User
+    from django.db import connection, transaction
+    from django.test.utils import CaptureQueriesContext
+    from django.utils import timezone
+
+    from predictions.models import Prediction
+    from predictions.services.prediction_pipeline import run_batch_prediction
+    from predictions.services.trends import (
+        next_period,
+        parse_range,
+        prediction_trends,
+        query_buckets,
+    )
+
+    rows = random_inputs(min(options["rows"], 1000))
+    results = run_batch_prediction(rows)
+    total = options["history_rows"]
+
+    # Everything below is rolled back
+    with transaction.atomic():
+        user = User.objects.create(username="__benchmark_trends__")
+        fill_history(user, total, rows, results)
+
+        # Spread the history evenly over the last year
+        now = timezone.now()
+        history = list(Prediction.objects.filter(user=user).only("id"))
+        for i, prediction in enumerate(history):
+            prediction.created_at = now - timedelta(days=365 * i / len(history))
+        Prediction.objects.bulk_update(history, ["created_at"], batch_size=2000)
+
+        command.stdout.write(f"{total} predictions over one year")
+        for period, start in (("day", 90), ("week", 365), ("month", 365)):
+            starts = parse_range(
+                period, (now - timedelta(days=start)).date().isoformat(), None
+            )
+            first, end = starts[0], next_period(starts[-1], period)
+            _, cold = timed(query_buckets, user.id, period, first, end)
+
+            prediction_trends(user.id, period, starts)
+            with CaptureQueriesContext(connection) as queries:
+                _, warm = timed(prediction_trends, user.id, period, starts)
+
+            command.stdout.write(
+                f"{period:5} x{len(starts):>3}: all buckets queried {cold * 1000:7.1f} ms, "
+                f"closed buckets cached {warm * 1000:6.1f} ms "
+                f"({len(queries)} queries)"
+            )
+
+        transaction.set_rollback(True)
+
+
+def bench_write_behind(command, options):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from django.contrib.auth.models import User
+    from django.db import connection
+
+    from core.write_behind import WriteBehindBuffer
+    from predictions.models import Prediction
+    from predictions.services.prediction_pipeline import run_batch_prediction
+
+    rows = random_inputs(options["rows"])
+    results = run_batch_prediction(rows)
+    threads = options["threads"]
+
+    # Writer threads need their own committed rows, so this suite
+    # cannot run in a rolled-back transaction; it deletes them instead
+    user = User.objects.create(username="__benchmark_write_behind__")
+
+    def prediction(i):
+        row = rows[i]
+        return Prediction(
+            user=user,
+            nitrogen=row["N"], phosphorus=row["P"], potassium=row["K"],
+            temperature=row["temperature"], humidity=row["humidity"],
+            rainfall=row["rainfall"], ph=row["ph"],
+            result=results[i],
+        )
+
+    def run(save):
+        latencies = []
+
+        def one(i):
+            start = time.perf_counter()
+            save(prediction(i))
+            latencies.append(time.perf_counter() - start)
+            connection.close()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(one, range(len(rows))))
+        return time.perf_counter() - start, np.percentile(latencies, [50, 99])
+
+    try:
+        elapsed, (p50, p99) = run(lambda instance: instance.save())
+        command.stdout.write(
+            f"direct save    {len(rows) / elapsed:7.0f} rows/s, "
+            f"p50 {p50 * 1000:6.2f} ms, p99 {p99 * 1000:7.2f} ms ({threads} threads)"
+        )
+
+        buffer = WriteBehindBuffer()
+        elapsed, (p50, p99) = run(buffer.save_later)
+        _, flush = timed(buffer.flush)
+        buffer.close()
+        elapsed += flush
+
+        stats = buffer.stats()
+        command.stdout.write(
+            f"write-behind   {len(rows) / elapsed:7.0f} rows/s, "
+            f"p50 {p50 * 1000:6.2f} ms, p99 {p99 * 1000:7.2f} ms ({threads} threads)"
+        )
+        command.stdout.write(
+            f"batches: {stats['batches']}, mean size {stats['mean_batch_size']}, "
+            f"overflows {stats['overflows']}, final flush {flush * 1000:.1f} ms"
+        )
+
+        stored = Prediction.objects.filter(user=user).count()
+        if stored != 2 * len(rows):
+            raise CommandError(f"Expected {2 * len(rows)} rows, found {stored}")
+    finally:
+        Prediction.objects.filter(user=user).delete()
+        user.delete()
+
+
+def bench_top_crop(command, options):
+    from collections import Counter
+
+    from django.contrib.auth.models import User
+    from django.db import transaction
+
+    from predictions.models import Prediction, top_prediction
+    from predictions.services.prediction_pipeline import run_batch_prediction
+
+    rows = random_inputs(min(options["rows"], 1000))
+    results = run_batch_prediction(rows)
+    total = options["history_rows"]
+    crop, min_confidence = results[0]["predictions"][0]["crop"], 0.5
+
+    def python_scan():
+        counts = Counter()
+        matches = 0
+        for result in Prediction.objects.values_list("result", flat=True).iterator(2000):
+            top, confidence = top_prediction(result)
+            if top:
+                counts[top] += 1
+                matches += top == crop and confidence >= min_confidence
+        return matches, counts.most_common()
+
+    def sql():
+        matches = Prediction.objects.filter_top_crop(
+            crop, min_confidence=min_confidence
+        ).count()
+        counts = Prediction.objects.top_crop_counts()
+        return matches, [(row["top_crop"], row["count"]) for row in counts]
+
+    # Everything below is rolled back
+    with transaction.atomic():
+        user = User.objects.create(username="__benchmark_top_crop__")
+        fill_history(user, total, rows, results)
+        total = Prediction.objects.count()
+
+        (scanned, scanned_counts), scan = timed(python_scan)
+        (queried, queried_counts), query = timed(sql)
+
+        if scanned != queried or dict(scanned_counts) != dict(queried_counts):
+            raise CommandError("SQL and Python scan disagree")
+
+        command.stdout.write(
+            f"{total} predictions; {queried} with {crop} at >= {min_confidence}"
+        )
+        command.stdout.write(f"python scan:     {scan * 1000:9.1f} ms")
+        command.stdout.write(f"SQL:             {query * 1000:9.1f} ms")
+        command.stdout.write(f"speedup:         {scan / query:9.1f}x")
+        command.stdout.write(
+            "plan: " + Prediction.objects.filter_top_crop(
+                crop, min_confidence=min_confidence
+            ).explain().replace("\n", " | ")
+        )
+
+        transaction.set_rollback(True)
+
+
+def bench_result_format(command, options):
+    from django.contrib.auth.models import User
+    from django.db import transaction
+
+    from predictions.models import ModelVersionMetadata
+    from predictions.services.history import history_page
+    from predictions.services.prediction_pipeline import run_batch_prediction
+    from predictions.services.result_format import compact_result, expand_results
+
+    rows = random_inputs(min(options["rows"], 1000))
+    results = run_batch_prediction(rows)
+    metadata = ModelVersionMetadata.record(results[0]["model_version"])
+
+    compact, encode = timed(
+        lambda: [compact_result(r, metadata.classes, metadata.features) for r in results]
+    )
+    expanded, decode = timed(
+        expand_results, compact, rows, ModelVersionMetadata.for_version
+    )
+    if expanded != results:
+        raise CommandError("Expanded results differ from the pipeline's")
+
+    full_bytes = sum(len(json.dumps(r)) for r in results) / len(results)
+    compact_bytes = sum(len(json.dumps(r)) for r in compact) / len(compact)
+
+    command.stdout.write(f"rows:            {len(rows)}")
+    command.stdout.write(f"full JSON:       {full_bytes:9.1f} bytes/row")
+    command.stdout.write(f"compact JSON:    {compact_bytes:9.1f} bytes/row")
+    command.stdout.write(f"encode:          {encode / len(rows) * 1e6:9.1f} us/row")
+    command.stdout.write(f"expand:          {decode / len(rows) * 1e6:9.1f} us/row")
+
+    # Everything below is rolled back
+    with transaction.atomic():
+        user = User.objects.create(username="__benchmark_result_format__")
+        fill_history(user, options["history_rows"], rows, results)
+
+        _, summary = timed(
+            history_page, user, ["id", "inputs", "top_prediction"], 1000
+        )
+        _, full = timed(history_page, user, ["id", "inputs", "result"], 1000)
+        command.stdout.write(
+            f"history page of 1000: {summary * 1000:6.1f} ms without result, "
+            f"{full * 1000:6.1f} ms with result"
+        )
+
+        transaction.set_rollback(True)
+
+
+def bench_archive(command, options):
+    from datetime import timedelta
+
+    from django.contrib.auth.models import User
+    from django.db import connection, transaction
+    from django.utils import timezone
+
+    from predictions.models import HistoryArchive, Prediction
+    from predictions.services.archive import (
+        archive_cutoff,
+        archive_history,
+        delete_history,
+        restore_partition,
+    )
+    from predictions.services.history import export_history
+    from predictions.services.prediction_pipeline import run_batch_prediction
+
+    rows = random_inputs(min(options["rows"], 1000))
+    results = run_batch_prediction(rows)
+    total = options["history_rows"]
+
+    def table_bytes():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT SUM(pgsize) FROM dbstat WHERE name = 'predictions_prediction'"
+            )
+            return cursor.fetchone()[0]
+
+    # Everything below is rolled back
+    with transaction.atomic():
+        user = User.objects.create(username="__benchmark_archive__")
+        fill_history(user, total, rows, results)
+
+        # Spread the history over two years, newest first
+        now = timezone.now()
+        step = timedelta(days=730) / total
+        ids = Prediction.objects.filter(user=user).order_by("-id").values_list("id", flat=True)
+        Prediction.objects.bulk_update(
+            [
+                Prediction(id=pk, created_at=now - i * step)
+                for i, pk in enumerate(ids)
+            ],
+            ["created_at"],
+            batch_size=1000,
+        )
+
+        cutoff = archive_cutoff(365)
+        old = Prediction.objects.filter(user=user, created_at__lt=cutoff).count()
+
+        live_before = table_bytes() if connection.vendor == "sqlite" else None
+        moved, archive = timed(
+            lambda: sum(m for *_, m in archive_history("prediction", cutoff, [user.id]))
+        )
+        archived_bytes = sum(
+            len(data) for data in
+            HistoryArchive.objects.filter(user=user).values_list("data", flat=True)
+        )
+        _, export = timed(lambda: sum(1 for _ in export_history(user, "ndjson", 2000)))
+
+        command.stdout.write(f"{total} predictions, {old} older than {cutoff}")
+        command.stdout.write(
+            f"archive:         {archive * 1000:9.1f} ms "
+            f"({archive / moved * 1e6:.1f} us/row)"
+        )
+        command.stdout.write(f"archived:        {archived_bytes / moved:9.1f} bytes/row")
+        if live_before is not None:
+            command.stdout.write(
+                f"live table:      {live_before / total:9.1f} bytes/row "
+                f"(before VACUUM)"
+            )
+        command.stdout.write(f"export with archive: {export * 1000:9.1f} ms")
+
+        pks = list(HistoryArchive.objects.filter(user=user).values_list("pk", flat=True))
+        restored, restore = timed(lambda: sum(restore_partition(pk) for pk in pks))
+        command.stdout.write(
+            f"restore:         {restore * 1000:9.1f} ms ({restored} rows)"
+        )
+
+        _, chunked = timed(delete_history, user.id, "prediction")
+        command.stdout.write(f"chunked reset:   {chunked * 1000:9.1f} ms")
+
+        transaction.set_rollback(True)
+
+
+# Stock SQLite behaviour, for comparison with settings.DATABASES
+DEFAULT_SQLITE_PROFILE = {
+    "CONN_MAX_AGE": 0,
+    "OPTIONS": {"init_command": "PRAGMA journal_mode=DELETE;PRAGMA synchronous=FULL"},
+}
+
+
+def bench_sqlite(command, options):
+    import os
+    import sqlite3
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    from django.contrib.auth.models import User
+    from django.db import DatabaseError, close_old_connections, connection, connections
+
+    from predictions.models import Prediction
+    from predictions.services.history import history_page
+    from predictions.services.prediction_pipeline import run_batch_prediction
+
+    if connection.vendor != "sqlite":
+        raise CommandError("The sqlite suite needs the SQLite backend")
+
+    rows = random_inputs(options["rows"])
+    results = run_batch_prediction(rows)
+    threads = options["threads"]
+    settings_dict = connections.settings["default"]
+    configured = {key: settings_dict[key] for key in ("NAME", "CONN_MAX_AGE", "OPTIONS")}
+
+    # Work on a copy of the database, so journal modes can be switched
+    # and the inserts thrown away
+    fd, copy = tempfile.mkstemp(suffix=".sqlite3")
+    os.close(fd)
+    source = sqlite3.connect(configured["NAME"])
+    with sqlite3.connect(copy) as target:
+        source.backup(target)
+    source.close()
+
+    def run(profile):
+        connection.close()
+        settings_dict.update(NAME=copy, **profile)
+        user = User.objects.get_or_create(username="__benchmark_sqlite__")[0]
+        Prediction.objects.filter(user=user).delete()
+        fill_history(user, 1000, rows[:100], results[:100])
+
+        writes, reads, errors = [], [], []
+
+        def one(i):
+            start = time.perf_counter()
+            try:
+                if i % 2:
+                    history_page(user, ["id", "top_prediction", "created_at"], 50)
+                    reads.append(time.perf_counter() - start)
+                else:
+                    row = rows[i]
+                    Prediction.objects.create(
+                        user=user,
+                        nitrogen=row["N"], phosphorus=row["P"], potassium=row["K"],
+                        temperature=row["temperature"], humidity=row["humidity"],
+                        rainfall=row["rainfall"], ph=row["ph"],
+                        result=results[i],
+                    )
+                    writes.append(time.perf_counter() - start)
+            except DatabaseError:
+                errors.append(time.perf_counter() - start)
+            finally:
+                # End of "request": CONN_MAX_AGE decides whether to reconnect
+                close_old_connections()
+
+        # Uncontended write cost, to separate out time spent on the lock
+        for i in range(0, 40, 2):
+            one(i)
+        baseline = float(np.median(writes))
+        writes.clear()
+        reads.clear()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(one, range(len(rows))))
+        elapsed = time.perf_counter() - start
+
+        lock_wait = sum(max(0.0, latency - baseline) for latency in writes)
+        return {
+            "ops/s": len(rows) / elapsed,
+            "write p99 ms": np.percentile(writes, 99) * 1000 if writes else 0.0,
+            "read p99 ms": np.percentile(reads, 99) * 1000 if reads else 0.0,
+            "lock wait s": lock_wait,
+            "locked errors": len(errors),
+        }
+
+    profiles = {
+        "default": DEFAULT_SQLITE_PROFILE,
+        "configured": {key: configured[key] for key in ("CONN_MAX_AGE", "OPTIONS")},
+        "immediate": {
+            "CONN_MAX_AGE": configured["CONN_MAX_AGE"],
+            "OPTIONS": {**configured["OPTIONS"], "transaction_mode": "IMMEDIATE"},
+        },
+    }
+    try:
+        measured = {label: run(profile) for label, profile in profiles.items()}
+    finally:
+        connection.close()
+        settings_dict.update(configured)
+        for path in (copy, copy + "-wal", copy + "-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    command.stdout.write(
+        f"{len(rows)} operations (half inserts, half history pages) "
+        f"from {threads} threads"
+    )
+    command.stdout.write(f"{'':14}" + "".join(f" {label:>10}" for label in measured))
+    for key in measured["default"]:
+        command.stdout.write(
+            f"{key:14}" + "".join(f" {result[key]:10.1f}" for result in measured.values())
+        )
+
+
+SUITES = {
+    "anytime": bench_anytime,
+    "archive": bench_archive,
+    "batch": bench_batch,
+    "compiled": bench_compiled,
+    "contributions": bench_contributions,
+    "envelopes": bench_envelopes,
+    "export": bench_export,
+    "history": bench_history,
+    "insights": bench_insights,
+    "lookup-grid": bench_lookup_grid,
+    "memory": bench_memory,
+    "result-format": bench_result_format,
+    "sensitivity": bench_sensitivity,
+    "sqlite": bench_sqlite,
+    "thresholds": bench_thresholds,
+    "top-crop": bench_top_crop,
+    "trends": bench_trends,
+    "microbatch": bench_microbatch,
+    "write-behind": bench_write_behind,
+}
+
+
+class Command(BaseCommand):
+    help = "Runs prediction pipeline micro-benchmarks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("suite", choices=sorted(SUITES))
+        parser.add_argument("--rows", type=int, default=1000)
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument("--batch-size", type=int, default=32)
+        parser.add_argument("--wait-ms", type=float, default=2.0)
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--bins", type=int, default=6)
+        parser.add_argument("--history-rows", type=int, default=50000)
+        parser.add_argument("--memory-ceiling-mb", type=float, default=32)
+
+    def handle(self, *args, **options):
+        if options["rows"] < 1:
+            raise CommandError("--rows must be positive")
+
+        SUITES[options["suite"]](self, options)
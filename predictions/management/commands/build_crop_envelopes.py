@@ -0,0 +1,97 @@
+"""
+Precomputes the per-crop requirement envelopes for a model version.
+
+    python manage.py build_crop_envelopes --samples-per-leaf 16
+
+Writes crop_envelopes.npz next to the version's model files. Predictions
+then report the feasible crops and crop-specific suitability ranges, and
+/api/predict/feasibility/ starts answering.
+
+Predictions and their history use the snapshot taken into
+ModelVersionMetadata when the version's first prediction was stored;
+rebuilding afterwards only changes /api/predict/feasibility/.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ml.envelopes import (
+    DEFAULT_MIN_CONFIDENCE,
+    DEFAULT_QUANTILES,
+    DEFAULT_SAMPLES_PER_LEAF,
+    CropEnvelopes,
+    envelope_path,
+)
+from ml.predictor import registry
+
+
+class Command(BaseCommand):
+    help = "Builds the per-crop requirement envelope index for a model version."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model-version", help="Defaults to the current version.")
+        parser.add_argument(
+            "--samples-per-leaf", type=int, default=DEFAULT_SAMPLES_PER_LEAF
+        )
+        parser.add_argument(
+            "--min-confidence", type=float, default=DEFAULT_MIN_CONFIDENCE
+        )
+        parser.add_argument(
+            "--quantiles",
+            type=float,
+            nargs=2,
+            default=DEFAULT_QUANTILES,
+            metavar=("LOW", "HIGH"),
+            help="Per-feature quantiles of the confident probes that bound "
+                 "each envelope.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            version = (
+                registry.get(options["model_version"])
+                if options["model_version"]
+                else registry.current()
+            )
+        except LookupError as exc:
+            raise CommandError(str(exc))
+
+        if options["samples_per_leaf"] < 1:
+            raise CommandError("--samples-per-leaf must be positive")
+
+        low_q, high_q = options["quantiles"]
+        if not 0 <= low_q < high_q <= 1:
+            raise CommandError("--quantiles must satisfy 0 <= LOW < HIGH <= 1")
+
+        start = time.perf_counter()
+        try:
+            envelopes = CropEnvelopes.build(
+                version,
+                samples_per_leaf=options["samples_per_leaf"],
+                min_confidence=options["min_confidence"],
+                quantiles=(low_q, high_q),
+                seed=options["seed"],
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        elapsed = time.perf_counter() - start
+
+        path = envelope_path(version)
+        envelopes.save(path)
+
+        empty = [
+            str(crop)
+            for crop, present in zip(envelopes.classes, envelopes.has_envelope)
+            if not present
+        ]
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Built envelopes for {len(envelopes.classes)} crops of {version.name} "
+            f"in {elapsed:.1f}s -> {path}"
+        ))
+        if empty:
+            self.stdout.write(self.style.WARNING(
+                f"No confident probes for: {', '.join(empty)}"
+            ))
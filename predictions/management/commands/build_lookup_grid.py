@@ -0,0 +1,74 @@
+"""
+Precomputes the what-if lookup grid for a model version.
+
+    python manage.py build_lookup_grid --bins 8 --feature-bins rainfall=24
+
+Writes lookup_grid.npz next to the version's model files; /api/predict/what-if/
+picks it up on the next request if its agreement with the model, measured
+while building, reaches PREDICTION_WHAT_IF_MIN_AGREEMENT. Size is the product
+of the bin counts (3 bytes per point), so 8 bins for all 7 features is ~6 MB.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ml.lookup_grid import DEFAULT_BINS, LookupGrid, grid_path
+from ml.predictor import registry
+
+
+class Command(BaseCommand):
+    help = "Builds the precomputed what-if lookup grid for a model version."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model-version", help="Defaults to the current version.")
+        parser.add_argument("--bins", type=int, default=DEFAULT_BINS)
+        parser.add_argument(
+            "--feature-bins",
+            nargs="*",
+            default=[],
+            metavar="FEATURE=N",
+            help="Per-feature bin counts, e.g. rainfall=24 ph=16",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            version = (
+                registry.get(options["model_version"])
+                if options["model_version"]
+                else registry.current()
+            )
+        except LookupError as exc:
+            raise CommandError(str(exc))
+
+        bins = {feature: options["bins"] for feature in version.features}
+        for item in options["feature_bins"]:
+            feature, _, count = item.partition("=")
+            if feature not in bins or not count.isdigit():
+                raise CommandError(f"Invalid --feature-bins entry: {item}")
+            bins[feature] = int(count)
+
+        start = time.perf_counter()
+        try:
+            grid = LookupGrid.build(version, bins=bins)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        elapsed = time.perf_counter() - start
+
+        path = grid_path(version)
+        grid.save(path)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Built {grid.top_class.size:,} grid points for {version.name} "
+            f"in {elapsed:.1f}s ({grid.nbytes / 1e6:.1f} MB) -> {path}"
+        ))
+
+        floor = settings.PREDICTION_WHAT_IF_MIN_AGREEMENT
+        message = f"Agreement with the model: {grid.agreement:.1%} (floor {floor:.1%})"
+        if grid.agreement < floor:
+            self.stdout.write(self.style.WARNING(
+                f"{message}; what-if sweeps will run the model instead"
+            ))
+        else:
+            self.stdout.write(message)
@@ -0,0 +1,55 @@
+"""
+Writes a pickled crop model as a memory-mappable array bundle.
+
+    python manage.py export_model_bundle [--model-version NAME]
+
+Once crop_model_bundle/ exists next to the pickle, the model registry
+maps it read-only instead of unpickling the forest in every worker.
+Delete the directory to fall back to the pickle.
+"""
+
+import os
+
+import joblib
+from django.core.management.base import BaseCommand, CommandError
+
+from ml.bundle import export_bundle
+from ml.compiled import compile_model
+from ml.predictor import registry
+from ml.registry import BUNDLE_DIRNAME, FEATURES_FILE, MODEL_FILE
+
+
+class Command(BaseCommand):
+    help = "Exports a crop model version as a memory-mappable array bundle."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--model-version",
+            default=registry.fallback_name,
+            help="Model version to export (defaults to the base model in ml/).",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            path = registry.path_for(options["model_version"])
+        except LookupError as exc:
+            raise CommandError(str(exc))
+
+        model_path = os.path.join(path, MODEL_FILE)
+        if not os.path.isfile(model_path):
+            raise CommandError(f"No {MODEL_FILE} in {path}")
+
+        model = joblib.load(model_path)
+        features = joblib.load(os.path.join(path, FEATURES_FILE))
+
+        forest = compile_model(model)
+        if forest is None:
+            raise CommandError("Only tree ensembles can be exported as a bundle")
+
+        output = os.path.join(path, BUNDLE_DIRNAME)
+        manifest = export_bundle(forest, features, output, source=MODEL_FILE)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {manifest['n_trees']} trees "
+            f"({len(forest.threshold)} nodes) to {output}"
+        ))
@@ -0,0 +1,40 @@
+"""
+Lists crop model versions and publishes the one workers should serve.
+
+    python manage.py model_versions
+    python manage.py model_versions --activate 2026-04-15
+
+Publishing rewrites ml/models/CURRENT; running workers notice it within
+ML_MODEL_POLL_SECONDS, load the version in the background and switch
+new requests over once it is ready.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ml.predictor import registry
+
+
+class Command(BaseCommand):
+    help = "Lists model versions or publishes one as current."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--activate", metavar="VERSION")
+
+    def handle(self, *args, **options):
+        name = options["activate"]
+
+        if name:
+            try:
+                registry.get(name)
+            except LookupError as exc:
+                raise CommandError(str(exc))
+
+            registry.publish(name)
+            self.stdout.write(self.style.SUCCESS(f"Published {name} as current"))
+            return
+
+        active = registry.current().name
+        versions = registry.versions() or [registry.fallback_name]
+        for version in versions:
+            marker = "*" if version == active else " "
+            self.stdout.write(f"{marker} {version}")
@@ -0,0 +1,312 @@
+"""
+Scores a CSV of soil tests offline, outside the web tier.
+
+    python manage.py predict_file tests.csv --output results.ndjson --workers 4
+    python manage.py predict_file tests.csv --output results.csv --user coop_admin
+
+The input needs one column per request field (nitrogen, phosphorus,
+potassium, temperature, humidity, rainfall, ph; the model names N, P, K
+are accepted too). Rows are read in chunks and fanned out to a process
+pool whose workers load the model once; each chunk is scored with one
+vectorized call. Output keeps the input order and has one record per
+input row, with an error instead of a result for rows that do not parse.
+"""
+
+import csv
+import io
+import json
+import math
+import os
+import resource
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from ml.predictor import registry
+from ml.thresholds import SUITABILITY
+
+FIELDS = [
+    "nitrogen", "phosphorus", "potassium",
+    "temperature", "humidity", "rainfall", "ph",
+]
+
+# Model feature names accepted as input headers
+HEADER_ALIASES = {"N": "nitrogen", "P": "phosphorus", "K": "potassium"}
+
+CSV_COLUMNS = (
+    ["line"]
+    + FIELDS
+    + [f"{name}_{rank}" for rank in (1, 2, 3) for name in ("crop", "confidence")]
+    + ["explanation"]
+    + [f"{label} status" for label, _, _ in SUITABILITY]
+    + ["feasible_crops", "model_version", "error"]
+)
+
+
+_version = None
+
+
+def _init_worker(model_version):
+    import django
+    from django.apps import apps
+
+    # Spawned workers start without Django configured
+    if not apps.ready:
+        django.setup()
+
+    global _version
+    _version = registry.get(model_version)
+
+
+def parse_row(row):
+    """
+    Returns (sample, None) with float fields, or (None, error).
+    """
+    sample = {}
+    for field in FIELDS:
+        value = row.get(field)
+        if value is None or not value.strip():
+            return None, f"Missing field: {field}"
+        try:
+            sample[field] = float(value)
+        except ValueError:
+            return None, f"{field} must be a number"
+        if not math.isfinite(sample[field]):
+            return None, f"{field} must be a finite number"
+    return sample, None
+
+
+def _format_csv(line, sample, result, error):
+    record = [line] + [sample.get(field, "") for field in FIELDS]
+
+    if result is None:
+        return record + [""] * (len(CSV_COLUMNS) - len(record) - 1) + [error]
+
+    top = result["predictions"] + [{"crop": "", "confidence": ""}] * 3
+    for prediction in top[:3]:
+        record += [prediction["crop"], prediction["confidence"]]
+
+    record.append(result["explanation"])
+    record += [
+        result["suitability_analysis"][label]["status"]
+        for label, _, _ in SUITABILITY
+    ]
+    record += [
+        ";".join(result.get("feasible_crops", [])),
+        result["model_version"],
+        "",
+    ]
+    return record
+
+
+def _format_ndjson(line, sample, result, error):
+    record = {"line": line, "input": sample}
+    if result is None:
+        record["error"] = error
+    else:
+        record["result"] = result
+    return json.dumps(record)
+
+
+def predict_chunk(chunk, output_format, keep_results):
+    """
+    Worker entry point. chunk: list of (line, raw CSV row).
+    Returns the formatted output records and, with keep_results,
+    the (sample, result) pairs to store.
+    """
+    from predictions.services.prediction_pipeline import (
+        run_batch_prediction,
+        to_input_data,
+    )
+
+    parsed = [(line, row, *parse_row(row)) for line, row in chunk]
+    valid = [(line, sample) for line, _, sample, error in parsed if error is None]
+
+    results = dict(zip(
+        [line for line, _ in valid],
+        run_batch_prediction(
+            [to_input_data(sample) for _, sample in valid], _version
+        ) if valid else [],
+    ))
+
+    if output_format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for line, row, sample, error in parsed:
+            writer.writerow(
+                _format_csv(line, sample or row, results.get(line), error)
+            )
+        output = buffer.getvalue()
+    else:
+        output = "".join(
+            _format_ndjson(line, sample or row, results.get(line), error) + "\n"
+            for line, row, sample, error in parsed
+        )
+
+    stored = [(sample, results[line]) for line, sample in valid] if keep_results else []
+    return output, len(valid), len(parsed) - len(valid), stored
+
+
+def read_chunks(reader, chunk_size):
+    # Line 1 is the header
+    numbered = enumerate(reader, start=2)
+    while True:
+        chunk = list(islice(numbered, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def normalize_header(fieldnames):
+    return [HEADER_ALIASES.get(name.strip(), name.strip()) for name in fieldnames]
+
+
+def peak_rss_mb(who):
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+class Command(BaseCommand):
+    help = "Scores a CSV of soil tests with a process pool and writes CSV or NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("input", help="CSV file, or - for stdin")
+        parser.add_argument("--output", required=True, help="Output file, or - for stdout")
+        parser.add_argument(
+            "--format",
+            choices=["csv", "ndjson"],
+            help="Defaults to the output file's extension, else ndjson.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+        parser.add_argument("--model-version", help="Defaults to the current version.")
+        parser.add_argument(
+            "--user",
+            help="Also store every prediction in the history of this username.",
+        )
+
+    def handle(self, *args, **options):
+        from django.contrib.auth.models import User
+
+        if options["chunk_size"] < 1 or options["workers"] < 1:
+            raise CommandError("--chunk-size and --workers must be positive")
+
+        output_format = options["format"] or (
+            "csv" if options["output"].endswith(".csv") else "ndjson"
+        )
+
+        user = None
+        if options["user"]:
+            try:
+                user = User.objects.get(username=options["user"])
+            except User.DoesNotExist:
+                raise CommandError(f"Unknown user: {options['user']}")
+
+        try:
+            version = (
+                registry.get(options["model_version"])
+                if options["model_version"]
+                else registry.current()
+            )
+        except LookupError as exc:
+            raise CommandError(str(exc))
+
+        source = (
+            sys.stdin if options["input"] == "-"
+            else open(options["input"], newline="", encoding="utf-8-sig")
+        )
+        target = (
+            sys.stdout if options["output"] == "-"
+            else open(options["output"], "w", newline="", encoding="utf-8")
+        )
+
+        try:
+            reader = csv.DictReader(source)
+            if reader.fieldnames is None:
+                raise CommandError("Input is empty")
+
+            reader.fieldnames = normalize_header(reader.fieldnames)
+            missing = [field for field in FIELDS if field not in reader.fieldnames]
+            if missing:
+                raise CommandError(f"Missing columns: {', '.join(missing)}")
+
+            if output_format == "csv":
+                csv.writer(target).writerow(CSV_COLUMNS)
+
+            totals = self.run_pool(
+                read_chunks(reader, options["chunk_size"]),
+                target,
+                version,
+                output_format,
+                user,
+                options["workers"],
+            )
+        finally:
+            if source is not sys.stdin:
+                source.close()
+            if target is not sys.stdout:
+                target.close()
+
+        scored, failed, elapsed = totals
+        workers = options["workers"]
+        cores = min(workers, os.cpu_count() or 1)
+        rate = scored / elapsed if elapsed else 0.0
+
+        self.stderr.write(self.style.SUCCESS(
+            f"Scored {scored:,} rows ({failed:,} invalid) with {version.name} "
+            f"in {elapsed:.1f}s: {rate:,.0f} rows/s, "
+            f"{rate / cores:,.0f} rows/s per core ({workers} workers, {cores} cores)"
+        ))
+        self.stderr.write(
+            f"Peak RSS: main {peak_rss_mb(resource.RUSAGE_SELF):.0f} MB, "
+            f"largest worker {peak_rss_mb(resource.RUSAGE_CHILDREN):.0f} MB"
+        )
+
+    def run_pool(self, chunks, target, version, output_format, user, workers):
+        """
+        Keeps at most two chunks per worker in flight and writes results
+        in input order as they complete.
+        """
+        from predictions.models import Prediction
+
+        scored = failed = 0
+        pending = deque()
+        start = time.perf_counter()
+
+        # Forked workers must not inherit the parent's database sockets
+        connections.close_all()
+
+        def drain(future):
+            nonlocal scored, failed
+            output, ok, bad, stored = future.result()
+            target.write(output)
+            scored += ok
+            failed += bad
+
+            if user is not None and stored:
+                Prediction.objects.bulk_create([
+                    Prediction(user=user, result=result, **sample)
+                    for sample, result in stored
+                ], batch_size=500)
+
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(version.name,),
+        ) as executor:
+            for chunk in chunks:
+                pending.append(executor.submit(
+                    predict_chunk, chunk, output_format, user is not None
+                ))
+                if len(pending) >= workers * 2:
+                    drain(pending.popleft())
+
+            while pending:
+                drain(pending.popleft())
+
+        return scored, failed, time.perf_counter() - start
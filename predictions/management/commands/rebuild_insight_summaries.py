@@ -0,0 +1,69 @@
+"""
+Checks or rebuilds the per-user insight summaries.
+
+    python manage.py rebuild_insight_summaries --check
+    python manage.py rebuild_insight_summaries --user alice
+
+Every summary is recomputed from the user's predictions and compared
+with the stored row. --check only reports drift (and exits non-zero if
+there is any); otherwise drifted or missing summaries are rewritten.
+"""
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from predictions.models import Prediction, UserInsightSummary
+
+
+class Command(BaseCommand):
+    help = "Checks or rebuilds the per-user insight summaries."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only this username.")
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Report drift without writing anything.",
+        )
+
+    def handle(self, *args, **options):
+        if options["user"]:
+            try:
+                user_ids = [User.objects.get(username=options["user"]).id]
+            except User.DoesNotExist:
+                raise CommandError(f"Unknown user: {options['user']}")
+        else:
+            user_ids = sorted(
+                set(Prediction.objects.values_list("user_id", flat=True).distinct())
+                | set(UserInsightSummary.objects.values_list("user_id", flat=True))
+            )
+
+        stored = UserInsightSummary.objects.in_bulk(user_ids)
+
+        drifted = []
+        for user_id in user_ids:
+            expected = UserInsightSummary.compute(user_id)
+            current = stored.get(user_id)
+
+            if current is not None and current.matches(expected):
+                continue
+
+            drifted.append(user_id)
+            self.stdout.write(
+                f"user {user_id}: "
+                + ("missing" if current is None else
+                   f"stored total {current.total}, actual {expected.total}")
+            )
+
+            if not options["check"]:
+                UserInsightSummary.rebuild(user_id)
+
+        summary = f"{len(drifted)} of {len(user_ids)} summaries out of date"
+        if options["check"]:
+            if drifted:
+                raise CommandError(summary)
+            self.stdout.write(self.style.SUCCESS(summary))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"{summary}; rebuilt {len(drifted)}"
+            ))
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.10 on 2026-10-18 13:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("predictions", "0005_alter_prediction_id"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="prediction",
+            index=models.Index(
+                fields=["user", "-created_at", "-id"],
+                name="prediction_user_created_idx",
+            ),
+        ),
+    ]
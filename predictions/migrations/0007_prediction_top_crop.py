@@ -0,0 +1,38 @@
+# Generated by Django 5.2.10 on 2026-10-18 13:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("predictions", "0006_prediction_user_created_idx"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="prediction",
+            name="top_confidence",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="prediction",
+            name="top_crop",
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="prediction",
+            index=models.Index(
+                fields=["user", "top_crop"],
+                name="prediction_user_crop_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="prediction",
+            index=models.Index(
+                fields=["user", "top_confidence"],
+                name="prediction_user_conf_idx",
+            ),
+        ),
+    ]
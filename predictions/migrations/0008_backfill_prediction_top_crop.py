@@ -0,0 +1,48 @@
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def top_prediction(result):
+    # Frozen copy of predictions.models.top_prediction
+    predictions = (result or {}).get("predictions") or []
+    if not predictions:
+        return None, None
+
+    top = predictions[0]
+    crop = top.get("crop") or top.get("label") or top.get("name")
+    return crop or None, top.get("confidence", 0)
+
+
+def backfill_top_crop(apps, schema_editor):
+    Prediction = apps.get_model("predictions", "Prediction")
+
+    # Batches keyed on id: SQLite gives no isolation between a running
+    # iterator and updates to the same table on one connection
+    last_id = 0
+    while True:
+        batch = list(
+            Prediction.objects.filter(id__gt=last_id)
+            .order_by("id")
+            .only("id", "result")[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+
+        for prediction in batch:
+            prediction.top_crop, prediction.top_confidence = top_prediction(
+                prediction.result
+            )
+
+        Prediction.objects.bulk_update(batch, ["top_crop", "top_confidence"])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("predictions", "0007_prediction_top_crop"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_top_crop, migrations.RunPython.noop),
+    ]
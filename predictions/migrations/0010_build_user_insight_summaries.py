@@ -0,0 +1,54 @@
+from django.db import migrations
+from django.db.models import Count, Min, Q, Sum
+
+AVERAGED_FIELDS = ("rainfall", "temperature", "ph", "humidity")
+
+
+def build_summaries(apps, schema_editor):
+    # Frozen copy of UserInsightSummary.rebuild for every user
+    Prediction = apps.get_model("predictions", "Prediction")
+    UserInsightSummary = apps.get_model("predictions", "UserInsightSummary")
+
+    groups = (
+        Prediction.objects.values("user_id", "top_crop")
+        .annotate(
+            count=Count("id"),
+            first_id=Min("id"),
+            high=Count("id", filter=Q(top_confidence__gte=0.7)),
+            medium=Count(
+                "id", filter=Q(top_confidence__gte=0.4, top_confidence__lt=0.7)
+            ),
+            low=Count("id", filter=Q(top_confidence__lt=0.4)),
+            **{field: Sum(field) for field in AVERAGED_FIELDS},
+        )
+        .order_by("first_id")
+    )
+
+    summaries = {}
+    for group in groups:
+        summary = summaries.get(group["user_id"])
+        if summary is None:
+            summary = summaries[group["user_id"]] = UserInsightSummary(
+                user_id=group["user_id"], crop_counts={}
+            )
+
+        summary.total += group["count"]
+        if group["top_crop"]:
+            summary.crop_counts[group["top_crop"]] = group["count"]
+        for bucket in ("high", "medium", "low"):
+            setattr(summary, bucket, getattr(summary, bucket) + group[bucket])
+        for field in AVERAGED_FIELDS:
+            name = f"{field}_sum"
+            setattr(summary, name, getattr(summary, name) + (group[field] or 0))
+
+    UserInsightSummary.objects.bulk_create(summaries.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("predictions", "0009_userinsightsummary"),
+    ]
+
+    operations = [
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.10 on 2026-10-18 13:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("predictions", "0010_build_user_insight_summaries"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="userinsightsummary",
+            name="revision",
+            field=models.IntegerField(default=0),
+        ),
+    ]
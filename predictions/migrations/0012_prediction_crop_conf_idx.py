@@ -0,0 +1,21 @@
+# Generated by Django 5.2.10 on 2026-10-18 13:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("predictions", "0011_userinsightsummary_revision"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="prediction",
+            index=models.Index(
+                fields=["top_crop", "top_confidence"],
+                name="prediction_crop_conf_idx",
+            ),
+        ),
+    ]
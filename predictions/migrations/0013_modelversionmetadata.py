@@ -0,0 +1,21 @@
+# Generated by Django 5.2.10 on 2026-10-18 13:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("predictions", "0012_prediction_crop_conf_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ModelVersionMetadata",
+            fields=[
+                ("name", models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ("features", models.JSONField()),
+                ("classes", models.JSONField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,193 @@
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+# Frozen copies of predictions.services.result_format and the tables it
+# encodes against (ml.registry.FEATURE_NAME_MAP, ml.thresholds.SUITABILITY)
+COMPACT_FORMAT = 1
+
+FEATURE_NAME_MAP = {
+    "N": "Nitrogen",
+    "P": "Phosphorus",
+    "K": "Potassium",
+    "temperature": "Temperature",
+    "humidity": "Humidity",
+    "ph": "Soil pH",
+    "rainfall": "Rainfall",
+}
+
+SUITABILITY_OUTCOMES = [
+    ("Rainfall", [
+        ("Ideal", "good"),
+        ("Acceptable", "moderate"),
+        ("Acceptable", "moderate"),
+        ("Low Suitability", "poor"),
+    ]),
+    ("Temperature", [
+        ("Optimal", "good"),
+        ("Moderate", "moderate"),
+        ("Moderate", "moderate"),
+        ("High Risk", "poor"),
+    ]),
+    ("Soil pH", [
+        ("Balanced", "good"),
+        ("Slightly Off", "moderate"),
+        ("Slightly Off", "moderate"),
+        ("Unsuitable", "poor"),
+    ]),
+    ("Nitrogen", [
+        ("Sufficient", "good"),
+        ("Moderate", "moderate"),
+        ("Low", "poor"),
+    ]),
+]
+
+
+def compact_result(result, classes, features):
+    if not isinstance(result, dict) or result.get("f") == COMPACT_FORMAT:
+        return result
+
+    try:
+        class_index = {str(crop): i for i, crop in enumerate(classes)}
+        predictions = result["predictions"]
+
+        importance = dict(zip(
+            result["feature_importance"]["labels"],
+            result["feature_importance"]["values"],
+        ))
+
+        compact = {
+            "f": COMPACT_FORMAT,
+            "m": result["model_version"],
+            "k": [class_index[entry["crop"]] for entry in predictions],
+            "p": [entry["confidence"] for entry in predictions],
+            "s": [
+                outcomes.index((
+                    result["suitability_analysis"][label]["status"],
+                    result["suitability_analysis"][label]["level"],
+                ))
+                for label, outcomes in SUITABILITY_OUTCOMES
+            ],
+            "i": [
+                importance[FEATURE_NAME_MAP.get(feature, feature)]
+                for feature in features
+            ],
+        }
+    except (KeyError, TypeError, ValueError):
+        return result
+
+    return compact
+
+
+# The only version stored before this migration: the model files under
+# ml/, as the registry served them. Results of any other version are left
+# as they are, since reading its files here would load its model.
+BASE_VERSION = {
+    "name": "base",
+    "features": ["N", "P", "K", "temperature", "humidity", "ph", "rainfall"],
+    "classes": [
+        "apple", "banana", "blackgram", "chickpea", "coconut", "coffee",
+        "cotton", "grapes", "jute", "kidneybeans", "lentil", "maize", "mango",
+        "mothbeans", "mungbean", "muskmelon", "orange", "papaya",
+        "pigeonpeas", "pomegranate", "rice", "watermelon",
+    ],
+}
+
+
+def version_metadata(apps, name):
+    ModelVersionMetadata = apps.get_model("predictions", "ModelVersionMetadata")
+
+    metadata = ModelVersionMetadata.objects.filter(name=name).first()
+    if metadata is None and name == BASE_VERSION["name"]:
+        metadata = ModelVersionMetadata.objects.create(**BASE_VERSION)
+    return metadata
+
+
+def compact_results(apps, schema_editor):
+    Prediction = apps.get_model("predictions", "Prediction")
+
+    metadata = {}
+    last_id = 0
+    while True:
+        batch = list(
+            Prediction.objects.filter(id__gt=last_id)
+            .order_by("id")
+            .only("id", "result")[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+
+        changed = []
+        for prediction in batch:
+            result = prediction.result
+            name = result.get("model_version") if isinstance(result, dict) else None
+            if not name:
+                continue
+
+            if name not in metadata:
+                metadata[name] = version_metadata(apps, name)
+            if metadata[name] is None:
+                continue
+
+            compact = compact_result(result, metadata[name].classes, metadata[name].features)
+            if compact is not result:
+                prediction.result = compact
+                changed.append(prediction)
+
+        Prediction.objects.bulk_update(changed, ["result"])
+        last_id = batch[-1].id
+
+
+def expand_results(apps, schema_editor):
+    # Rebuilding responses needs the explanation and suitability code
+    # itself, which cannot be frozen here
+    from ml.envelopes import envelopes_for
+    from predictions.services.prediction_pipeline import REQUIRED_FIELDS, to_input_data
+    from predictions.services.result_format import expand_results, is_compact
+
+    Prediction = apps.get_model("predictions", "Prediction")
+
+    metadata = {}
+
+    def metadata_for(name):
+        if name not in metadata:
+            metadata[name] = version_metadata(apps, name)
+            if metadata[name] is not None:
+                # The snapshot column is gone at this point; read the file
+                metadata[name].crop_envelopes = envelopes_for(name)
+        return metadata[name]
+
+    last_id = 0
+    while True:
+        batch = list(
+            Prediction.objects.filter(id__gt=last_id)
+            .order_by("id")
+            .only("id", "result", *REQUIRED_FIELDS)[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+
+        changed = [p for p in batch if is_compact(p.result)]
+        results = expand_results(
+            [p.result for p in changed],
+            [
+                to_input_data({field: getattr(p, field) for field in REQUIRED_FIELDS})
+                for p in changed
+            ],
+            metadata_for,
+        )
+        for prediction, result in zip(changed, results):
+            prediction.result = result
+
+        Prediction.objects.bulk_update(changed, ["result"])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("predictions", "0013_modelversionmetadata"),
+    ]
+
+    operations = [
+        migrations.RunPython(compact_results, expand_results),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.10 on 2026-10-18 14:15
+
+from django.db import migrations, models
+
+
+def snapshot_envelopes(apps, schema_editor):
+    # Reads crop_envelopes.npz from each version's directory; the model
+    # itself is never loaded
+    from ml.envelopes import envelopes_for
+
+    ModelVersionMetadata = apps.get_model("predictions", "ModelVersionMetadata")
+
+    for metadata in ModelVersionMetadata.objects.filter(envelopes__isnull=True):
+        envelopes = envelopes_for(metadata.name)
+        if envelopes is not None:
+            metadata.envelopes = envelopes.snapshot()
+            metadata.save(update_fields=["envelopes"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("predictions", "0015_historyarchive"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="modelversionmetadata",
+            name="envelopes",
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.RunPython(snapshot_envelopes, migrations.RunPython.noop),
+    ]
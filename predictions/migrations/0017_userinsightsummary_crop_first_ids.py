@@ -0,0 +1,57 @@
+# Generated by Django 5.2.10 on 2026-10-18 14:50
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def fill_first_ids(apps, schema_editor):
+    # Earliest live or archived prediction per (user, crop)
+    Prediction = apps.get_model("predictions", "Prediction")
+    HistoryArchive = apps.get_model("predictions", "HistoryArchive")
+    UserInsightSummary = apps.get_model("predictions", "UserInsightSummary")
+
+    first_ids = {}
+    rows = (
+        Prediction.objects.exclude(top_crop__isnull=True)
+        .order_by()
+        .values("user_id", "top_crop")
+        .annotate(first_id=Min("id"))
+    )
+    for row in rows:
+        first_ids.setdefault(row["user_id"], {})[row["top_crop"]] = row["first_id"]
+
+    archives = HistoryArchive.objects.filter(kind="prediction").values_list(
+        "user_id", "groups"
+    )
+    for user_id, groups in archives.iterator():
+        crops = first_ids.setdefault(user_id, {})
+        for group in groups:
+            if group["top_crop"]:
+                crops[group["top_crop"]] = min(
+                    crops.get(group["top_crop"], group["first_id"]), group["first_id"]
+                )
+
+    summaries = list(UserInsightSummary.objects.filter(user_id__in=first_ids))
+    for summary in summaries:
+        summary.crop_first_ids = {
+            crop: first_ids[summary.user_id][crop]
+            for crop in summary.crop_counts
+            if crop in first_ids[summary.user_id]
+        }
+    UserInsightSummary.objects.bulk_update(summaries, ["crop_first_ids"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictions', '0016_modelversionmetadata_envelopes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userinsightsummary',
+            name='crop_first_ids',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.RunPython(fill_first_ids, migrations.RunPython.noop),
+    ]
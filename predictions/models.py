@@ -1,6 +1,159 @@
-from django.db import models
+import itertools
+from contextlib import contextmanager
+from functools import cached_property
+
+from django.db import DEFAULT_DB_ALIAS, connections, models, transaction
+from django.db.models import Avg, Count, Min, Q, Sum
 from django.contrib.auth.models import User
 
+from .services.result_format import compact_result, expand_results, is_compact
+
+# Inputs whose per-user average the insights report
+AVERAGED_FIELDS = ("rainfall", "temperature", "ph", "humidity")
+
+# Confidence bucket -> inclusive lower bound of top_confidence
+CONFIDENCE_BUCKETS = {"high": 0.7, "medium": 0.4, "low": None}
+
+
+def top_prediction(result):
+    """
+    (crop, confidence) of the first entry in result["predictions"],
+    or (None, None) when there is none.
+    """
+    if is_compact(result):
+        metadata = ModelVersionMetadata.for_version(result["m"])
+        if metadata is None or not result["k"]:
+            return None, None
+        return metadata.classes[result["k"][0]], result["p"][0]
+
+    predictions = (result or {}).get("predictions") or []
+    if not predictions:
+        return None, None
+
+    top = predictions[0]
+    crop = top.get("crop") or top.get("label") or top.get("name")
+    return crop or None, top.get("confidence", 0)
+
+
+def confidence_bucket(confidence):
+    if confidence is None:
+        return None
+    for bucket, lower in CONFIDENCE_BUCKETS.items():
+        if lower is None or confidence >= lower:
+            return bucket
+
+
+@contextmanager
+def write_atomic(using=None):
+    """
+    transaction.atomic() for blocks that read before they write.
+
+    SQLite starts a DEFERRED transaction as a reader, and a reader whose
+    snapshot is stale cannot wait for the write lock: its first write
+    fails at once with "database is locked" if another connection
+    committed in between. A no-op UPDATE as the first statement takes
+    the write lock up front, where busy_timeout still applies. The
+    IMMEDIATE transaction mode does the same for every block.
+    """
+    with transaction.atomic(using=using):
+        connection = connections[using or DEFAULT_DB_ALIAS]
+        if connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE {UserInsightSummary._meta.db_table} "
+                    "SET revision = revision WHERE 0"
+                )
+        yield
+
+
+def insight_groups(queryset):
+    """
+    The insight totals of `queryset`, one dict per (user_id, top_crop)
+    in order of first appearance: count, a count per confidence bucket
+    and the sum of every averaged field.
+    """
+    buckets = {}
+    upper = None
+    for bucket, lower in CONFIDENCE_BUCKETS.items():
+        q = Q(top_confidence__isnull=False)
+        if lower is not None:
+            q &= Q(top_confidence__gte=lower)
+        if upper is not None:
+            q &= Q(top_confidence__lt=upper)
+        buckets[bucket] = q
+        upper = lower
+
+    return (
+        queryset.order_by()
+        .values("user_id", "top_crop")
+        .annotate(
+            count=Count("id"),
+            first_id=Min("id"),
+            **{bucket: Count("id", filter=q) for bucket, q in buckets.items()},
+            **{field: Sum(field) for field in AVERAGED_FIELDS},
+        )
+        .order_by("first_id")
+    )
+
+
+class PredictionQuerySet(models.QuerySet):
+
+    def bulk_create(self, objs, *args, **kwargs):
+        # bulk_create skips save(), so fill the denormalized columns,
+        # compact the results and update the insight summaries here
+        objs = list(objs)
+        for obj in objs:
+            obj.fill_top_prediction()
+            obj.compact_result()
+
+        with transaction.atomic(using=self.db):
+            created = super().bulk_create(objs, *args, **kwargs)
+            UserInsightSummary.apply(
+                [obj.insight_group() for obj in created], sign=1
+            )
+        return created
+
+    def delete(self):
+        with write_atomic(using=self.db):
+            groups = list(insight_groups(self))
+            deleted = super().delete()
+            UserInsightSummary.apply(groups, sign=-1)
+        return deleted
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def with_top_crop(self):
+        """Predictions whose result names a top crop."""
+        return self.filter(top_crop__isnull=False).exclude(top_crop="")
+
+    def filter_top_crop(self, crop=None, min_confidence=None, max_confidence=None):
+        """
+        Filters on the top crop and its confidence (inclusive bounds)
+        in SQL, through the denormalized, indexed columns.
+        """
+        queryset = self.with_top_crop()
+        if crop is not None:
+            queryset = queryset.filter(top_crop=crop)
+        if min_confidence is not None:
+            queryset = queryset.filter(top_confidence__gte=min_confidence)
+        if max_confidence is not None:
+            queryset = queryset.filter(top_confidence__lte=max_confidence)
+        return queryset
+
+    def top_crop_counts(self):
+        """
+        [{"top_crop", "count", "average_confidence"}], most frequent
+        first, grouped in SQL.
+        """
+        return list(
+            self.with_top_crop()
+            .order_by()
+            .values("top_crop")
+            .annotate(count=Count("id"), average_confidence=Avg("top_confidence"))
+            .order_by("-count", "top_crop")
+        )
+
 
 class Prediction(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -13,10 +166,450 @@ class Prediction(models.Model):
     rainfall = models.FloatField()
     ph = models.FloatField()
 
-    # store prediction output as JSON
+    # Prediction output in the compact form of services.result_format;
+    # full_result rebuilds the response
     result = models.JSONField()
 
+    # copied out of result on save, for DB-side aggregation
+    top_crop = models.CharField(max_length=50, null=True, blank=True)
+    top_confidence = models.FloatField(null=True, blank=True)
+
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = PredictionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of a user's history, newest first
+            models.Index(
+                fields=["user", "-created_at", "-id"],
+                name="prediction_user_created_idx",
+            ),
+            models.Index(
+                fields=["user", "top_crop"],
+                name="prediction_user_crop_idx",
+            ),
+            models.Index(
+                fields=["user", "top_confidence"],
+                name="prediction_user_conf_idx",
+            ),
+            # Analytics across users: filter_top_crop, top_crop_counts
+            models.Index(
+                fields=["top_crop", "top_confidence"],
+                name="prediction_crop_conf_idx",
+            ),
+        ]
+
+    def fill_top_prediction(self):
+        self.top_crop, self.top_confidence = top_prediction(self.result)
+
+    def compact_result(self):
+        """Replaces a full response in result with its compact form."""
+        if is_compact(self.result) or not isinstance(self.result, dict):
+            return
+
+        metadata = ModelVersionMetadata.record(self.result.get("model_version"))
+        if metadata is not None:
+            self.result = compact_result(
+                self.result, metadata.classes, metadata.features
+            )
+
+    def input_data(self):
+        """The inputs keyed by model feature (N, P, K, ...)."""
+        from .services.prediction_pipeline import REQUIRED_FIELDS, to_input_data
+
+        return to_input_data({field: getattr(self, field) for field in REQUIRED_FIELDS})
+
+    @cached_property
+    def full_result(self):
+        """The response as returned when the prediction was made."""
+        return expand_results(
+            [self.result], [self.input_data()], ModelVersionMetadata.for_version
+        )[0]
+
+    def insight_group(self):
+        """This row's contribution, shaped like an insight_groups() entry."""
+        bucket = confidence_bucket(self.top_confidence)
+        return {
+            "user_id": self.user_id,
+            "top_crop": self.top_crop,
+            "count": 1,
+            "first_id": self.pk,
+            **{name: int(name == bucket) for name in CONFIDENCE_BUCKETS},
+            **{field: getattr(self, field) for field in AVERAGED_FIELDS},
+        }
+
+    def save(self, *args, **kwargs):
+        self.fill_top_prediction()
+        self.compact_result()
+        self.__dict__.pop("full_result", None)
+
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "result" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "top_crop", "top_confidence"}
+
+        with write_atomic(using=kwargs.get("using")):
+            previous = None
+            if not self._state.adding and self.pk is not None:
+                previous = Prediction.objects.filter(pk=self.pk).first()
+
+            super().save(*args, **kwargs)
+
+            if previous is not None:
+                UserInsightSummary.apply([previous.insight_group()], sign=-1)
+            UserInsightSummary.apply([self.insight_group()], sign=1)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get("using")):
+            group = self.insight_group()
+            deleted = super().delete(*args, **kwargs)
+            UserInsightSummary.apply([group], sign=-1)
+        return deleted
+
     def __str__(self):
         return f"Prediction by {self.user.username} at {self.created_at}"
+
+
+class UserInsightSummary(models.Model):
+    """
+    Running insight totals per user, kept in step with Prediction
+    inside the same transaction as every create and delete, so the
+    insights endpoint reads one row instead of the whole history.
+    """
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="insight_summary",
+    )
+
+    total = models.IntegerField(default=0)
+
+    # crop -> count
+    crop_counts = models.JSONField(default=dict)
+    # crop -> id of its earliest prediction, which breaks count ties;
+    # JSON key order is not kept by every backend (jsonb sorts keys)
+    crop_first_ids = models.JSONField(default=dict)
+
+    high = models.IntegerField(default=0)
+    medium = models.IntegerField(default=0)
+    low = models.IntegerField(default=0)
+
+    rainfall_sum = models.FloatField(default=0)
+    temperature_sum = models.FloatField(default=0)
+    ph_sum = models.FloatField(default=0)
+    humidity_sum = models.FloatField(default=0)
+
+    # Bumped whenever existing predictions are removed or changed, so
+    # caches of past periods (services.trends) can tell they are stale.
+    # New predictions only ever land in the current period.
+    revision = models.IntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def apply(cls, groups, sign):
+        """
+        Adds (sign=1) or removes (sign=-1) insight_groups()-shaped
+        totals. Call inside the transaction that changes the rows.
+        """
+        by_user = {}
+        for group in groups:
+            by_user.setdefault(group["user_id"], []).append(group)
+
+        for user_id in sorted(by_user):
+            summary, _ = (
+                cls.objects.select_for_update().get_or_create(user_id=user_id)
+            )
+            # Crops that lost their earliest prediction but not all of them
+            stale = set()
+            for group in by_user[user_id]:
+                crop = group["top_crop"]
+                if sign < 0 and crop and summary.crop_first_ids.get(crop) == group["first_id"]:
+                    stale.add(crop)
+                summary.add(group, sign)
+            stale &= summary.crop_counts.keys()
+            if stale:
+                summary.refresh_first_ids(stale)
+            if sign < 0:
+                summary.revision += 1
+            summary.save()
+
+    def add(self, group, sign):
+        self.total += sign * group["count"]
+
+        crop = group["top_crop"]
+        if crop:
+            count = self.crop_counts.get(crop, 0) + sign * group["count"]
+            if count > 0:
+                self.crop_counts[crop] = count
+            else:
+                self.crop_counts.pop(crop, None)
+                self.crop_first_ids.pop(crop, None)
+
+            first_id = self.crop_first_ids.get(crop)
+            if sign > 0 and (first_id is None or group["first_id"] < first_id):
+                self.crop_first_ids[crop] = group["first_id"]
+
+        for bucket in CONFIDENCE_BUCKETS:
+            setattr(self, bucket, getattr(self, bucket) + sign * group[bucket])
+
+        for field in AVERAGED_FIELDS:
+            total = getattr(self, f"{field}_sum") + sign * (group[field] or 0)
+            # Nothing left to average; drop accumulated rounding error
+            setattr(self, f"{field}_sum", total if self.total > 0 else 0.0)
+
+    def refresh_first_ids(self, crops):
+        """Re-reads the earliest live or archived prediction of `crops`."""
+        first_ids = dict(
+            Prediction.objects.filter(user_id=self.user_id, top_crop__in=crops)
+            .order_by()
+            .values("top_crop")
+            .annotate(first_id=Min("id"))
+            .values_list("top_crop", "first_id")
+        )
+        for group in HistoryArchive.prediction_groups(self.user_id):
+            crop = group["top_crop"]
+            if crop in crops:
+                first_ids[crop] = min(first_ids.get(crop, group["first_id"]), group["first_id"])
+
+        for crop in crops:
+            self.crop_first_ids[crop] = first_ids[crop]
+
+    def reset(self):
+        self.total = self.high = self.medium = self.low = 0
+        self.crop_counts = {}
+        self.crop_first_ids = {}
+        for field in AVERAGED_FIELDS:
+            setattr(self, f"{field}_sum", 0.0)
+
+    @classmethod
+    def compute(cls, user_id):
+        """
+        An unsaved summary recomputed from the user's predictions,
+        live and archived.
+        """
+        by_crop = {}
+        for group in itertools.chain(
+            HistoryArchive.prediction_groups(user_id),
+            insight_groups(Prediction.objects.filter(user_id=user_id)),
+        ):
+            total = by_crop.get(group["top_crop"])
+            if total is None:
+                by_crop[group["top_crop"]] = dict(group)
+                continue
+            total["first_id"] = min(total["first_id"], group["first_id"])
+            for key in ("count", *CONFIDENCE_BUCKETS, *AVERAGED_FIELDS):
+                total[key] = (total[key] or 0) + (group[key] or 0)
+
+        summary = cls(user_id=user_id)
+        summary.reset()
+        for group in sorted(by_crop.values(), key=lambda group: group["first_id"]):
+            summary.add(group, 1)
+        return summary
+
+    @classmethod
+    def rebuild(cls, user_id):
+        """Recomputes and stores one user's summary."""
+        with write_atomic():
+            current = cls.objects.select_for_update().filter(user_id=user_id).first()
+            summary = cls.compute(user_id)
+            summary.revision = current.revision + 1 if current else 0
+            summary.save()
+        return summary
+
+    def matches(self, other):
+        """Same counts, and sums equal up to float rounding."""
+        return (
+            self.total == other.total
+            and self.crop_counts == other.crop_counts
+            and self.crop_first_ids == other.crop_first_ids
+            and all(
+                getattr(self, bucket) == getattr(other, bucket)
+                for bucket in CONFIDENCE_BUCKETS
+            )
+            and all(
+                abs(getattr(self, f"{field}_sum") - getattr(other, f"{field}_sum"))
+                <= 1e-6 * max(1.0, abs(getattr(other, f"{field}_sum")))
+                for field in AVERAGED_FIELDS
+            )
+        )
+
+    def as_insights(self):
+        """The /api/insights/ payload."""
+        crop_frequency = dict(self.crop_counts)
+
+        # Ties go to the crop recommended first, as Counter.most_common did
+        most_recommended_crop = None
+        if crop_frequency:
+            most_recommended_crop = max(
+                crop_frequency,
+                key=lambda crop: (crop_frequency[crop], -self.crop_first_ids[crop]),
+            )
+
+        return {
+            "total_predictions": self.total,
+            "most_recommended_crop": most_recommended_crop,
+            "crop_frequency": crop_frequency,
+            "confidence_distribution": {
+                bucket: getattr(self, bucket) for bucket in CONFIDENCE_BUCKETS
+            },
+            "average_conditions": {
+                field: round(getattr(self, f"{field}_sum") / self.total, 2)
+                for field in AVERAGED_FIELDS
+            },
+        }
+
+    def __str__(self):
+        return f"Insight summary for {self.user_id}"
+
+
+_version_metadata = {}
+_recorded_versions = set()
+
+
+class ModelVersionMetadata(models.Model):
+    """
+    Class and feature order of a model version, plus a snapshot of its
+    crop envelopes, copied from the registry the first time a result of
+    that version is stored. Compact results are expanded against this
+    copy, so they stay readable after the version's files are gone and
+    their crop ranges do not move when the envelopes are rebuilt.
+    """
+
+    name = models.CharField(max_length=100, primary_key=True)
+    features = models.JSONField()
+    classes = models.JSONField()
+    # CropEnvelopes.snapshot(); null when the version had none
+    envelopes = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def for_version(cls, name):
+        """
+        The stored metadata for version `name`, or None if there is
+        none. Never writes and never touches the model registry.
+        """
+        if not name:
+            return None
+
+        metadata = _version_metadata.get(name)
+        if metadata is None:
+            metadata = cls.objects.filter(name=name).first()
+            if metadata is not None:
+                _version_metadata[name] = metadata
+        return metadata
+
+    @classmethod
+    def record(cls, name):
+        """
+        for_version() for a version whose results are about to be
+        stored: creates the row from the registry if needed, and fills
+        in the envelope snapshot if the row was stored without one.
+        """
+        if not name:
+            return None
+        if name in _recorded_versions:
+            return _version_metadata.get(name)
+
+        from ml.envelopes import envelopes_for
+        from ml.predictor import registry
+
+        try:
+            version = registry.get(name)
+        except LookupError:
+            return None
+
+        envelopes = envelopes_for(name)
+        snapshot = envelopes.snapshot() if envelopes is not None else None
+
+        metadata, _ = cls.objects.get_or_create(name=name, defaults={
+            "features": list(version.features),
+            "classes": [str(crop) for crop in version.classes],
+            "envelopes": snapshot,
+        })
+        if metadata.envelopes is None and snapshot is not None:
+            metadata.envelopes = snapshot
+            metadata.save(update_fields=["envelopes"])
+
+        _version_metadata[name] = metadata
+        _recorded_versions.add(name)
+        return metadata
+
+    @cached_property
+    def crop_envelopes(self):
+        """The snapshot as a CropEnvelopes index, or None."""
+        if self.envelopes is None:
+            return None
+
+        from ml.envelopes import CropEnvelopes
+
+        return CropEnvelopes.from_snapshot(self.envelopes)
+
+    def __str__(self):
+        return f"Model version {self.name}"
+
+
+class HistoryArchive(models.Model):
+    """
+    One user's archived rows of one kind for one calendar month, as
+    compressed NDJSON (services.archive). Rows move here from the live
+    tables once they are older than HISTORY_ARCHIVE["AFTER_DAYS"].
+    """
+
+    KIND_CHOICES = [
+        ("prediction", "Prediction"),
+        ("voice", "Voice query"),
+    ]
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="history_archives",
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    # First day of the month the rows were created in
+    month = models.DateField()
+
+    codec = models.CharField(max_length=10)
+    row_count = models.IntegerField()
+    data = models.BinaryField()
+    # Predictions only: insight_groups()-shaped totals per (local day,
+    # top crop) with a "day" key, so the insights and trends keep
+    # counting archived rows without decompressing them
+    groups = models.JSONField(default=list)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "kind", "month"],
+                name="history_archive_partition",
+            ),
+        ]
+
+    @classmethod
+    def prediction_groups(cls, user_id, first=None, end=None):
+        """
+        The groups of the user's archived predictions, for days in
+        [first, end) when given, oldest partition first.
+        """
+        partitions = cls.objects.filter(user_id=user_id, kind="prediction")
+        if first is not None:
+            partitions = partitions.filter(month__gte=first.replace(day=1))
+        if end is not None:
+            partitions = partitions.filter(month__lt=end)
+
+        for groups in partitions.order_by("month").values_list("groups", flat=True):
+            for group in groups:
+                if first is not None and group["day"] < first.isoformat():
+                    continue
+                if end is not None and group["day"] >= end.isoformat():
+                    continue
+                yield {**group, "user_id": user_id}
+
+    def __str__(self):
+        return f"{self.kind} archive of {self.user_id} for {self.month:%Y-%m}"
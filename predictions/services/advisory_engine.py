@@ -1,3 +1,6 @@
+from ml.thresholds import advisory_flag
+
+
 def generate_modern_advisory(prediction, weather_data):
     # -----------------------------
     # 1. Soil Environmental Profile (Static)
@@ -41,7 +44,7 @@ def generate_modern_advisory(prediction, weather_data):
     # --------------------------------------------------
 
     # Severe Soil Moisture Stress (based on soil + heat)
-    if soil_rainfall < 80 and live_temperature > 32:
+    if advisory_flag("dry_soil", soil_rainfall) and advisory_flag("hot_for_dry_soil", live_temperature):
         detected_issues.append("Severe Moisture Stress")
 
         critical_recommendations.append({
@@ -61,7 +64,7 @@ def generate_modern_advisory(prediction, weather_data):
         })
 
     # Severe pH imbalance
-    if ph < 5.0 or ph > 8.0:
+    if advisory_flag("critical_ph", ph):
         detected_issues.append("Critical Soil pH Imbalance")
 
         critical_recommendations.append({
@@ -84,7 +87,7 @@ def generate_modern_advisory(prediction, weather_data):
     # --------------------------------------------------
 
     # Heatwave Detection
-    if live_temperature >= 35:
+    if advisory_flag("heatwave", live_temperature):
         detected_issues.append("Heatwave Conditions")
 
         critical_recommendations.append({
@@ -104,7 +107,7 @@ def generate_modern_advisory(prediction, weather_data):
         })
 
     # High Humidity (Fungal Risk)
-    if live_humidity >= 85:
+    if advisory_flag("fungal_humidity", live_humidity):
         detected_issues.append("High Humidity – Fungal Risk")
 
         critical_recommendations.append({
@@ -124,7 +127,7 @@ def generate_modern_advisory(prediction, weather_data):
         })
 
     # Heavy Rainfall Alert
-    if live_rainfall >= 300:
+    if advisory_flag("excess_rainfall", live_rainfall):
         detected_issues.append("Excess Rainfall Risk")
 
         critical_recommendations.append({
@@ -147,7 +150,7 @@ def generate_modern_advisory(prediction, weather_data):
     # --------------------------------------------------
 
     # Water Strategy
-    if soil_rainfall < 150:
+    if advisory_flag("irrigation_rainfall", soil_rainfall):
         water_strategy = {
             "title": "Drip Irrigation System",
             "category": "Water Optimization",
@@ -183,7 +186,7 @@ def generate_modern_advisory(prediction, weather_data):
     optimization_recommendations.append(water_strategy)
 
     # Soil Strategy
-    if nitrogen < 50:
+    if advisory_flag("low_nitrogen", nitrogen):
         soil_strategy = {
             "title": "Organic Composting & Green Manuring",
             "category": "Soil Optimization",
@@ -0,0 +1,339 @@
+"""
+Retention for Prediction and VoiceQuery.
+
+Rows older than a cutoff move out of the live tables into
+HistoryArchive: one row per (user, kind, calendar month) holding that
+month's rows as compressed NDJSON. Each partition is written and its
+rows deleted in one transaction, so an interrupted run leaves nothing
+half-moved and can simply be rerun.
+
+Predictions are archived in their stored (compact) form. Archived rows
+still count towards the user's insights and trends: each prediction
+partition keeps its insight totals per day (HistoryArchive.groups),
+which UserInsightSummary.compute() and the trends read alongside the
+live table. Moving rows in either direction therefore bypasses
+PredictionQuerySet's summary bookkeeping, and only delete_history()
+takes them out of the summary. export_history() merges archived rows
+back in, and restore_partition() moves a partition back with its
+original ids and timestamps.
+"""
+
+import gzip
+import json
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.db.models import Min
+from django.utils import timezone
+
+from voice.models import VoiceQuery
+
+from ..models import (
+    AVERAGED_FIELDS,
+    CONFIDENCE_BUCKETS,
+    HistoryArchive,
+    Prediction,
+    UserInsightSummary,
+    confidence_bucket,
+    write_atomic,
+)
+from .trends import next_period, period_start
+
+# kind -> (model, timestamp field, columns archived besides id and timestamp)
+ARCHIVED = {
+    "prediction": (
+        Prediction,
+        "created_at",
+        [
+            "nitrogen", "phosphorus", "potassium",
+            "temperature", "humidity", "rainfall", "ph",
+            "result", "top_crop", "top_confidence",
+        ],
+    ),
+    "voice": (
+        VoiceQuery,
+        "timestamp",
+        ["query", "response", "query_type", "language"],
+    ),
+}
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImproperlyConfigured(
+            "The zstd archive codec needs the zstandard package "
+            "(pip install zstandard)"
+        )
+    return zstandard
+
+
+CODECS = {
+    "gzip": (gzip.compress, gzip.decompress),
+    "zstd": (
+        lambda data: _zstandard().ZstdCompressor().compress(data),
+        lambda data: _zstandard().ZstdDecompressor().decompress(data),
+    ),
+}
+
+
+def encode_rows(rows, time_field, codec):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps({**row, time_field: row[time_field].isoformat()}))
+    compress, _ = CODECS[codec]
+    return compress(("\n".join(lines) + "\n").encode())
+
+
+def decode_rows(data, time_field, codec):
+    """The rows of one partition, oldest first."""
+    _, decompress = CODECS[codec]
+    rows = []
+    for line in bytes(decompress(bytes(data))).decode().splitlines():
+        row = json.loads(line)
+        row[time_field] = datetime.fromisoformat(row[time_field])
+        rows.append(row)
+    return rows
+
+
+def insight_days(rows):
+    """
+    HistoryArchive.groups for archived prediction rows: insight totals
+    per (local day, top crop), in order of first appearance.
+    """
+    groups = {}
+    for row in rows:
+        day = timezone.localtime(row["created_at"]).date().isoformat()
+        group = groups.get((day, row["top_crop"]))
+        if group is None:
+            group = groups[(day, row["top_crop"])] = {
+                "day": day,
+                "top_crop": row["top_crop"],
+                "count": 0,
+                "first_id": row["id"],
+                **dict.fromkeys(CONFIDENCE_BUCKETS, 0),
+                **dict.fromkeys(AVERAGED_FIELDS, 0.0),
+            }
+
+        group["count"] += 1
+        group["first_id"] = min(group["first_id"], row["id"])
+        bucket = confidence_bucket(row["top_confidence"])
+        if bucket is not None:
+            group[bucket] += 1
+        for field in AVERAGED_FIELDS:
+            group[field] += row[field] or 0
+
+    return sorted(groups.values(), key=lambda group: group["first_id"])
+
+
+def _aware(day):
+    return timezone.make_aware(
+        datetime.combine(day, time.min), timezone.get_current_timezone()
+    )
+
+
+def archive_cutoff(after_days):
+    """
+    First day of the month holding the date after_days ago; everything
+    before it is archived, so partitions only ever hold whole months.
+    """
+    return period_start(timezone.localdate() - timedelta(days=after_days), "month")
+
+
+def archive_partition(kind, user_id, month, cutoff, codec, batch_size):
+    """
+    Moves the user's `kind` rows created in `month` (and before
+    `cutoff`) into its HistoryArchive partition, merging with what is
+    already there. Returns the number of rows moved.
+    """
+    model, time_field, fields = ARCHIVED[kind]
+    end = min(next_period(month, "month"), cutoff)
+
+    with write_atomic():
+        rows = list(
+            model.objects.filter(
+                user_id=user_id,
+                **{
+                    f"{time_field}__gte": _aware(month),
+                    f"{time_field}__lt": _aware(end),
+                },
+            )
+            .order_by(time_field, "id")
+            .values("id", time_field, *fields)
+        )
+        if not rows:
+            return 0
+        moved = [row["id"] for row in rows]
+
+        archive = (
+            HistoryArchive.objects.select_for_update()
+            .filter(user_id=user_id, kind=kind, month=month)
+            .first()
+        )
+        if archive is None:
+            archive = HistoryArchive(user_id=user_id, kind=kind, month=month)
+        else:
+            rows = sorted(
+                decode_rows(archive.data, time_field, archive.codec) + rows,
+                key=lambda row: (row[time_field], row["id"]),
+            )
+
+        archive.codec = codec
+        archive.row_count = len(rows)
+        archive.data = encode_rows(rows, time_field, codec)
+        if kind == "prediction":
+            archive.groups = insight_days(rows)
+        archive.save()
+
+        # A plain delete: the summary keeps counting the rows, now
+        # through archive.groups
+        for start in range(0, len(moved), batch_size):
+            model._base_manager.filter(id__in=moved[start:start + batch_size]).delete()
+
+    return len(moved)
+
+
+def archive_history(kind, cutoff, user_ids=None, codec=None, batch_size=None):
+    """
+    Archives every `kind` row created before `cutoff` (a date), one
+    partition at a time. Yields (user_id, month, rows moved) for each
+    non-empty partition.
+    """
+    config = settings.HISTORY_ARCHIVE
+    codec = codec or config["CODEC"]
+    batch_size = batch_size or config["BATCH_SIZE"]
+    if codec not in CODECS:
+        raise ImproperlyConfigured(
+            f"Unknown archive codec {codec!r}; use one of: {', '.join(CODECS)}"
+        )
+    if codec == "zstd":
+        _zstandard()
+
+    model, time_field, _ = ARCHIVED[kind]
+    old = model.objects.filter(**{f"{time_field}__lt": _aware(cutoff)})
+    if user_ids is None:
+        user_ids = sorted(set(
+            old.order_by().values_list("user_id", flat=True).distinct()
+        ))
+
+    for user_id in user_ids:
+        first = old.filter(user_id=user_id).aggregate(first=Min(time_field))["first"]
+        if first is None:
+            continue
+
+        month = period_start(timezone.localtime(first).date(), "month")
+        while month < cutoff:
+            moved = archive_partition(kind, user_id, month, cutoff, codec, batch_size)
+            if moved:
+                yield user_id, month, moved
+            month = next_period(month, "month")
+
+
+def restore_timestamps(model, time_field, rows):
+    """
+    auto_now_add overwrites the timestamp on insert; puts the archived
+    one back. A plain executemany, as bulk_update()'s CASE expression
+    costs more than the insert itself.
+    """
+    field = model._meta.get_field(time_field)
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"UPDATE {quote(model._meta.db_table)} "
+            f"SET {quote(field.column)} = %s WHERE {quote(model._meta.pk.column)} = %s",
+            [
+                (field.get_db_prep_value(row[time_field], connection), row["id"])
+                for row in rows
+            ],
+        )
+
+
+def restore_partition(archive_id, batch_size=None):
+    """
+    Moves a partition's rows back into the live table, keeping their
+    ids and timestamps, and deletes the partition. Rows whose id is
+    already live are skipped. Returns the number of rows restored.
+    """
+    batch_size = batch_size or settings.HISTORY_ARCHIVE["BATCH_SIZE"]
+
+    with write_atomic():
+        archive = HistoryArchive.objects.select_for_update().get(pk=archive_id)
+        model, time_field, _ = ARCHIVED[archive.kind]
+        rows = decode_rows(archive.data, time_field, archive.codec)
+
+        restored = 0
+        for start in range(0, len(rows), batch_size):
+            chunk = rows[start:start + batch_size]
+            live = set(
+                model.objects.filter(id__in=[row["id"] for row in chunk])
+                .values_list("id", flat=True)
+            )
+            chunk = [row for row in chunk if row["id"] not in live]
+            if not chunk:
+                continue
+
+            # A plain insert: the rows are already in the summary
+            model._base_manager.bulk_create([
+                model(user_id=archive.user_id, **row) for row in chunk
+            ])
+            restore_timestamps(model, time_field, chunk)
+            restored += len(chunk)
+
+        archive.delete()
+
+    return restored
+
+
+def archived_rows(user_id, kind):
+    """
+    The user's archived `kind` rows as values() dicts, newest first.
+    Partitions are decompressed one at a time.
+    """
+    _, time_field, _ = ARCHIVED[kind]
+    partitions = (
+        HistoryArchive.objects.filter(user_id=user_id, kind=kind)
+        .order_by("-month")
+        .values_list("id", flat=True)
+    )
+    for pk in list(partitions):
+        partition = (
+            HistoryArchive.objects.filter(pk=pk).values("codec", "data").first()
+        )
+        if partition is None:
+            continue
+        rows = decode_rows(partition["data"], time_field, partition["codec"])
+        yield from reversed(rows)
+
+
+def delete_history(user_id, kind, batch_size=None):
+    """
+    Deletes all of the user's `kind` rows, live and archived, and takes
+    them out of the insight summary. Live rows go batch_size at a time,
+    each batch in its own transaction, so no single DELETE holds the
+    write lock for the whole history.
+    """
+    batch_size = batch_size or settings.HISTORY_ARCHIVE["BATCH_SIZE"]
+    model, _, _ = ARCHIVED[kind]
+
+    deleted = 0
+    while True:
+        ids = list(
+            model.objects.filter(user_id=user_id)
+            .order_by()
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        model.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
+
+    with write_atomic():
+        if kind == "prediction":
+            UserInsightSummary.apply(
+                list(HistoryArchive.prediction_groups(user_id)), sign=-1
+            )
+        HistoryArchive.objects.filter(user_id=user_id, kind=kind).delete()
+    return deleted
@@ -0,0 +1,211 @@
+"""
+Keyset-paginated reads of a user's prediction history.
+
+Pages are ordered newest first on (created_at, id) and the cursor is
+the position of the last row served, so every page is one index range
+scan no matter how deep into the history it is.
+"""
+
+import base64
+import csv
+import heapq
+import io
+import json
+from datetime import datetime
+from itertools import islice
+
+from django.db.models import Q
+
+from ..models import ModelVersionMetadata, Prediction
+from .archive import archived_rows
+from .prediction_pipeline import to_input_data
+from .result_format import expand_results
+
+INPUT_FIELDS = [
+    "nitrogen", "phosphorus", "potassium",
+    "temperature", "humidity", "rainfall", "ph",
+]
+
+# Response field -> the columns (or expressions) it needs
+HISTORY_FIELDS = {
+    "id": ["id"],
+    "inputs": INPUT_FIELDS,
+    # Stored compact; the inputs are needed to rebuild the response
+    "result": ["result", *INPUT_FIELDS],
+    "top_prediction": ["top_crop", "top_confidence"],
+    "created_at": ["created_at"],
+}
+
+DEFAULT_FIELDS = ["id", "inputs", "result", "created_at"]
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at, pk):
+    raw = f"{created_at.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, pk = raw.split("|")
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise InvalidCursor("Invalid cursor") from exc
+
+
+def parse_fields(value):
+    """
+    ?fields=id,inputs -> list of response fields; raises ValueError
+    on unknown names.
+    """
+    if not value:
+        return list(DEFAULT_FIELDS)
+
+    fields = [field.strip() for field in value.split(",") if field.strip()]
+    unknown = [field for field in fields if field not in HISTORY_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def history_page(user, fields, limit, cursor=None):
+    """
+    Returns (items, next_cursor); next_cursor is None on the last page.
+    """
+    queryset = Prediction.objects.filter(user=user)
+
+    if cursor is not None:
+        created_at, pk = decode_cursor(cursor)
+        # The created_at__lte bound lets the index seek straight to the
+        # cursor instead of scanning the user's newer rows
+        queryset = queryset.filter(created_at__lte=created_at).filter(
+            Q(created_at__lt=created_at) | Q(id__lt=pk)
+        )
+
+    columns = {"id", "created_at"}
+    for field in fields:
+        columns.update(HISTORY_FIELDS[field])
+
+    rows = list(
+        queryset.order_by("-created_at", "-id").values(*columns)[:limit + 1]
+    )
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+
+    if "result" in fields:
+        expand_rows(rows)
+
+    return [serialize_row(row, fields) for row in rows], next_cursor
+
+
+def expand_rows(rows):
+    """Replaces every row's stored result with the full response."""
+    results = expand_results(
+        [row["result"] for row in rows],
+        [to_input_data(row) for row in rows],
+        ModelVersionMetadata.for_version,
+    )
+    for row, result in zip(rows, results):
+        row["result"] = result
+
+
+def serialize_row(row, fields):
+    item = {}
+    for field in fields:
+        if field == "inputs":
+            item["inputs"] = {name: row[name] for name in INPUT_FIELDS}
+        elif field == "top_prediction":
+            item["top_prediction"] = (
+                None if row["top_crop"] is None
+                else {"crop": row["top_crop"], "confidence": row["top_confidence"]}
+            )
+        elif field == "created_at":
+            item["created_at"] = row["created_at"].isoformat()
+        else:
+            item[field] = row[field]
+    return item
+
+
+EXPORT_COLUMNS = (
+    ["id", "created_at"]
+    + INPUT_FIELDS
+    + [f"{name}_{rank}" for rank in (1, 2, 3) for name in ("crop", "confidence")]
+    + ["explanation", "model_version"]
+)
+
+
+def _csv_record(row):
+    predictions = (row["result"] or {}).get("predictions", [])
+    predictions = predictions + [{"crop": "", "confidence": ""}] * 3
+
+    record = [row["id"], row["created_at"].isoformat()]
+    record += [row[name] for name in INPUT_FIELDS]
+    for prediction in predictions[:3]:
+        record += [prediction["crop"], prediction["confidence"]]
+    record += [
+        (row["result"] or {}).get("explanation", ""),
+        (row["result"] or {}).get("model_version", ""),
+    ]
+    return record
+
+
+def _ndjson_record(row):
+    return json.dumps({
+        "id": row["id"],
+        "created_at": row["created_at"].isoformat(),
+        "inputs": {name: row[name] for name in INPUT_FIELDS},
+        "result": row["result"],
+    }) + "\n"
+
+
+def export_history(user, export_format, chunk_size):
+    """
+    Yields the user's whole history, archived rows included, newest
+    first, as NDJSON lines or CSV text, in blocks of chunk_size rows.
+    Live rows are fetched with a server-side iterator and merged with
+    the archive one monthly partition at a time, so memory stays
+    bounded by one block plus one partition.
+    """
+    live = (
+        Prediction.objects.filter(user=user)
+        .order_by("-created_at", "-id")
+        .values("id", "created_at", "result", *INPUT_FIELDS)
+        .iterator(chunk_size=chunk_size)
+    )
+    rows = heapq.merge(
+        live,
+        archived_rows(user.id, "prediction"),
+        key=lambda row: (row["created_at"], row["id"]),
+        reverse=True,
+    )
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    if export_format == "csv":
+        writer.writerow(EXPORT_COLUMNS)
+
+    while True:
+        block = list(islice(rows, chunk_size))
+        if not block:
+            break
+
+        expand_rows(block)
+        for row in block:
+            if export_format == "csv":
+                writer.writerow(_csv_record(row))
+            else:
+                buffer.write(_ndjson_record(row))
+
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,111 @@
+import itertools
+import math
+import threading
+from collections import OrderedDict
+
+
+class NeighbourIndex:
+    """
+    Grid index over the input vectors of recent predictions, mapping
+    each to its model output.
+
+    Inputs are normalized by a per-feature tolerance, so a stored result
+    is reusable when every normalized coordinate is within 1 of the
+    query. Cells are 2 units wide, which puts every such neighbour in at
+    most 2 cells per dimension around the query (<= 2**7 probes).
+    Entries are kept per model version and the oldest are dropped once
+    `capacity` is reached, so the index follows recent traffic.
+    """
+
+    CELL_WIDTH = 2.0
+
+    def __init__(self, tolerance, capacity):
+        self.features = sorted(tolerance)
+        self.tolerance = [float(tolerance[f]) for f in self.features]
+        self.capacity = capacity
+
+        self._entries = OrderedDict()  # entry id -> (version, cell, vector, result)
+        self._cells = {}  # (version, cell) -> set of entry ids
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def _normalize(self, input_data):
+        return tuple(
+            input_data[feature] / tol
+            for feature, tol in zip(self.features, self.tolerance)
+        )
+
+    def _cell(self, vector):
+        return tuple(math.floor(v / self.CELL_WIDTH) for v in vector)
+
+    def add(self, model_version, input_data, result):
+        vector = self._normalize(input_data)
+        cell = self._cell(vector)
+
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+
+            self._entries[entry_id] = (model_version, cell, vector, result)
+            self._cells.setdefault((model_version, cell), set()).add(entry_id)
+
+            while len(self._entries) > self.capacity:
+                old_id, (old_version, old_cell, _, _) = self._entries.popitem(last=False)
+                bucket = self._cells[(old_version, old_cell)]
+                bucket.discard(old_id)
+                if not bucket:
+                    del self._cells[(old_version, old_cell)]
+
+    def query(self, model_version, input_data):
+        """
+        Returns the stored model output nearest to input_data that lies
+        within tolerance on every feature, or None.
+        """
+        vector = self._normalize(input_data)
+        ranges = [
+            range(
+                math.floor((v - 1.0) / self.CELL_WIDTH),
+                math.floor((v + 1.0) / self.CELL_WIDTH) + 1,
+            )
+            for v in vector
+        ]
+
+        best = None
+        best_distance = None
+
+        with self._lock:
+            for cell in itertools.product(*ranges):
+                for entry_id in self._cells.get((model_version, cell), ()):
+                    _, _, other, result = self._entries[entry_id]
+
+                    if any(abs(a - b) > 1.0 for a, b in zip(vector, other)):
+                        continue
+
+                    distance = sum((a - b) ** 2 for a, b in zip(vector, other))
+                    if best_distance is None or distance < best_distance:
+                        best, best_distance = result, distance
+
+            if best is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return best
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "capacity": self.capacity,
+                "cells": len(self._cells),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,453 @@
+import threading
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+
+from core.write_behind import get_write_buffer
+from ml.batching import MicroBatcher
+from ml.envelopes import get_envelopes
+from ml.lookup_grid import what_if
+from ml.sensitivity import sensitivity
+from ml.predictor import (
+    current_version,
+    predict_crop as ml_predict_crop,
+    predict_crop_batch as ml_predict_crop_batch,
+    registry,
+)
+from ml.explainer import generate_explanations
+from ml.suitability import analyze_suitability_batch
+
+from ..models import ModelVersionMetadata, Prediction
+from .neighbour_index import NeighbourIndex
+from .result_cache import PredictionCache
+from .result_format import model_output
+
+
+# Request field -> model feature
+FIELD_FEATURE_MAP = {
+    "nitrogen": "N",
+    "phosphorus": "P",
+    "potassium": "K",
+    "temperature": "temperature",
+    "humidity": "humidity",
+    "rainfall": "rainfall",
+    "ph": "ph",
+}
+
+REQUIRED_FIELDS = list(FIELD_FEATURE_MAP)
+
+
+def validate_sample(data):
+    """
+    Returns an error message for an invalid sample, or None.
+    """
+    if not isinstance(data, dict):
+        return "Sample must be an object"
+
+    for field in REQUIRED_FIELDS:
+        if field not in data:
+            return f"Missing field: {field}"
+
+        if not isinstance(data[field], (int, float)):
+            return f"{field} must be a number"
+
+    return None
+
+
+def to_input_data(data):
+    """
+    Maps request field names onto the feature names the model expects.
+    """
+    return {
+        feature: data[field]
+        for field, feature in FIELD_FEATURE_MAP.items()
+    }
+
+
+def build_response_batch(input_rows, ml_results):
+    """
+    Turns raw ml.predictor results into the structure returned
+    to the frontend and stored on Prediction.result, classifying
+    the explanation and suitability bands for all rows at once.
+    """
+    raw_importances = [ml_result["feature_importance"] for ml_result in ml_results]
+    top_crops = [ml_result["top_3_crops"][0]["crop"] for ml_result in ml_results]
+
+    explanations = generate_explanations(input_rows, top_crops, raw_importances)
+
+    # Rows of one call share a model version. Responses use the version's
+    # stored snapshot, the same envelopes its history is expanded with
+    metadata = (
+        ModelVersionMetadata.record(ml_results[0]["model_version"]) if ml_results else None
+    )
+    envelopes = metadata.crop_envelopes if metadata is not None else None
+
+    suitability_analyses = analyze_suitability_batch(input_rows, top_crops, envelopes)
+
+    responses = []
+    for input_data, ml_result, raw_importance, explanation, suitability_analysis in zip(
+        input_rows, ml_results, raw_importances, explanations, suitability_analyses
+    ):
+        response_data = {
+            "predictions": ml_result["top_3_crops"],
+            "feature_importance": {
+                "labels": [item["feature"] for item in raw_importance],
+                "values": [item["importance"] for item in raw_importance]
+            },
+            "explanation": explanation,
+            "suitability_analysis": suitability_analysis,
+            "model_version": ml_result["model_version"]
+        }
+
+        if envelopes is not None:
+            response_data["feasible_crops"] = envelopes.feasible(input_data)
+
+        responses.append(response_data)
+
+    return responses
+
+
+def build_response_data(input_data, ml_result):
+    """
+    Single-row build_response_batch.
+    """
+    return build_response_batch([input_data], [ml_result])[0]
+
+
+_batcher = None
+_init_lock = threading.Lock()
+
+
+def get_batcher():
+    """
+    Returns the shared MicroBatcher, or None when micro-batching is off.
+    """
+    global _batcher
+
+    config = settings.ML_MICROBATCH
+    if not config["ENABLED"]:
+        return None
+
+    if _batcher is None:
+        with _init_lock:
+            if _batcher is None:
+                _batcher = MicroBatcher(
+                    _predict_versioned_rows,
+                    max_batch_size=config["MAX_BATCH_SIZE"],
+                    max_wait_ms=config["MAX_WAIT_MS"],
+                )
+    return _batcher
+
+
+def _predict_versioned_rows(items):
+    """
+    MicroBatcher callback: items are (ModelVersion, input_data) pairs.
+    Rows queued across a model swap are scored by their own version.
+    """
+    groups = {}
+    for index, (version, _) in enumerate(items):
+        groups.setdefault(version, []).append(index)
+
+    results = [None] * len(items)
+    for version, indexes in groups.items():
+        rows = [items[i][1] for i in indexes]
+        for i, result in zip(indexes, ml_predict_crop_batch(rows, version)):
+            results[i] = result
+
+    return results
+
+
+def run_model(input_data, version=None):
+    """
+    The raw ml.predictor result for one row, through the micro-batcher
+    when it is on.
+    """
+    version = version or current_version()
+    batcher = get_batcher()
+
+    if batcher is not None:
+        return batcher.submit((version, input_data))
+    return ml_predict_crop(input_data, version)
+
+
+def run_prediction(input_data, version=None):
+    return build_response_data(input_data, run_model(input_data, version))
+
+
+_result_cache = None
+
+
+def get_result_cache():
+    """
+    Returns the shared PredictionCache, or None when caching is off.
+    """
+    global _result_cache
+
+    config = settings.PREDICTION_CACHE
+    if not config["ENABLED"]:
+        return None
+
+    if _result_cache is None:
+        with _init_lock:
+            if _result_cache is None:
+                _result_cache = PredictionCache(
+                    max_entries=config["MAX_ENTRIES"],
+                    ttl_seconds=config["TTL_SECONDS"],
+                    precision=config["PRECISION"],
+                )
+    return _result_cache
+
+
+_neighbour_index = None
+
+
+def get_neighbour_index():
+    """
+    Returns the shared NeighbourIndex, or None when it is disabled.
+    The first call seeds it from the most recent Prediction rows.
+    """
+    global _neighbour_index
+
+    config = settings.PREDICTION_NEIGHBOUR_INDEX
+    if not config["ENABLED"]:
+        return None
+
+    if _neighbour_index is None:
+        with _init_lock:
+            if _neighbour_index is None:
+                index = NeighbourIndex(
+                    tolerance=config["TOLERANCE"],
+                    capacity=config["CAPACITY"],
+                )
+                _seed_neighbour_index(index)
+                _neighbour_index = index
+    return _neighbour_index
+
+
+def _seed_neighbour_index(index):
+    rows = list(
+        Prediction.objects
+        .order_by("-created_at")
+        .values(*REQUIRED_FIELDS, "result")[:index.capacity]
+    )
+
+    # Oldest first, so capacity eviction keeps the newest rows
+    for row in reversed(rows):
+        ml_result = model_output(row["result"], ModelVersionMetadata.for_version)
+        if ml_result is None:
+            continue
+
+        index.add(ml_result["model_version"], to_input_data(row), ml_result)
+
+
+_reuse_counts = Counter()
+_reuse_lock = threading.Lock()
+
+
+def _count_reuse(source):
+    with _reuse_lock:
+        _reuse_counts[source or "model"] += 1
+
+
+def run_cached_prediction(input_data):
+    """
+    Answers from the result cache, then the nearest-neighbour index,
+    and only runs the model when neither has a usable result.
+    Returns (response_data, reused_from) where reused_from is
+    "cache", "nearest_neighbour" or None when the model was run.
+
+    The cache and the index hold model outputs only: the explanation,
+    suitability and feasibility depend on the exact inputs and are
+    built for every request.
+    """
+    version = current_version()
+    cache = get_result_cache()
+    index = get_neighbour_index()
+
+    key = None
+    reused_from = None
+    ml_result = None
+
+    if cache is not None:
+        key = cache.make_key(version.name, input_data)
+        ml_result = cache.get(key)
+        if ml_result is not None:
+            reused_from = "cache"
+
+    if ml_result is None and index is not None:
+        ml_result = index.query(version.name, input_data)
+        if ml_result is not None:
+            reused_from = "nearest_neighbour"
+
+    if ml_result is None:
+        ml_result = run_model(input_data, version)
+        if index is not None:
+            index.add(version.name, input_data, ml_result)
+
+    if cache is not None and reused_from != "cache":
+        cache.set(key, ml_result)
+
+    _count_reuse(reused_from)
+    return build_response_data(input_data, ml_result), reused_from
+
+
+def pipeline_stats():
+    """
+    Runtime counters for the prediction pipeline, for operators.
+    """
+    batcher = get_batcher()
+    cache = get_result_cache()
+    index = get_neighbour_index()
+    write_buffer = get_write_buffer()
+
+    with _reuse_lock:
+        answered_by = dict(_reuse_counts)
+    total = sum(answered_by.values())
+
+    return {
+        "model_registry": registry.stats(),
+        "microbatch": batcher.stats() if batcher is not None else None,
+        "result_cache": cache.stats() if cache is not None else None,
+        "neighbour_index": index.stats() if index is not None else None,
+        "write_behind": write_buffer.stats() if write_buffer is not None else None,
+        "answered_by": answered_by,
+        "model_calls_saved": (
+            round(1 - answered_by.get("model", 0) / total, 4) if total else 0.0
+        ),
+    }
+
+
+def run_batch_prediction(input_rows, version=None):
+    """
+    Scores every row with one vectorized model call, then builds
+    the per-row explanation and suitability breakdown.
+    """
+    ml_results = ml_predict_crop_batch(input_rows, version or current_version())
+
+    return build_response_batch(input_rows, ml_results)
+
+
+def run_what_if(base, vary, points=None, exact=False):
+    """
+    What-if sweep over one or two request fields (e.g. "rainfall"),
+    returned with request field names and crop names.
+    """
+    feature_field = {feature: field for field, feature in FIELD_FEATURE_MAP.items()}
+    sweep = what_if(
+        to_input_data(base),
+        [FIELD_FEATURE_MAP[field] for field in vary],
+        points=points,
+        exact=exact,
+        min_agreement=settings.PREDICTION_WHAT_IF_MIN_AGREEMENT,
+    )
+
+    snapped_inputs = sweep["snapped_inputs"]
+    if snapped_inputs is not None:
+        snapped_inputs = {
+            feature_field[feature]: round(value, 3)
+            for feature, value in snapped_inputs.items()
+        }
+
+    classes = sweep["classes"]
+    crops = np.vectorize(lambda i: str(classes[i]), otypes=[object])(sweep["top_class"])
+
+    return {
+        "model_version": sweep["model_version"],
+        "source": sweep["source"],
+        "axes": [
+            {
+                "feature": feature_field[feature],
+                "values": [round(float(v), 3) for v in axis]
+            }
+            for feature, axis in zip(sweep["features"], sweep["axes"])
+        ],
+        "crops": crops.tolist(),
+        "confidence": np.round(sweep["confidence"], 3).tolist(),
+        "snapped_inputs": snapped_inputs,
+        "grid_agreement": sweep["grid_agreement"],
+        "elapsed_ms": round(sweep["elapsed_ms"], 3),
+    }
+
+
+def run_sensitivity(base, ranges, min_probability=0.05):
+    """
+    Sensitivity sweep over one or two request fields.
+    ranges: list of {"feature": field, "start", "stop", "steps"}.
+    """
+    feature_field = {feature: field for field, feature in FIELD_FEATURE_MAP.items()}
+    result = sensitivity(
+        to_input_data(base),
+        [
+            (FIELD_FEATURE_MAP[r["feature"]], r["start"], r["stop"], r["steps"])
+            for r in ranges
+        ],
+        min_probability=min_probability,
+    )
+
+    classes = result["classes"]
+    axes = result["axes"]
+    crop = lambda i: str(classes[i])
+
+    return {
+        "model_version": result["model_version"],
+        "axes": [
+            {
+                "feature": feature_field[feature],
+                "values": np.round(axis, 4).tolist()
+            }
+            for feature, axis in zip(result["features"], axes)
+        ],
+        "curves": {
+            crop(i): np.round(curve, 3).tolist()
+            for i, curve in result["curves"].items()
+        },
+        "top_crop": np.vectorize(crop, otypes=[object])(result["top_class"]).tolist(),
+        "boundaries": [
+            {
+                "feature": feature_field[result["features"][axis]],
+                "between": [
+                    round(float(axes[axis][position[axis]]), 4),
+                    round(float(axes[axis][position[axis] + 1]), 4),
+                ],
+                "at": [int(p) for p in position],
+                "from": crop(before),
+                "to": crop(after),
+            }
+            for axis, position, before, after in result["boundaries"]
+        ],
+    }
+
+
+def run_feasibility(sample, crop=None):
+    """
+    Crops whose requirement envelope contains the sample, and for `crop`
+    the request fields that fall outside its envelope. Returns None when
+    no envelope index was built for the current model version.
+    """
+    version = current_version()
+    envelopes = get_envelopes(version)
+    if envelopes is None:
+        return None
+
+    input_data = to_input_data(sample)
+    feature_field = {feature: field for field, feature in FIELD_FEATURE_MAP.items()}
+
+    result = {
+        "model_version": version.name,
+        "feasible_crops": envelopes.feasible(input_data),
+    }
+
+    if crop is not None:
+        result["crop"] = crop
+        result["violations"] = [
+            {
+                **violation,
+                "feature": feature_field[violation["feature"]],
+                "low": None if violation["low"] is None else round(violation["low"], 2),
+                "high": None if violation["high"] is None else round(violation["high"], 2),
+            }
+            for violation in envelopes.violations(input_data, crop)
+        ]
+
+    return result
@@ -0,0 +1,194 @@
+"""
+Compact stored form of Prediction.result.
+
+A full response is ~1.2 kB, most of it text the pipeline derives from
+the inputs: the explanation sentence, the suitability labels and value
+strings, crop envelope ranges and the feasible crop list. Rows store
+only what cannot be re-derived:
+
+    {
+        "f": 1,                      # format marker
+        "m": "base",                 # model version
+        "k": [20, 19, 21],           # top-k class indices
+        "p": [0.97, 0.02, 0.01],     # their confidences
+        "s": [0, 0, 0, 0],           # SUITABILITY outcome index per band
+        "i": [0.07, 0.06, ...],      # feature contributions, model order
+    }
+
+Class and feature names and the crop envelopes come from per-version
+metadata (ModelVersionMetadata); the rest is rebuilt on read by the
+same code that built the response. Results that cannot be encoded (no model
+version, unknown crops or outcomes) are stored and returned unchanged.
+"""
+
+from ml.explainer import generate_explanations
+from ml.registry import FEATURE_NAME_MAP
+from ml.thresholds import SUITABILITY
+
+COMPACT_FORMAT = 1
+
+
+def is_compact(result):
+    return isinstance(result, dict) and result.get("f") == COMPACT_FORMAT
+
+
+def compact_result(result, classes, features):
+    """
+    The compact form of a full response, or `result` itself when it
+    cannot be encoded against `classes` and `features`.
+    """
+    if not isinstance(result, dict) or is_compact(result):
+        return result
+
+    try:
+        class_index = {str(crop): i for i, crop in enumerate(classes)}
+        predictions = result["predictions"]
+
+        importance = dict(zip(
+            result["feature_importance"]["labels"],
+            result["feature_importance"]["values"],
+        ))
+
+        compact = {
+            "f": COMPACT_FORMAT,
+            "m": result["model_version"],
+            "k": [class_index[entry["crop"]] for entry in predictions],
+            "p": [entry["confidence"] for entry in predictions],
+            "s": [
+                table.outcomes.index((
+                    result["suitability_analysis"][label]["status"],
+                    result["suitability_analysis"][label]["level"],
+                ))
+                for label, _, table in SUITABILITY
+            ],
+            "i": [
+                importance[FEATURE_NAME_MAP.get(feature, feature)]
+                for feature in features
+            ],
+        }
+    except (KeyError, TypeError, ValueError):
+        return result
+
+    return compact
+
+
+def _display(value):
+    # Inputs arrive as JSON numbers and are stored as floats; show
+    # whole numbers the way the request usually sent them
+    return int(value) if float(value).is_integer() else value
+
+
+def model_output(result, metadata_for):
+    """
+    The ml.predictor result (top_3_crops, feature_importance,
+    model_version) a stored result was built from, or None when it
+    cannot be recovered.
+    """
+    if is_compact(result):
+        metadata = metadata_for(result["m"])
+        if metadata is None:
+            return None
+
+        output = {
+            "top_3_crops": [
+                {"crop": str(metadata.classes[k]), "confidence": p}
+                for k, p in zip(result["k"], result["p"])
+            ],
+            # Stable sort over model order, as ml.predictor builds it
+            "feature_importance": sorted(
+                [
+                    {"feature": FEATURE_NAME_MAP.get(feature, feature), "importance": value}
+                    for feature, value in zip(metadata.features, result["i"])
+                ],
+                key=lambda item: item["importance"],
+                reverse=True,
+            ),
+            "model_version": result["m"],
+        }
+        return output
+
+    try:
+        output = {
+            "top_3_crops": result["predictions"],
+            "feature_importance": [
+                {"feature": label, "importance": value}
+                for label, value in zip(
+                    result["feature_importance"]["labels"],
+                    result["feature_importance"]["values"],
+                )
+            ],
+            "model_version": result["model_version"],
+        }
+    except (KeyError, TypeError):
+        return None
+    return output
+
+
+def expand_results(results, input_rows, metadata_for):
+    """
+    Full responses for stored results; input_rows are the matching
+    model inputs (N, P, K, ...). metadata_for(model_version) returns
+    an object with `classes` and `features`. Results that are not
+    compact are returned as they are.
+    """
+    expanded = list(results)
+    rows = [
+        i for i, result in enumerate(expanded)
+        if is_compact(result) and metadata_for(result["m"]) is not None
+    ]
+    if not rows:
+        return expanded
+
+    outputs = [model_output(expanded[i], metadata_for) for i in rows]
+    explanations = generate_explanations(
+        [input_rows[i] for i in rows],
+        [output["top_3_crops"][0]["crop"] for output in outputs],
+        [output["feature_importance"] for output in outputs],
+    )
+
+    envelopes = {}
+    for i, output, explanation in zip(rows, outputs, explanations):
+        compact = expanded[i]
+        input_data = input_rows[i]
+        top_crop = output["top_3_crops"][0]["crop"]
+
+        if compact["m"] not in envelopes:
+            # Historical models in migrations have no snapshot property
+            envelopes[compact["m"]] = getattr(
+                metadata_for(compact["m"]), "crop_envelopes", None
+            )
+        index = envelopes[compact["m"]]
+        crop_row = None if index is None else index.envelope_row(top_crop)
+
+        suitability = {}
+        for (label, value_format, table), code in zip(SUITABILITY, compact["s"]):
+            status, level = table.outcomes[code]
+            value = _display(input_data[table.feature])
+            entry = {
+                "status": status,
+                "level": level,
+                "value": value if value_format is None else value_format.format(value),
+            }
+            if crop_row is not None:
+                j = index.features.index(table.feature)
+                low, high = float(index.low[crop_row, j]), float(index.high[crop_row, j])
+                entry["crop_range"] = [round(low, 2), round(high, 2)]
+                entry["within_crop_range"] = low <= input_data[table.feature] <= high
+            suitability[label] = entry
+
+        response = {
+            "predictions": output["top_3_crops"],
+            "feature_importance": {
+                "labels": [item["feature"] for item in output["feature_importance"]],
+                "values": [item["importance"] for item in output["feature_importance"]],
+            },
+            "explanation": explanation,
+            "suitability_analysis": suitability,
+            "model_version": compact["m"],
+        }
+        if index is not None:
+            response["feasible_crops"] = index.feasible(input_data)
+
+        expanded[i] = response
+
+    return expanded
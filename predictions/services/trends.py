@@ -0,0 +1,221 @@
+"""
+Prediction history grouped into day, week or month buckets.
+
+Buckets are computed in the database (Trunc* + aggregation over the
+(user, created_at) index), plus the per-day totals kept on archived
+partitions (HistoryArchive.groups). A bucket whose period has ended can only
+change when predictions are removed or edited, which bumps the user's
+UserInsightSummary.revision; closed buckets are therefore cached under
+a key that includes the revision, and only the open period and any
+uncached closed ones are queried. Rows held by the write-behind buffer
+are stamped when written, so they land in the open period too.
+"""
+
+import itertools
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Min, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from ..models import AVERAGED_FIELDS, HistoryArchive, Prediction, UserInsightSummary
+
+PERIODS = {
+    "day": TruncDay,
+    "week": TruncWeek,
+    "month": TruncMonth,
+}
+
+# Buckets returned when ?from= is absent
+DEFAULT_SPAN = {"day": 30, "week": 12, "month": 12}
+
+
+def period_start(day, period):
+    """First day of the bucket containing `day`."""
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    return day
+
+
+def next_period(start, period):
+    if period == "week":
+        return start + timedelta(days=7)
+    if period == "month":
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def bucket_starts(first, last, period):
+    """Start dates of every bucket from the one holding `first` to `last`'s."""
+    start = period_start(first, period)
+    end = period_start(last, period)
+    starts = []
+    while start <= end:
+        starts.append(start)
+        start = next_period(start, period)
+    return starts
+
+
+def parse_range(period, start, end):
+    """
+    ?period=&from=&to= -> the start date of every bucket; raises
+    ValueError on bad input. Dates are inclusive and widened to whole
+    buckets, so every bucket covers its full period.
+    """
+    if period not in PERIODS:
+        raise ValueError(f"period must be one of: {', '.join(PERIODS)}")
+
+    try:
+        last = date.fromisoformat(end) if end else timezone.localdate()
+        first = date.fromisoformat(start) if start else None
+    except ValueError:
+        raise ValueError("from and to must be dates (YYYY-MM-DD)")
+
+    if first is None:
+        first = period_start(last, period)
+        for _ in range(DEFAULT_SPAN[period] - 1):
+            first = period_start(first - timedelta(days=1), period)
+
+    if first > last:
+        raise ValueError("from must not be after to")
+
+    starts = bucket_starts(first, last, period)
+    if len(starts) > settings.PREDICTION_TRENDS_MAX_BUCKETS:
+        raise ValueError(
+            f"Range spans more than {settings.PREDICTION_TRENDS_MAX_BUCKETS} "
+            f"{period} buckets"
+        )
+    return starts
+
+
+def _aware(day):
+    return timezone.make_aware(
+        datetime.combine(day, time.min), timezone.get_current_timezone()
+    )
+
+
+def query_buckets(user_id, period, first, end):
+    """
+    {bucket start date: bucket} for predictions in [first, end), one
+    entry per non-empty bucket, from a single query grouped by bucket
+    and top crop (on SQLite Trunc* is a Python function called per
+    row, so a second grouped query would double the cost) and one for
+    the archived days in the range.
+    """
+    groups = (
+        Prediction.objects.filter(
+            user_id=user_id,
+            created_at__gte=_aware(first),
+            created_at__lt=_aware(end),
+        )
+        .annotate(bucket=PERIODS[period]("created_at"))
+        .values("bucket", "top_crop")
+        .annotate(
+            count=Count("id"),
+            first_id=Min("id"),
+            **{field: Sum(field) for field in AVERAGED_FIELDS},
+        )
+    )
+
+    # (bucket, top crop) -> totals; a week can straddle the archive cutoff
+    crops = {}
+    for bucket, group in itertools.chain(
+        ((timezone.localtime(group["bucket"]).date(), group) for group in groups),
+        (
+            (period_start(date.fromisoformat(group["day"]), period), group)
+            for group in HistoryArchive.prediction_groups(user_id, first, end)
+        ),
+    ):
+        crop = crops.get((bucket, group["top_crop"]))
+        if crop is None:
+            crops[(bucket, group["top_crop"])] = {
+                key: group[key] for key in ("count", "first_id", *AVERAGED_FIELDS)
+            }
+            continue
+        crop["first_id"] = min(crop["first_id"], group["first_id"])
+        for key in ("count", *AVERAGED_FIELDS):
+            crop[key] = (crop[key] or 0) + (group[key] or 0)
+
+    totals = {}
+    top = {}
+    for (bucket, top_crop), group in crops.items():
+        total = totals.setdefault(
+            bucket, dict.fromkeys(["count", *AVERAGED_FIELDS], 0)
+        )
+        total["count"] += group["count"]
+        for field in AVERAGED_FIELDS:
+            total[field] += group[field] or 0
+
+        # Ties go to the crop seen first in the bucket, as in the insights
+        if top_crop:
+            best = top.get(bucket)
+            rank = (group["count"], -group["first_id"])
+            if best is None or rank > (best["count"], -best["first_id"]):
+                top[bucket] = {**group, "top_crop": top_crop}
+
+    return {
+        bucket: {
+            "count": total["count"],
+            "top_crop": top[bucket]["top_crop"] if bucket in top else None,
+            "average_conditions": {
+                field: round(total[field] / total["count"], 2)
+                for field in AVERAGED_FIELDS
+            },
+        }
+        for bucket, total in totals.items()
+    }
+
+
+def empty_bucket():
+    return {
+        "count": 0,
+        "top_crop": None,
+        "average_conditions": {field: None for field in AVERAGED_FIELDS},
+    }
+
+
+def _cache_key(user_id, revision, period, start):
+    return f"prediction-trends:{user_id}:{revision}:{period}:{start.isoformat()}"
+
+
+def prediction_trends(user_id, period, starts):
+    """
+    One entry per bucket start in `starts`, oldest first, with the
+    prediction count, top crop and average conditions (None when the
+    bucket is empty).
+    """
+    current = period_start(timezone.localdate(), period)
+    closed = [start for start in starts if start < current]
+
+    revision = (
+        UserInsightSummary.objects.filter(user_id=user_id)
+        .values_list("revision", flat=True).first()
+    ) or 0
+
+    keys = {start: _cache_key(user_id, revision, period, start) for start in closed}
+    cached = cache.get_many(keys.values())
+    buckets = {
+        start: cached[key] for start, key in keys.items() if key in cached
+    }
+
+    missing = [start for start in starts if start not in buckets]
+    if missing:
+        fetched = query_buckets(
+            user_id, period, missing[0], next_period(missing[-1], period)
+        )
+        for start in missing:
+            buckets[start] = fetched.get(start) or empty_bucket()
+
+        cache.set_many(
+            {keys[start]: buckets[start] for start in missing if start in keys},
+            settings.PREDICTION_TRENDS_CACHE_TTL,
+        )
+
+    return [
+        {"start": start.isoformat(), **buckets[start]}
+        for start in starts
+    ]
@@ -1,3 +1,1029 @@
-from django.test import TestCase
+import itertools
+import json
+import os
+import re
+import tempfile
+import threading
+import tracemalloc
+from importlib import import_module
+from unittest import mock
+from datetime import timedelta
 
-# Create your tests here.
+import joblib
+import numpy as np
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings, tag
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from ml import envelopes, lookup_grid
+from ml.batching import MicroBatcher
+from ml.envelopes import CropEnvelopes
+from ml.explainer import generate_explanation, generate_explanations
+from ml.lookup_grid import LookupGrid, what_if
+from ml.predictor import (
+    FEATURE_RANGES,
+    registry,
+    build_input_matrix,
+    current_version,
+    predict_crop,
+    predict_crop_batch,
+)
+from ml.registry import MODEL_FILE, ModelRegistry
+from ml.suitability import analyze_suitability, analyze_suitability_batch
+from ml.thresholds import advisory_flag
+from voice.models import VoiceQuery
+
+from . import models
+from .models import HistoryArchive, ModelVersionMetadata, Prediction, UserInsightSummary
+from .services.archive import (
+    archive_cutoff,
+    archive_history,
+    delete_history,
+    restore_partition,
+)
+from .services import prediction_pipeline
+from .services.history import InvalidCursor, history_page
+from .services.neighbour_index import NeighbourIndex
+from .services.prediction_pipeline import (
+    run_batch_prediction,
+    run_cached_prediction,
+    to_input_data,
+)
+from .views import export_prediction_history
+from .views import predict_crop_batch as predict_crop_batch_view
+
+
+def random_inputs(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    columns = {
+        feature: rng.uniform(low, high, size=rows)
+        for feature, (low, high) in FEATURE_RANGES.items()
+    }
+    return [
+        {feature: float(values[i]) for feature, values in columns.items()}
+        for i in range(rows)
+    ]
+
+
+def fill_history(user, total, rows):
+    """Gives the user `total` predictions, cycling through rows."""
+    results = run_batch_prediction(rows)
+    Prediction.objects.bulk_create([
+        Prediction(
+            user=user,
+            nitrogen=row["N"], phosphorus=row["P"], potassium=row["K"],
+            temperature=row["temperature"], humidity=row["humidity"],
+            rainfall=row["rainfall"], ph=row["ph"],
+            result=result,
+        )
+        for _, (row, result) in zip(range(total), itertools.cycle(zip(rows, results)))
+    ], batch_size=2000)
+
+
+class CompiledForestTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.version = current_version()
+        cls.model = joblib.load(os.path.join(cls.version.path, MODEL_FILE))
+
+    def test_model_is_compiled(self):
+        self.assertIsNotNone(self.version.compiled)
+
+    def test_predict_proba_matches_sklearn(self):
+        X = build_input_matrix(random_inputs(2000), self.version.features)
+
+        np.testing.assert_array_equal(
+            self.version.compiled.predict_proba(X),
+            self.model.predict_proba(X),
+        )
+
+    def test_single_rows_match_sklearn(self):
+        X = build_input_matrix(random_inputs(50, seed=1), self.version.features)
+
+        for row in X:
+            np.testing.assert_array_equal(
+                self.version.compiled.predict_proba(row[None, :]),
+                self.model.predict_proba(row[None, :]),
+            )
+
+    def test_predict_crop_uses_compiled_forest(self):
+        sample = random_inputs(1, seed=2)[0]
+        self.assertIs(self.version.estimator_for(1), self.version.compiled)
+
+        probabilities = self.model.predict_proba(
+            build_input_matrix([sample], self.version.features)
+        )[0]
+        top = predict_crop(sample, self.version)["top_3_crops"][0]
+
+        self.assertEqual(top["crop"], self.version.classes[probabilities.argmax()])
+        self.assertEqual(top["confidence"], round(float(probabilities.max()), 3))
+
+    def test_contributions_sum_to_probability_minus_bias(self):
+        X = build_input_matrix(random_inputs(300, seed=7), self.version.features)
+        proba = self.version.compiled.predict_proba(X)
+        classes = np.arange(len(X)) % proba.shape[1]
+
+        bias, contributions = self.version.compiled.feature_contributions(X, classes)
+
+        self.assertEqual(contributions.shape, X.shape)
+        np.testing.assert_allclose(
+            contributions.sum(axis=1),
+            proba[np.arange(len(X)), classes] - bias,
+            atol=1e-9,
+        )
+
+
+class ModelRegistryTests(SimpleTestCase):
+
+    def setUp(self):
+        root = self.enterContext(tempfile.TemporaryDirectory())
+        for name in ("v1", "v2", "v3"):
+            os.symlink(registry.fallback_path, os.path.join(root, name))
+        self.registry = ModelRegistry(root, registry.fallback_path)
+
+    def hold_loading(self, name):
+        """Blocks loads of `name` until the returned event is set."""
+        release = threading.Event()
+        get = self.registry.get
+
+        def held_get(requested):
+            if requested == name:
+                release.wait(5)
+            return get(requested)
+
+        self.registry.get = held_get
+        self.addCleanup(release.set)
+        return release
+
+    def test_activation_during_a_load_is_queued(self):
+        release = self.hold_loading("v1")
+        self.registry.activate("v1")
+        self.registry.activate("v2")
+        self.registry.activate("v3")
+        self.assertEqual(self.registry.stats()["queued"], "v3")
+
+        release.set()
+        self.registry.activate("v3", wait=True)
+        self.assertEqual(self.registry.current().name, "v3")
+
+    def test_only_the_active_version_stays_loaded(self):
+        self.registry.activate("v1", wait=True)
+        self.registry.get("v2")
+        self.registry.activate("v3", wait=True)
+
+        self.assertEqual(self.registry.stats()["loaded"], ["v3"])
+
+
+class MicroBatcherTests(SimpleTestCase):
+
+    def submit_together(self, batcher, rows):
+        """Each row's result or exception; daemon threads so a hang fails."""
+        outcomes = [None] * len(rows)
+
+        def submit(i):
+            try:
+                outcomes[i] = batcher.submit(rows[i])
+            except Exception as exc:
+                outcomes[i] = exc
+
+        threads = [
+            threading.Thread(target=submit, args=(i,), daemon=True)
+            for i in range(len(rows))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=5)
+            self.assertFalse(thread.is_alive(), "a caller never got an answer")
+        return outcomes
+
+    def test_results_pair_with_their_rows(self):
+        batcher = MicroBatcher(lambda rows: [row * 2 for row in rows], max_wait_ms=50)
+        self.assertEqual(self.submit_together(batcher, [1, 2, 3, 4]), [2, 4, 6, 8])
+
+    def test_short_results_fail_every_caller(self):
+        batcher = MicroBatcher(lambda rows: rows[:-1], max_wait_ms=50)
+
+        outcomes = self.submit_together(batcher, [1, 2, 3, 4])
+
+        for outcome in outcomes:
+            self.assertIsInstance(outcome, RuntimeError)
+        self.assertGreater(batcher.stats()["errors"], 0)
+
+
+class EnvelopeTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.version = current_version()
+        cls.envelopes = CropEnvelopes.build(cls.version)
+
+    def widths(self):
+        """Each crop's envelope width per feature, as a share of its range."""
+        ranges = np.array([
+            FEATURE_RANGES[feature][1] - FEATURE_RANGES[feature][0]
+            for feature in self.envelopes.features
+        ])
+        return np.clip(self.envelopes.high - self.envelopes.low, 0, None) / ranges
+
+    def test_envelopes_are_narrower_than_feature_ranges(self):
+        widths = self.widths()
+
+        for feature, width in zip(self.envelopes.features, widths.mean(axis=0)):
+            with self.subTest(feature=feature):
+                self.assertLess(width, 1)
+        self.assertLess(widths.mean(), 0.75)
+
+    def test_confident_predictions_are_feasible(self):
+        rows = random_inputs(20000, seed=3)
+        confident = [
+            (row, result["top_3_crops"][0]["crop"])
+            for row, result in zip(rows, predict_crop_batch(rows, self.version))
+            if result["top_3_crops"][0]["confidence"] >= 0.8
+        ]
+
+        inside = [crop in self.envelopes.feasible(row) for row, crop in confident]
+        self.assertGreater(len(inside), 100, "too few confident predictions")
+        self.assertGreaterEqual(np.mean(inside), 0.9)
+
+    def test_crops_without_an_envelope_serialize_as_none(self):
+        low, high = self.envelopes.low.copy(), self.envelopes.high.copy()
+        low[0], high[0] = np.inf, -np.inf
+        index = CropEnvelopes(
+            self.version.name, self.envelopes.features, self.envelopes.classes, low, high
+        )
+        crop = str(index.classes[0])
+
+        snapshot = json.loads(json.dumps(index.snapshot(), allow_nan=False))
+        self.assertIsNone(snapshot["low"][0])
+        self.assertIsNone(snapshot["high"][0])
+
+        restored = CropEnvelopes.from_snapshot(snapshot)
+        self.assertIsNone(restored.envelope(crop))
+        self.assertIsNotNone(restored.envelope(restored.classes[1]))
+        for row in random_inputs(200, seed=6):
+            self.assertNotIn(crop, restored.feasible(row))
+
+
+class ThresholdParityTests(SimpleTestCase):
+    """
+    The band tables against frozen copies of the if/elif code they
+    replaced, on every edge, the floats either side of it, and inf/NaN.
+    """
+
+    EDGES = {
+        "rainfall": [60, 80, 100, 150, 200, 250, 300],
+        "temperature": [15, 20, 30, 32, 35],
+        "ph": [5.0, 5.5, 6, 7.5, 8.0],
+        "N": [50, 80],
+        "humidity": [85],
+    }
+
+    ADVISORY = {
+        "dry_soil": ("rainfall", lambda v: v < 80),
+        "hot_for_dry_soil": ("temperature", lambda v: v > 32),
+        "critical_ph": ("ph", lambda v: v < 5.0 or v > 8.0),
+        "heatwave": ("temperature", lambda v: v >= 35),
+        "fungal_humidity": ("humidity", lambda v: v >= 85),
+        "excess_rainfall": ("rainfall", lambda v: v >= 300),
+        "irrigation_rainfall": ("rainfall", lambda v: v < 150),
+        "low_nitrogen": ("N", lambda v: v < 50),
+    }
+
+    @classmethod
+    def values(cls, feature):
+        values = [0.0, float("inf"), float("-inf"), float("nan")]
+        for edge in cls.EDGES[feature]:
+            edge = float(edge)
+            values += [
+                edge,
+                np.nextafter(edge, -np.inf),
+                np.nextafter(edge, np.inf),
+            ]
+        return values
+
+    @classmethod
+    def rows(cls):
+        return [
+            {"rainfall": rainfall, "temperature": temperature, "ph": ph, "N": nitrogen}
+            for rainfall, temperature, ph, nitrogen in itertools.product(
+                cls.values("rainfall"), cls.values("temperature"),
+                cls.values("ph"), cls.values("N"),
+            )
+        ]
+
+    @staticmethod
+    def legacy_suitability(input_data):
+        analysis = {}
+
+        rainfall = input_data["rainfall"]
+        if 100 <= rainfall <= 200:
+            status, level = "Ideal", "good"
+        elif 60 <= rainfall < 100 or 200 < rainfall <= 250:
+            status, level = "Acceptable", "moderate"
+        else:
+            status, level = "Low Suitability", "poor"
+        analysis["Rainfall"] = {"status": status, "level": level, "value": f"{rainfall} mm"}
+
+        temp = input_data["temperature"]
+        if 20 <= temp <= 30:
+            status, level = "Optimal", "good"
+        elif 15 <= temp < 20 or 30 < temp <= 35:
+            status, level = "Moderate", "moderate"
+        else:
+            status, level = "High Risk", "poor"
+        analysis["Temperature"] = {"status": status, "level": level, "value": f"{temp} °C"}
+
+        ph = input_data["ph"]
+        if 6 <= ph <= 7.5:
+            status, level = "Balanced", "good"
+        elif 5.5 <= ph < 6 or 7.5 < ph <= 8:
+            status, level = "Slightly Off", "moderate"
+        else:
+            status, level = "Unsuitable", "poor"
+        analysis["Soil pH"] = {"status": status, "level": level, "value": ph}
+
+        nitrogen = input_data["N"]
+        if nitrogen >= 80:
+            status, level = "Sufficient", "good"
+        elif 50 <= nitrogen < 80:
+            status, level = "Moderate", "moderate"
+        else:
+            status, level = "Low", "poor"
+        analysis["Nitrogen"] = {"status": status, "level": level, "value": f"{nitrogen} kg/ha"}
+
+        return analysis
+
+    @staticmethod
+    def legacy_explanation(input_data, top_crop, feature_importance):
+        reasons = []
+
+        rainfall = input_data["rainfall"]
+        temperature = input_data["temperature"]
+        ph = input_data["ph"]
+
+        if rainfall > 150:
+            reasons.append("high rainfall conditions")
+        elif rainfall < 60:
+            reasons.append("low rainfall conditions")
+        else:
+            reasons.append("moderate rainfall levels")
+
+        if 20 <= temperature <= 30:
+            reasons.append("optimal temperature range")
+        elif temperature > 35:
+            reasons.append("high temperature conditions")
+
+        if 6 <= ph <= 7.5:
+            reasons.append("near-neutral soil pH ideal for nutrient absorption")
+        elif ph < 5.5:
+            reasons.append("acidic soil conditions")
+
+        if feature_importance:
+            top_feature = feature_importance[0]["feature"]
+            reasons.append(f"{top_feature} being a key influencing factor")
+
+        return (
+            f"{top_crop} is recommended due to "
+            + ", ".join(reasons)
+            + ". These conditions align well with its growth requirements."
+        )
+
+    def assertSameOutputs(self, rows, actual, expected):
+        # Report a few differing rows; a full list diff would take minutes
+        differing = [
+            (row, got, want)
+            for row, got, want in zip(rows, actual, expected)
+            if got != want
+        ]
+        self.assertEqual(len(actual), len(expected))
+        self.assertEqual(differing[:3], [], f"{len(differing)} rows differ")
+
+    def test_suitability_matches_legacy(self):
+        rows = self.rows()
+        expected = [self.legacy_suitability(row) for row in rows]
+
+        # One batch goes through np.digitize, single rows through bisect
+        self.assertSameOutputs(rows, analyze_suitability_batch(rows), expected)
+        self.assertSameOutputs(
+            rows[::7], [analyze_suitability(row) for row in rows[::7]], expected[::7]
+        )
+
+    def test_explanation_matches_legacy(self):
+        rows = self.rows()
+        importance = [{"feature": "Rainfall", "importance": 0.4}]
+        expected = [self.legacy_explanation(row, "rice", importance) for row in rows]
+
+        self.assertSameOutputs(
+            rows,
+            generate_explanations(rows, ["rice"] * len(rows), [importance] * len(rows)),
+            expected,
+        )
+        self.assertSameOutputs(
+            rows[::7],
+            [generate_explanation(row, "rice", importance) for row in rows[::7]],
+            expected[::7],
+        )
+
+    def test_advisory_flags_match_legacy(self):
+        for name, (feature, legacy) in self.ADVISORY.items():
+            for value in self.values(feature):
+                with self.subTest(name=name, value=value):
+                    self.assertEqual(advisory_flag(name, value), legacy(value))
+
+
+class LookupGridTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.version = current_version()
+        cls.grid = LookupGrid.build(cls.version, bins=3, agreement_samples=100)
+
+    def setUp(self):
+        previous = lookup_grid._grids.get(self.version.name)
+        if previous is None:
+            self.addCleanup(lookup_grid._grids.pop, self.version.name, None)
+        else:
+            self.addCleanup(lookup_grid._grids.__setitem__, self.version.name, previous)
+        lookup_grid._grids[self.version.name] = self.grid
+
+    def test_agreement_survives_a_round_trip(self):
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), "grid.npz")
+        self.grid.save(path)
+
+        self.assertTrue(0 <= self.grid.agreement <= 1)
+        self.assertEqual(LookupGrid.load(path).agreement, self.grid.agreement)
+
+    def test_grid_answers_report_the_snapped_inputs(self):
+        row = random_inputs(1, seed=5)[0]
+        sweep = what_if(row, ["rainfall"], version=self.version, min_agreement=0)
+
+        self.assertEqual(sweep["source"], "grid")
+        self.assertEqual(
+            sweep["snapped_inputs"],
+            {
+                feature: value
+                for feature, value in self.grid.snapped(row).items()
+                if feature != "rainfall"
+            },
+        )
+
+    def test_model_answers_below_the_agreement_floor(self):
+        row = random_inputs(1, seed=5)[0]
+        sweep = what_if(
+            row, ["rainfall"], version=self.version,
+            min_agreement=self.grid.agreement + 0.01,
+        )
+
+        self.assertEqual(sweep["source"], "model")
+        self.assertIsNone(sweep["snapped_inputs"])
+
+
+class BatchPredictionTests(TestCase):
+    SAMPLE = {
+        "nitrogen": 90, "phosphorus": 42, "potassium": 43, "temperature": 20.9,
+        "humidity": 82, "ph": 6.5, "rainfall": 203,
+    }
+
+    def setUp(self):
+        self.user = User.objects.create(username="batcher")
+
+    def post(self, body):
+        request = RequestFactory().post(
+            "/api/predict/batch/",
+            body if isinstance(body, str) else json.dumps(body),
+            content_type="application/json",
+        )
+        request.user = self.user
+        response = predict_crop_batch_view(request)
+        return response.status_code, json.loads(response.content)
+
+    def test_rejects_invalid_batches(self):
+        missing_ph = {key: value for key, value in self.SAMPLE.items() if key != "ph"}
+        cases = [
+            ("{", "Invalid JSON"),
+            ({"samples": []}, "samples must be a non-empty list"),
+            ({"samples": {"nitrogen": 1}}, "samples must be a non-empty list"),
+            ({"samples": [self.SAMPLE, missing_ph]}, "Sample 1: Missing field: ph"),
+            (
+                {"samples": [self.SAMPLE, {**self.SAMPLE, "rainfall": "lots"}]},
+                "Sample 1: rainfall must be a number",
+            ),
+        ]
+        for body, error in cases:
+            with self.subTest(error=error):
+                self.assertEqual(self.post(body), (400, {"error": error}))
+
+        with override_settings(PREDICTION_BATCH_MAX_SIZE=2):
+            status, data = self.post({"samples": [self.SAMPLE] * 3})
+        self.assertEqual((status, data), (400, {"error": "At most 2 samples per batch"}))
+        self.assertFalse(Prediction.objects.exists())
+
+    def test_results_follow_sample_order(self):
+        samples = [
+            {
+                "nitrogen": row["N"], "phosphorus": row["P"], "potassium": row["K"],
+                "temperature": row["temperature"], "humidity": row["humidity"],
+                "ph": row["ph"], "rainfall": row["rainfall"],
+            }
+            for row in random_inputs(40, seed=8)
+        ]
+
+        status, data = self.post({"samples": samples})
+
+        self.assertEqual(status, 200)
+        self.assertEqual(data["count"], len(samples))
+        for sample, result in zip(samples, data["results"]):
+            expected = predict_crop(to_input_data(sample))
+            self.assertEqual(result["predictions"], expected["top_3_crops"])
+
+        stored = Prediction.objects.filter(user=self.user).order_by("id")
+        self.assertEqual(
+            [row.rainfall for row in stored], [sample["rainfall"] for sample in samples]
+        )
+
+
+class PredictionCacheTests(TestCase):
+    # Every input in the middle of its PRECISION step
+    BASE = {
+        "N": 50, "P": 40, "K": 40, "temperature": 25.0,
+        "humidity": 70.0, "ph": 6.5, "rainfall": 100,
+    }
+
+    def setUp(self):
+        self.addCleanup(setattr, prediction_pipeline, "_result_cache", None)
+        prediction_pipeline._result_cache = None
+
+    def test_cache_is_off_by_default(self):
+        self.assertIsNone(prediction_pipeline.get_result_cache())
+        self.assertIsNone(run_cached_prediction(self.BASE)[1])
+        self.assertIsNone(run_cached_prediction(self.BASE)[1])
+
+    def test_hits_stay_inside_one_quantum(self):
+        config = {
+            **settings.PREDICTION_CACHE,
+            "ENABLED": True,
+            "PRECISION": {"N": 1, "P": 1, "K": 1, "temperature": 0.5,
+                          "humidity": 0.5, "ph": 0.1, "rainfall": 1},
+        }
+        with override_settings(PREDICTION_CACHE=config):
+            self.assertIsNone(run_cached_prediction(self.BASE)[1])
+
+            for feature, step in config["PRECISION"].items():
+                with self.subTest(feature=feature):
+                    inside = {**self.BASE, feature: self.BASE[feature] + 0.4 * step}
+                    outside = {**self.BASE, feature: self.BASE[feature] + 0.6 * step}
+
+                    self.assertEqual(run_cached_prediction(inside)[1], "cache")
+                    self.assertIsNone(run_cached_prediction(outside)[1])
+
+
+class NeighbourIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        self.index = NeighbourIndex(tolerance={"a": 1, "b": 10}, capacity=3)
+
+    def test_reuses_only_within_tolerance_on_every_feature(self):
+        self.index.add("v1", {"a": 5.0, "b": 50.0}, "five")
+
+        self.assertEqual(self.index.query("v1", {"a": 5.9, "b": 41.0}), "five")
+        self.assertIsNone(self.index.query("v1", {"a": 6.1, "b": 50.0}))
+        self.assertIsNone(self.index.query("v1", {"a": 5.0, "b": 60.5}))
+        self.assertIsNone(self.index.query("v2", {"a": 5.0, "b": 50.0}))
+
+    def test_returns_the_nearest_across_cell_edges(self):
+        # Cells are 2 tolerances wide: a = 1.9 and a = 2.1 sit in different cells
+        self.index.add("v1", {"a": 1.9, "b": 0.0}, "near")
+        self.index.add("v1", {"a": 3.0, "b": 0.0}, "far")
+
+        self.assertEqual(self.index.query("v1", {"a": 2.1, "b": 0.0}), "near")
+        self.assertEqual(self.index.query("v1", {"a": 2.9, "b": 0.0}), "far")
+
+    def test_capacity_drops_the_oldest_entries(self):
+        for i in range(4):
+            self.index.add("v1", {"a": 10.0 * i, "b": 0.0}, i)
+
+        self.assertEqual(len(self.index), 3)
+        self.assertIsNone(self.index.query("v1", {"a": 0.0, "b": 0.0}))
+        self.assertEqual(self.index.query("v1", {"a": 30.0, "b": 0.0}), 3)
+
+
+class ModelVersionMetadataTests(TestCase):
+
+    def test_for_version_does_not_write(self):
+        with self.assertNumQueries(1):
+            self.assertIsNone(ModelVersionMetadata.for_version("no-such-version"))
+        self.assertFalse(ModelVersionMetadata.objects.exists())
+
+    def install_envelopes(self, version, index):
+        # The envelope file is a build artefact; tests bring their own
+        previous = envelopes._envelopes.get(version.name)
+        if previous is None:
+            self.addCleanup(envelopes._envelopes.pop, version.name, None)
+        else:
+            self.addCleanup(envelopes._envelopes.__setitem__, version.name, previous)
+        envelopes._envelopes[version.name] = index
+
+    def test_history_keeps_the_stored_envelopes(self):
+        version = current_version()
+        current = CropEnvelopes.build(version)
+        self.install_envelopes(version, current)
+        # Forget metadata recorded by earlier tests, whose rows are gone
+        models._recorded_versions.discard(version.name)
+        models._version_metadata.pop(version.name, None)
+
+        user = User.objects.create(username="grower")
+        row = random_inputs(1, seed=4)[0]
+        fill_history(user, 1, [row])
+        stored = Prediction.objects.get(user=user).full_result
+        self.assertIsNotNone(ModelVersionMetadata.for_version(version.name).envelopes)
+
+        # A rebuild moves every envelope; stored rows keep their snapshot
+        rebuilt = CropEnvelopes(
+            version.name, current.features, current.classes,
+            current.low - 1, current.high + 1,
+        )
+        self.install_envelopes(version, rebuilt)
+
+        self.assertEqual(Prediction.objects.get(user=user).full_result, stored)
+
+
+class HistoryPageTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="pager")
+        fill_history(cls.user, 12, random_inputs(12, seed=9))
+
+        # Pairs of rows share a timestamp, so pages must break ties on id
+        now = timezone.now()
+        ids = list(
+            Prediction.objects.filter(user=cls.user).order_by("id").values_list("id", flat=True)
+        )
+        Prediction.objects.bulk_update(
+            [
+                Prediction(id=pk, created_at=now - timedelta(hours=12 - i // 2))
+                for i, pk in enumerate(ids)
+            ],
+            ["created_at"],
+        )
+
+    def pages(self, limit, between_pages=None):
+        ids, cursor = [], None
+        while True:
+            items, cursor = history_page(self.user, ["id"], limit, cursor)
+            ids += [item["id"] for item in items]
+            if cursor is None:
+                return ids
+            if between_pages is not None:
+                between_pages()
+
+    def test_pages_cover_the_history_once_in_order(self):
+        expected = list(
+            Prediction.objects.filter(user=self.user)
+            .order_by("-created_at", "-id").values_list("id", flat=True)
+        )
+        for limit in (1, 3, 5, 12, 50):
+            with self.subTest(limit=limit):
+                self.assertEqual(self.pages(limit), expected)
+
+    def test_inserts_do_not_shift_later_pages(self):
+        expected = list(
+            Prediction.objects.filter(user=self.user)
+            .order_by("-created_at", "-id").values_list("id", flat=True)
+        )
+        row = random_inputs(1, seed=10)
+
+        # Newer rows land before the cursor and never appear in later pages
+        self.assertEqual(
+            self.pages(5, between_pages=lambda: fill_history(self.user, 2, row)),
+            expected,
+        )
+
+    def test_rejects_a_malformed_cursor(self):
+        with self.assertRaises(InvalidCursor):
+            history_page(self.user, ["id"], 5, "not-a-cursor")
+
+
+@tag("slow")
+class HistoryExportTests(TestCase):
+    ROWS = 100_000
+    # Peak is about 31 MB with 2000-row blocks, whatever the row count
+    CEILING_MB = 48
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="exporter")
+        fill_history(cls.user, cls.ROWS, random_inputs(200))
+
+    def export(self, export_format):
+        request = RequestFactory().get(
+            "/api/history/export/", {"format": export_format}
+        )
+        request.user = self.user
+        return export_prediction_history(request).streaming_content
+
+    def test_memory_is_bounded(self):
+        tracemalloc.start()
+        try:
+            lines = sum(block.count(b"\n") for block in self.export("ndjson"))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(lines, self.ROWS)
+        self.assertLess(peak / 2**20, self.CEILING_MB)
+
+    def test_csv_has_a_row_per_prediction(self):
+        lines = sum(block.count(b"\n") for block in self.export("csv"))
+        self.assertEqual(lines, self.ROWS + 1)
+
+
+class InsightSummaryTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username="tied")
+
+    def predict(self, *crops):
+        Prediction.objects.bulk_create([
+            Prediction(
+                user=self.user,
+                nitrogen=50, phosphorus=40, potassium=40, temperature=25,
+                humidity=70, rainfall=100, ph=6.5,
+                result={"predictions": [{"crop": crop, "confidence": 0.9}]},
+            )
+            for crop in crops
+        ])
+
+    def most_recommended(self):
+        summary = UserInsightSummary.objects.get(user=self.user)
+        self.assertTrue(summary.matches(UserInsightSummary.compute(self.user.id)))
+        return summary.as_insights()["most_recommended_crop"]
+
+    def test_ties_go_to_the_crop_recommended_first(self):
+        self.predict("maize", "rice", "rice", "maize")
+        self.assertEqual(self.most_recommended(), "maize")
+
+        # Key order is not kept by jsonb; reversing it changes nothing
+        summary = UserInsightSummary.objects.get(user=self.user)
+        summary.crop_counts = dict(reversed(list(summary.crop_counts.items())))
+        summary.save()
+        self.assertEqual(self.most_recommended(), "maize")
+
+    def test_removing_a_crops_first_prediction_moves_its_first_id(self):
+        self.predict("maize", "rice", "rice", "maize")
+        Prediction.objects.filter(user=self.user).order_by("id").first().delete()
+        self.assertEqual(self.most_recommended(), "rice")
+
+        # maize now first appears after rice, so rice keeps the tie
+        self.predict("maize")
+        self.assertEqual(self.most_recommended(), "rice")
+
+
+class TopCropQuerySetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="grower")
+        other = User.objects.create(username="other grower")
+
+        rows = [
+            (cls.user, {"predictions": [{"crop": "rice", "confidence": 0.9}]}),
+            (cls.user, {"predictions": [{"crop": "rice", "confidence": 0.5}]}),
+            (cls.user, {"predictions": [{"label": "maize", "confidence": 0.7}]}),
+            (cls.user, {"predictions": []}),
+            (other, {"predictions": [{"name": "rice", "confidence": 0.4}]}),
+            (other, {"predictions": [{"crop": "", "confidence": 0.8}]}),
+        ]
+        Prediction.objects.bulk_create([
+            Prediction(
+                user=user, nitrogen=50, phosphorus=40, potassium=40, temperature=25,
+                humidity=70, rainfall=100, ph=6.5, result=result,
+            )
+            for user, result in rows
+        ])
+
+    def test_with_top_crop_skips_rows_without_one(self):
+        self.assertEqual(Prediction.objects.with_top_crop().count(), 4)
+
+    def test_filter_top_crop_bounds_are_inclusive(self):
+        rice = Prediction.objects.filter_top_crop("rice")
+        self.assertEqual(rice.count(), 3)
+        self.assertEqual(
+            Prediction.objects.filter_top_crop("rice", min_confidence=0.5).count(), 2
+        )
+        self.assertEqual(
+            Prediction.objects.filter_top_crop(min_confidence=0.5, max_confidence=0.7).count(), 2
+        )
+        self.assertEqual(
+            Prediction.objects.filter(user=self.user).filter_top_crop("rice").count(), 2
+        )
+
+    def test_top_crop_counts_most_frequent_first(self):
+        counts = Prediction.objects.top_crop_counts()
+
+        self.assertEqual(
+            [(row["top_crop"], row["count"]) for row in counts],
+            [("rice", 3), ("maize", 1)],
+        )
+        self.assertAlmostEqual(counts[0]["average_confidence"], 0.6)
+
+
+class BackfillTopCropMigrationTests(TestCase):
+    migration = import_module("predictions.migrations.0008_backfill_prediction_top_crop")
+
+    def test_fills_every_batch(self):
+        user = User.objects.create(username="legacy")
+        results = [
+            {"predictions": [{"crop": "rice", "confidence": 0.9}]},
+            {"predictions": [{"label": "maize", "confidence": 0.6}]},
+            {"predictions": [{"name": "jute", "confidence": 0.3}]},
+            {"predictions": []},
+            {},
+        ]
+        Prediction.objects.bulk_create([
+            Prediction(
+                user=user, nitrogen=50, phosphorus=40, potassium=40, temperature=25,
+                humidity=70, rainfall=100, ph=6.5, result=result,
+            )
+            for result in results
+        ])
+        # Rows from before the columns existed
+        Prediction.objects.update(top_crop=None, top_confidence=None)
+
+        with mock.patch.object(self.migration, "BATCH_SIZE", 2):
+            self.migration.backfill_top_crop(django_apps, None)
+
+        self.assertEqual(
+            list(
+                Prediction.objects.order_by("id").values_list("top_crop", "top_confidence")
+            ),
+            [("rice", 0.9), ("maize", 0.6), ("jute", 0.3), (None, None), (None, None)],
+        )
+
+
+class ArchiveTests(TestCase):
+    """Archived predictions keep counting towards insights and trends."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="archivist")
+        fill_history(cls.user, 120, random_inputs(120, seed=5))
+
+        # One prediction every three days, newest now
+        now = timezone.now()
+        Prediction.objects.bulk_update(
+            [
+                Prediction(id=pk, created_at=now - timedelta(days=3 * i))
+                for i, pk in enumerate(
+                    Prediction.objects.filter(user=cls.user)
+                    .order_by("-id").values_list("id", flat=True)
+                )
+            ],
+            ["created_at"],
+        )
+        cls.cutoff = archive_cutoff(90)
+
+    def get(self, view, path, **params):
+        request = RequestFactory().get(path, params)
+        request.user = self.user
+        response = import_string(view)(request)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def history_views(self):
+        # Closed trend buckets are cached; read them from the tables
+        cache.clear()
+        return (
+            self.get("predictions.views.user_insights", "/api/insights/"),
+            self.get(
+                "predictions.views.prediction_trends_view", "/api/history/trends/",
+                period="week",
+                **{"from": (timezone.localdate() - timedelta(days=400)).isoformat()},
+            ),
+        )
+
+    def test_archiving_keeps_insights_and_trends(self):
+        before = self.history_views()
+
+        moved = sum(rows for *_, rows in archive_history("prediction", self.cutoff))
+        self.assertGreater(moved, 0)
+        self.assertEqual(self.history_views(), before)
+
+        summary = UserInsightSummary.objects.get(user=self.user)
+        self.assertTrue(summary.matches(UserInsightSummary.compute(self.user.id)))
+
+        for pk in HistoryArchive.objects.values_list("pk", flat=True):
+            restore_partition(pk)
+        self.assertEqual(Prediction.objects.filter(user=self.user).count(), 120)
+        self.assertEqual(self.history_views(), before)
+
+    def test_delete_history_clears_archived_predictions(self):
+        list(archive_history("prediction", self.cutoff))
+        delete_history(self.user.id, "prediction")
+
+        summary = UserInsightSummary.objects.get(user=self.user)
+        self.assertEqual(summary.total, 0)
+        self.assertEqual(summary.crop_counts, {})
+        self.assertFalse(HistoryArchive.objects.exists())
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Per-user history views run a fixed number of queries, each read
+    through the (user, time) index in index order.
+    """
+
+    HISTORY_ROWS = 200
+
+    # view, path, queries, {table: index every query on it must use}
+    BUDGETS = [
+        (
+            "predictions.views.prediction_history", "/api/history/", 1,
+            {"predictions_prediction": "prediction_user_created_idx"},
+        ),
+        (
+            "predictions.views.user_insights", "/api/insights/", 1, {},
+        ),
+        (
+            "predictions.views.prediction_trends_view", "/api/history/trends/", 3,
+            {
+                "predictions_prediction": "prediction_user_created_idx",
+                # SQLite names the unique constraint's index itself
+                "predictions_historyarchive": "(user_id=? AND kind=? AND month",
+            },
+        ),
+        (
+            "predictions.views.smart_farming", "/smart-farming/", 1,
+            {"predictions_prediction": "prediction_user_created_idx"},
+        ),
+        (
+            "voice.views.voice_assistant_page", "/voice/", 1,
+            {"voice_voicequery": "voicequery_user_time_idx"},
+        ),
+        (
+            "voice.views.query_history", "/voice/history/", 1,
+            {"voice_voicequery": "voicequery_user_time_idx"},
+        ),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="farmer")
+        # Other users' rows make a plain user_id index scan look cheap
+        other = User.objects.create(username="neighbour")
+
+        rows = random_inputs(20)
+        for user in (cls.user, other):
+            fill_history(user, cls.HISTORY_ROWS, rows)
+            VoiceQuery.objects.bulk_create([
+                VoiceQuery(user=user, query="When to sow rice?", response="June.")
+                for _ in range(cls.HISTORY_ROWS)
+            ])
+
+    @staticmethod
+    def query_plan(sql):
+        """SQLite's EXPLAIN QUERY PLAN details for one captured query."""
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            return [row[-1] for row in cursor.fetchall()]
+
+    def test_query_budgets(self):
+        factory = RequestFactory()
+
+        for view, path, budget, indexes in self.BUDGETS:
+            with self.subTest(view=view):
+                request = factory.get(path)
+                request.user = self.user
+
+                with self.assertNumQueries(budget) as queries:
+                    response = import_string(view)(request)
+                    if hasattr(response, "render"):
+                        response.render()
+                self.assertEqual(response.status_code, 200)
+
+                if connection.vendor != "sqlite":
+                    continue
+
+                for query in queries.captured_queries:
+                    tables = set(re.findall(r'(?:FROM|JOIN)\s+"(\w+)"', query["sql"]))
+                    plan = self.query_plan(query["sql"])
+
+                    for table in tables & set(indexes):
+                        self.assertTrue(
+                            any(table in step and indexes[table] in step for step in plan),
+                            f"{table} not read through {indexes[table]}: {plan}",
+                        )
+                    self.assertFalse(
+                        any("TEMP B-TREE FOR ORDER BY" in step for step in plan),
+                        f"sorts in a temporary B-tree: {plan}",
+                    )
@@ -5,7 +5,14 @@ from .news_views import agro_news
 
 urlpatterns = [
     path("predict/", predict_crop, name="predict"),
+    path("predict/batch/", views.predict_crop_batch, name="predict_batch"),
+    path("predict/what-if/", views.what_if, name="what_if"),
+    path("predict/sensitivity/", views.sensitivity, name="sensitivity"),
+    path("predict/feasibility/", views.feasibility, name="feasibility"),
+    path("ml/stats/", views.ml_stats, name="ml_stats"),
     path("history/", prediction_history, name="prediction_history"),
+    path("history/export/", views.export_prediction_history, name="export_prediction_history"),
+    path("history/trends/", views.prediction_trends_view, name="prediction_trends"),
     path("insights/", views.user_insights, name="insights"),
     path("history/<int:pk>/", views.delete_prediction, name="delete_prediction"),
     path("history/reset/", views.reset_history, name="reset_history"),
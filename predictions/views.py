@@ -1,27 +1,44 @@
 from django.shortcuts import render
 import json
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 
-from .models import Prediction
-from ml.predictor import predict_crop as ml_predict_crop
+from .models import Prediction, UserInsightSummary
 
-from collections import Counter
-from django.db.models import Avg
-
-from ml.explainer import generate_explanation
-from ml.suitability import analyze_suitability
+from django.conf import settings
 
 from django.views.decorators.http import require_http_methods
 from django.shortcuts import get_object_or_404
 
 from .services.advisory_engine import generate_modern_advisory
+from .services.archive import delete_history
+from .services.history import (
+    InvalidCursor,
+    export_history,
+    history_page,
+    parse_fields,
+)
+from .services.prediction_pipeline import (
+    pipeline_stats,
+    run_batch_prediction,
+    run_cached_prediction,
+    run_feasibility,
+    run_sensitivity,
+    run_what_if,
+    to_input_data,
+    validate_sample,
+)
+from .services.trends import parse_range, prediction_trends
+from core.write_behind import flush_user, save_later
 from weather.services import fetch_weather_by_coordinates
 
 @require_http_methods(["DELETE"])
 @login_required
 def delete_prediction(request, pk):
+    # The row may still be waiting in the write-behind buffer
+    flush_user(request.user)
     prediction = get_object_or_404(
         Prediction,
         id=pk,
@@ -35,7 +52,9 @@ def delete_prediction(request, pk):
 @require_http_methods(["DELETE"])
 @login_required
 def reset_history(request):
-    Prediction.objects.filter(user=request.user).delete()
+    # Buffered rows would otherwise land after the reset
+    flush_user(request.user)
+    delete_history(request.user.id, "prediction")
     return JsonResponse({"message": "All history cleared"})
 
 
@@ -58,158 +77,384 @@ def predict_crop(request):
             status=400
         )
 
-    required_fields = [
-        "nitrogen",
-        "phosphorus",
-        "potassium",
-        "temperature",
-        "humidity",
-        "rainfall",
-        "ph",
-    ]
-
-    for field in required_fields:
-        if field not in data:
+    error = validate_sample(data)
+    if error:
+        return JsonResponse(
+            {"error": error},
+            status=400
+        )
+
+    # -------------------------------
+    # REAL ML PREDICTION
+    # -------------------------------
+    input_data = to_input_data(data)
+
+    response_data, reused_from = run_cached_prediction(input_data)
+
+    # SAME structure to DB
+    save_later(Prediction(
+        user=request.user,
+        nitrogen=data["nitrogen"],
+        phosphorus=data["phosphorus"],
+        potassium=data["potassium"],
+        temperature=data["temperature"],
+        humidity=data["humidity"],
+        rainfall=data["rainfall"],
+        ph=data["ph"],
+        result=response_data
+    ))
+
+    # Return SAME structure to frontend, plus where the answer came from
+    return JsonResponse({**response_data, "reused": reused_from})
+
+
+@csrf_exempt
+@login_required
+def predict_crop_batch(request):
+    """
+    POST /api/predict/batch/
+    Body: {"samples": [{...same fields as /api/predict/...}, ...]}
+    Scores all samples with a single model call and stores
+    them with one bulk insert.
+    """
+    if request.method != "POST":
+        return JsonResponse(
+            {"error": "Only POST method is allowed"},
+            status=405
+        )
+
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse(
+            {"error": "Invalid JSON"},
+            status=400
+        )
+
+    samples = data.get("samples") if isinstance(data, dict) else data
+
+    if not isinstance(samples, list) or not samples:
+        return JsonResponse(
+            {"error": "samples must be a non-empty list"},
+            status=400
+        )
+
+    max_size = settings.PREDICTION_BATCH_MAX_SIZE
+    if len(samples) > max_size:
+        return JsonResponse(
+            {"error": f"At most {max_size} samples per batch"},
+            status=400
+        )
+
+    for index, sample in enumerate(samples):
+        error = validate_sample(sample)
+        if error:
             return JsonResponse(
-                {"error": f"Missing field: {field}"},
+                {"error": f"Sample {index}: {error}"},
                 status=400
             )
 
-        if not isinstance(data[field], (int, float)):
+    input_rows = [to_input_data(sample) for sample in samples]
+    results = run_batch_prediction(input_rows)
+
+    Prediction.objects.bulk_create([
+        Prediction(
+            user=request.user,
+            nitrogen=sample["nitrogen"],
+            phosphorus=sample["phosphorus"],
+            potassium=sample["potassium"],
+            temperature=sample["temperature"],
+            humidity=sample["humidity"],
+            rainfall=sample["rainfall"],
+            ph=sample["ph"],
+            result=response_data
+        )
+        for sample, response_data in zip(samples, results)
+    ], batch_size=500)
+
+    return JsonResponse({
+        "count": len(results),
+        "results": results
+    })
+
+
+
+@csrf_exempt
+@login_required
+def what_if(request):
+    """
+    POST /api/predict/what-if/
+    Body: {"base": {...same fields as /api/predict/...},
+           "vary": ["rainfall"] or ["rainfall", "temperature"],
+           "points": 50, "exact": false}
+    Returns the top crop along a sweep of one feature, or a heatmap over
+    two. The precomputed lookup grid answers only when its measured
+    agreement with the model reaches PREDICTION_WHAT_IF_MIN_AGREEMENT;
+    it holds the other fields at grid points, listed in "snapped_inputs".
+    """
+    if request.method != "POST":
+        return JsonResponse(
+            {"error": "Only POST method is allowed"},
+            status=405
+        )
+
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse(
+            {"error": "Invalid JSON"},
+            status=400
+        )
+
+    if not isinstance(data, dict):
+        return JsonResponse({"error": "Body must be an object"}, status=400)
+
+    base = data.get("base")
+    error = validate_sample(base)
+    if error:
+        return JsonResponse({"error": f"base: {error}"}, status=400)
+
+    vary = data.get("vary")
+    if (
+        not isinstance(vary, list)
+        or len(vary) not in (1, 2)
+        or len(set(vary)) != len(vary)
+        or any(field not in base for field in vary)
+    ):
+        return JsonResponse(
+            {"error": "vary must list one or two distinct input fields"},
+            status=400
+        )
+
+    points = data.get("points")
+    if points is not None and (not isinstance(points, int) or not 2 <= points <= 200):
+        return JsonResponse(
+            {"error": "points must be an integer between 2 and 200"},
+            status=400
+        )
+
+    return JsonResponse(
+        run_what_if(base, vary, points=points, exact=bool(data.get("exact")))
+    )
+
+
+@csrf_exempt
+@login_required
+def sensitivity(request):
+    """
+    POST /api/predict/sensitivity/
+    Body: {"base": {...same fields as /api/predict/...},
+           "ranges": [{"feature": "ph", "start": 4, "stop": 9, "steps": 200}],
+           "min_probability": 0.05}
+    One or two ranges; the full sweep is scored in a single model call.
+    Returns per-crop probability curves, the top crop at every point and
+    where it changes.
+    """
+    if request.method != "POST":
+        return JsonResponse(
+            {"error": "Only POST method is allowed"},
+            status=405
+        )
+
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse(
+            {"error": "Invalid JSON"},
+            status=400
+        )
+
+    if not isinstance(data, dict):
+        return JsonResponse({"error": "Body must be an object"}, status=400)
+
+    base = data.get("base")
+    error = validate_sample(base)
+    if error:
+        return JsonResponse({"error": f"base: {error}"}, status=400)
+
+    ranges = data.get("ranges")
+    if not isinstance(ranges, list) or len(ranges) not in (1, 2):
+        return JsonResponse(
+            {"error": "ranges must list one or two feature ranges"},
+            status=400
+        )
+
+    points = 1
+    for item in ranges:
+        if (
+            not isinstance(item, dict)
+            or item.get("feature") not in base
+            or not isinstance(item.get("start"), (int, float))
+            or not isinstance(item.get("stop"), (int, float))
+            or not isinstance(item.get("steps"), int)
+            or item["steps"] < 2
+        ):
             return JsonResponse(
-                {"error": f"{field} must be a number"},
+                {"error": "Each range needs feature, start, stop and steps >= 2"},
                 status=400
             )
+        points *= item["steps"]
 
-    # -------------------------------
-    # REAL ML PREDICTION
-    # -------------------------------
-    input_data = {
-        "N": data["nitrogen"],
-        "P": data["phosphorus"],
-        "K": data["potassium"],
-        "temperature": data["temperature"],
-        "humidity": data["humidity"],
-        "rainfall": data["rainfall"],
-        "ph": data["ph"],
-    }
+    if len({item["feature"] for item in ranges}) != len(ranges):
+        return JsonResponse({"error": "Range features must differ"}, status=400)
 
-    # ml_result = ml_predict_crop(input_data)
-
-    # # -------------------------------
-    # # SAVE TO DATABASE
-    # # -------------------------------
-    # Prediction.objects.create(
-    #     user=request.user,
-    #     nitrogen=data["nitrogen"],
-    #     phosphorus=data["phosphorus"],
-    #     potassium=data["potassium"],
-    #     temperature=data["temperature"],
-    #     humidity=data["humidity"],
-    #     rainfall=data["rainfall"],
-    #     ph=data["ph"],
-    #     result=ml_result
-    # )
-
-    # # -------------------------------
-    # # RETURN RESPONSE
-    # # -------------------------------
-    
-    ml_result = ml_predict_crop(input_data)
+    max_points = settings.PREDICTION_SENSITIVITY_MAX_POINTS
+    if points > max_points:
+        return JsonResponse(
+            {"error": f"At most {max_points} sweep points"},
+            status=400
+        )
 
-    # -------------------------------
-    # FORMAT FEATURE IMPORTANCE
-    # -------------------------------
-    raw_importance = ml_result["feature_importance"]
+    min_probability = data.get("min_probability", 0.05)
+    if not isinstance(min_probability, (int, float)):
+        return JsonResponse(
+            {"error": "min_probability must be a number"},
+            status=400
+        )
 
-    labels = [item["feature"] for item in raw_importance]
-    values = [item["importance"] for item in raw_importance]
+    return JsonResponse(
+        run_sensitivity(base, ranges, min_probability=min_probability)
+    )
 
-    # -------------------------------
-    # GENERATE EXPLANATION
-    # -------------------------------
-    from ml.explainer import generate_explanation
 
-    top_crop = ml_result["top_3_crops"][0]["crop"]
+@csrf_exempt
+@login_required
+def feasibility(request):
+    """
+    POST /api/predict/feasibility/
+    Body: {"sample": {...same fields as /api/predict/...}, "crop": "rice"}
+    Lists the crops whose requirement envelope contains the sample and,
+    when crop is given, the fields outside that crop's envelope.
+    Answered from the precomputed envelope index, without a model call.
+    """
+    if request.method != "POST":
+        return JsonResponse(
+            {"error": "Only POST method is allowed"},
+            status=405
+        )
 
-    explanation = generate_explanation(
-        input_data,
-        top_crop,
-        raw_importance
-    )
-    # -------------------------------
-    # GENERATE SUITABILITY ANALYSIS
-    # -------------------------------
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse(
+            {"error": "Invalid JSON"},
+            status=400
+        )
 
-    suitability_analysis = analyze_suitability(input_data)
+    if not isinstance(data, dict):
+        return JsonResponse({"error": "Body must be an object"}, status=400)
 
+    sample = data.get("sample")
+    error = validate_sample(sample)
+    if error:
+        return JsonResponse({"error": f"sample: {error}"}, status=400)
 
-    # -------------------------------
-    # FINAL RESPONSE STRUCTURE
-    # -------------------------------
-    response_data = {
-        "predictions": ml_result["top_3_crops"],
-        "feature_importance": {
-            "labels": labels,
-            "values": values
-        },
-        "explanation": explanation,
-        "suitability_analysis": suitability_analysis
-    }
+    crop = data.get("crop")
+    if crop is not None and not isinstance(crop, str):
+        return JsonResponse({"error": "crop must be a string"}, status=400)
 
-    
+    try:
+        result = run_feasibility(sample, crop)
+    except KeyError:
+        return JsonResponse({"error": f"Unknown crop: {crop}"}, status=400)
 
-    # SAME structure to DB
-    Prediction.objects.create(
-        user=request.user,
-        nitrogen=data["nitrogen"],
-        phosphorus=data["phosphorus"],
-        potassium=data["potassium"],
-        temperature=data["temperature"],
-        humidity=data["humidity"],
-        rainfall=data["rainfall"],
-        ph=data["ph"],
-        result=response_data
-    )
+    if result is None:
+        return JsonResponse(
+            {"error": "No crop envelopes built for the current model"},
+            status=503
+        )
 
-    # Return SAME structure to frontend
-    return JsonResponse(response_data)
+    return JsonResponse(result)
+
+
+@staff_member_required
+def ml_stats(request):
+    """
+    GET /api/ml/stats/
+    Model registry, micro-batching and result-cache counters.
+    """
+    return JsonResponse(pipeline_stats())
 
 
 
 @login_required
 def prediction_history(request):
+    """
+    GET /api/history/?limit=50&cursor=...&fields=id,inputs,top_prediction,created_at
+    Newest first, one page at a time. fields defaults to
+    id,inputs,result,created_at; top_prediction reads only the top crop
+    out of the stored result. next_cursor is null on the last page.
+    """
     if request.method != "GET":
         return JsonResponse(
             {"error": "Only GET method is allowed"},
             status=405
         )
 
-    predictions = Prediction.objects.filter(
-        user=request.user
-    ).order_by("-created_at")
-
-    data = []
-    for p in predictions:
-        data.append({
-            "id": p.id,
-            "inputs": {
-                "nitrogen": p.nitrogen,
-                "phosphorus": p.phosphorus,
-                "potassium": p.potassium,
-                "temperature": p.temperature,
-                "humidity": p.humidity,
-                "rainfall": p.rainfall,
-                "ph": p.ph,
-            },
-            "result": p.result,
-            "created_at": p.created_at.isoformat(),
-        })
+    flush_user(request.user)
 
-    return JsonResponse({"history": data})
+    try:
+        fields = parse_fields(request.GET.get("fields"))
+    except ValueError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+
+    limit = request.GET.get("limit", settings.PREDICTION_HISTORY_PAGE_SIZE)
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "limit must be an integer"}, status=400)
+
+    limit = max(1, min(limit, settings.PREDICTION_HISTORY_MAX_PAGE_SIZE))
+
+    try:
+        data, next_cursor = history_page(
+            request.user, fields, limit, request.GET.get("cursor")
+        )
+    except InvalidCursor as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+
+    return JsonResponse({"history": data, "next_cursor": next_cursor})
 
 
 
+@login_required
+def export_prediction_history(request):
+    """
+    GET /api/history/export/?format=ndjson|csv
+    Streams the user's whole history as a download, newest first.
+    """
+    if request.method != "GET":
+        return JsonResponse(
+            {"error": "Only GET method is allowed"},
+            status=405
+        )
+
+    flush_user(request.user)
+
+    export_format = request.GET.get("format", "ndjson")
+    if export_format not in ("ndjson", "csv"):
+        return JsonResponse(
+            {"error": "format must be ndjson or csv"},
+            status=400
+        )
+
+    content_type = {
+        "ndjson": "application/x-ndjson",
+        "csv": "text/csv",
+    }[export_format]
+
+    response = StreamingHttpResponse(
+        export_history(
+            request.user, export_format, settings.PREDICTION_EXPORT_CHUNK_SIZE
+        ),
+        content_type=content_type,
+    )
+    response["Content-Disposition"] = (
+        f'attachment; filename="prediction_history.{export_format}"'
+    )
+    return response
+
+
 @login_required
 def user_insights(request):
     if request.method != "GET":
@@ -218,9 +463,11 @@ def user_insights(request):
             status=405
         )
 
-    predictions = Prediction.objects.filter(user=request.user)
+    flush_user(request.user)
+
+    summary = UserInsightSummary.objects.filter(user=request.user).first()
 
-    if not predictions.exists():
+    if summary is None or summary.total == 0:
         return JsonResponse({
             "total_predictions": 0,
             "most_recommended_crop": None,
@@ -233,90 +480,43 @@ def user_insights(request):
             "average_conditions": {}
         })
 
-    # 1️⃣ Total predictions
-    total_predictions = predictions.count()
-
-    # 2️⃣ Crop frequency
-    top_crops = []
-
-    for p in predictions:
-
-        if not p.result:
-            continue
-
-        preds = p.result.get("predictions", [])
-
-        if not preds:
-            continue
+    return JsonResponse(summary.as_insights())
 
-        crop_data = preds[0]
 
-        crop_name = (
-            crop_data.get("crop")
-            or crop_data.get("label")
-            or crop_data.get("name")
+@login_required
+def prediction_trends_view(request):
+    """
+    GET /api/history/trends/?period=week&from=2025-01-01&to=2025-03-31
+
+    Per-bucket prediction counts, top crop and average conditions.
+    period is day, week or month (default week); from/to are inclusive
+    dates, widened to whole buckets. Without from, the last 30 days,
+    12 weeks or 12 months up to `to` (default today) are returned.
+    """
+    if request.method != "GET":
+        return JsonResponse(
+            {"error": "Only GET method is allowed"},
+            status=405
         )
 
-        if crop_name:
-            top_crops.append(crop_name)
-    crop_counter = Counter(top_crops)
-    crop_frequency = dict(crop_counter)
-
-    most_recommended_crop = None
-    if crop_counter:
-        most_recommended_crop = crop_counter.most_common(1)[0][0]
+    flush_user(request.user)
 
-    # 3️⃣ Confidence distribution
-    high = 0
-    medium = 0
-    low = 0
-
-    for p in predictions:
-        preds = p.result.get("predictions", [])
-
-        if not preds:
-            continue
-
-        confidence = preds[0].get("confidence", 0)
-
-        if confidence >= 0.7:
-            high += 1
-        elif confidence >= 0.4:
-            medium += 1
-        else:
-            low += 1
-
-    confidence_distribution = {
-        "high": high,
-        "medium": medium,
-        "low": low
-    }
-
-    # 4️⃣ Average environmental conditions
-    averages = predictions.aggregate(
-        avg_rainfall=Avg("rainfall"),
-        avg_temperature=Avg("temperature"),
-        avg_ph=Avg("ph"),
-        avg_humidity=Avg("humidity"),
-    )
-
-    average_conditions = {
-        "rainfall": round(averages["avg_rainfall"], 2),
-        "temperature": round(averages["avg_temperature"], 2),
-        "ph": round(averages["avg_ph"], 2),
-        "humidity": round(averages["avg_humidity"], 2),
-    }
+    period = request.GET.get("period", "week")
+    try:
+        starts = parse_range(
+            period, request.GET.get("from"), request.GET.get("to")
+        )
+    except ValueError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
 
     return JsonResponse({
-        "total_predictions": total_predictions,
-        "most_recommended_crop": most_recommended_crop,
-        "crop_frequency": crop_frequency,
-        "confidence_distribution": confidence_distribution,
-        "average_conditions": average_conditions,
+        "period": period,
+        "buckets": prediction_trends(request.user.id, period, starts),
     })
 
 @login_required
 def smart_farming(request):
+    flush_user(request.user)
     latest_prediction = (
         Prediction.objects
         .filter(user=request.user)
@@ -6,6 +6,22 @@
 // Chart instance reference
 let featureImportanceChart = null;
 
+// Bar colours for contributions towards / against the recommended crop
+const POSITIVE_COLOR = 'rgba(64, 145, 108, 0.8)';
+const POSITIVE_BORDER = 'rgba(45, 106, 79, 1)';
+const NEGATIVE_COLOR = 'rgba(214, 96, 77, 0.8)';
+const NEGATIVE_BORDER = 'rgba(178, 58, 44, 1)';
+
+/**
+ * Half-width of a symmetric axis that fits every value
+ * @param {number[]} values - Signed feature contributions
+ * @returns {number} The largest magnitude, rounded up to the next 0.05
+ */
+function contributionAxisBound(values) {
+  const largest = Math.max(0, ...values.map(value => Math.abs(value)));
+  return Math.max(0.05, Math.ceil(largest * 20) / 20);
+}
+
 /**
  * Initialize charts when DOM is ready
  */
@@ -24,7 +40,9 @@ function initializeCharts() {
 }
 
 /**
- * Create the feature importance chart
+ * Create the feature contribution chart. Values are each feature's
+ * signed contribution to the recommended crop's confidence, so the
+ * axis is centred on zero.
  * @param {HTMLCanvasElement} canvas - The canvas element for the chart
  */
 function createFeatureImportanceChart(canvas) {
@@ -40,26 +58,10 @@ function createFeatureImportanceChart(canvas) {
     data: {
       labels: defaultData.labels,
       datasets: [{
-        label: 'Feature Importance',
+        label: 'Contribution to confidence',
         data: defaultData.values,
-        backgroundColor: [
-          'rgba(45, 106, 79, 0.8)',
-          'rgba(64, 145, 108, 0.8)',
-          'rgba(82, 183, 136, 0.8)',
-          'rgba(149, 213, 178, 0.8)',
-          'rgba(216, 243, 220, 0.8)',
-          'rgba(45, 106, 79, 0.6)',
-          'rgba(64, 145, 108, 0.6)'
-        ],
-        borderColor: [
-          'rgba(45, 106, 79, 1)',
-          'rgba(64, 145, 108, 1)',
-          'rgba(82, 183, 136, 1)',
-          'rgba(149, 213, 178, 1)',
-          'rgba(216, 243, 220, 1)',
-          'rgba(45, 106, 79, 1)',
-          'rgba(64, 145, 108, 1)'
-        ],
+        backgroundColor: context => context.raw < 0 ? NEGATIVE_COLOR : POSITIVE_COLOR,
+        borderColor: context => context.raw < 0 ? NEGATIVE_BORDER : POSITIVE_BORDER,
         borderWidth: 2,
         borderRadius: 6,
         barThickness: 40
@@ -81,21 +83,25 @@ function createFeatureImportanceChart(canvas) {
           cornerRadius: 8,
           callbacks: {
             label: function(context) {
-              return `Importance: ${(context.raw * 100).toFixed(1)}%`;
+              const sign = context.raw > 0 ? '+' : '';
+              return `Contribution: ${sign}${context.raw.toFixed(3)}`;
             }
           }
         }
       },
       scales: {
         x: {
-          beginAtZero: true,
-          max: 1,
+          min: -contributionAxisBound(defaultData.values),
+          max: contributionAxisBound(defaultData.values),
           grid: {
-            color: 'rgba(0, 0, 0, 0.05)'
+            color: context => context.tick && context.tick.value === 0
+              ? 'rgba(0, 0, 0, 0.25)'
+              : 'rgba(0, 0, 0, 0.05)'
           },
           ticks: {
             callback: function(value) {
-              return (value * 100) + '%';
+              const rounded = Number(value.toFixed(2));
+              return rounded > 0 ? `+${rounded}` : `${rounded}`;
             },
             font: {
               size: 12
@@ -136,6 +142,11 @@ function updateFeatureChart(data) {
   
   if (data.values) {
     featureImportanceChart.data.datasets[0].data = data.values;
+
+    // Symmetric, so bars for and against the crop are on the same scale
+    const bound = contributionAxisBound(data.values);
+    featureImportanceChart.options.scales.x.min = -bound;
+    featureImportanceChart.options.scales.x.max = bound;
   }
   
   // Animate the update
@@ -148,7 +159,7 @@ function updateFeatureChart(data) {
 function showPlaceholderChartData() {
   const placeholderData = {
     labels: ['Nitrogen', 'Phosphorus', 'Potassium', 'Temperature', 'Humidity', 'Rainfall', 'pH'],
-    values: [0.25, 0.18, 0.15, 0.14, 0.12, 0.10, 0.06]
+    values: [0.25, 0.18, 0.09, -0.04, 0.12, -0.08, 0.06]
   };
   
   updateFeatureChart(placeholderData);
@@ -161,6 +172,8 @@ function resetChart() {
   if (!featureImportanceChart) return;
   
   featureImportanceChart.data.datasets[0].data = [0, 0, 0, 0, 0, 0, 0];
+  featureImportanceChart.options.scales.x.min = -contributionAxisBound([]);
+  featureImportanceChart.options.scales.x.max = contributionAxisBound([]);
   featureImportanceChart.update('active');
 }
 
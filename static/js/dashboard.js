@@ -265,16 +265,22 @@ function showError(msg) {
 /* ===============================
    LOAD PREDICTION HISTORY
    =============================== */
-function loadPredictionHistory() {
-  fetch("/api/history/", { credentials: "same-origin" })
+function loadPredictionHistory(cursor) {
+  let url = "/api/history/?fields=id,inputs,top_prediction,created_at";
+  if (cursor) url += `&cursor=${encodeURIComponent(cursor)}`;
+
+  fetch(url, { credentials: "same-origin" })
     .then((res) => res.json())
     .then((data) => {
       const tbody = document.getElementById("history-body");
       if (!tbody) return;
 
-      tbody.innerHTML = "";
+      const loadMore = document.getElementById("history-load-more");
+      if (loadMore) loadMore.remove();
+
+      if (!cursor) tbody.innerHTML = "";
 
-      if (!data.history || data.history.length === 0) {
+      if (!cursor && (!data.history || data.history.length === 0)) {
         tbody.innerHTML = `
           <tr>
             <td colspan="4">No history yet</td>
@@ -284,9 +290,9 @@ function loadPredictionHistory() {
 
       data.history.forEach((item) => {
         
-        if (!item.result || !item.result.predictions) return;
+        if (!item.top_prediction) return;
 
-        const top = item.result.predictions[0];
+        const top = item.top_prediction;
         const row = document.createElement("tr");
 
         row.innerHTML = `
@@ -311,6 +317,20 @@ function loadPredictionHistory() {
         tbody.appendChild(row);
       });
 
+      if (data.next_cursor) {
+        const row = document.createElement("tr");
+        row.id = "history-load-more";
+        row.innerHTML = `
+          <td colspan="4">
+            <button class="btn-small">Load more</button>
+          </td>
+        `;
+        row.querySelector("button").addEventListener("click", () => {
+          loadPredictionHistory(data.next_cursor);
+        });
+        tbody.appendChild(row);
+      }
+
     })
     .catch((err) => {
       console.error("History load error:", err);
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.10 on 2026-10-18 13:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voice', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='voicequery',
+            index=models.Index(
+                fields=['user', '-timestamp'],
+                name='voicequery_user_time_idx',
+            ),
+        ),
+    ]
@@ -25,6 +25,13 @@ class VoiceQuery(models.Model):
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            # Every read is one user's queries, newest first
+            models.Index(
+                fields=['user', '-timestamp'],
+                name='voicequery_user_time_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.username} | {self.query_type} | {self.query[:40]}"
@@ -13,6 +13,8 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST, require_GET
 from django.shortcuts import render
 
+from core.write_behind import flush_user, save_later
+
 from .models import VoiceQuery
 from .services import (
     generate_ai_response,
@@ -62,6 +64,7 @@ def _user_location(user) -> str:
 @login_required
 def voice_assistant_page(request):
     """GET /voice/  →  renders the voice assistant UI."""
+    flush_user(request.user)
     recent = VoiceQuery.objects.filter(user=request.user).order_by('-timestamp')[:10]
     return render(request, 'voice/voice_assistant.html', {'recent_queries': recent})
 
@@ -90,13 +93,13 @@ def process_text(request):
         location      = _user_location(request.user)
         response_text = generate_ai_response(text, location, language)
 
-        VoiceQuery.objects.create(
+        save_later(VoiceQuery(
             user=request.user,
             query=text,
             response=response_text,
             query_type='text',
             language=language,
-        )
+        ))
 
         audio_data = synthesize_speech(response_text, language)
         return JsonResponse({'response_text': response_text, 'audio_data': audio_data})
@@ -133,13 +136,13 @@ def process_audio(request):
         location      = _user_location(request.user)
         response_text = generate_ai_response(transcript, location, language)
 
-        VoiceQuery.objects.create(
+        save_later(VoiceQuery(
             user=request.user,
             query=transcript,
             response=response_text,
             query_type='audio',
             language=language,
-        )
+        ))
 
         audio_data = synthesize_speech(response_text, language)
         return JsonResponse({
@@ -275,6 +278,7 @@ def query_history(request):
     GET /voice/history/
     Returns last 20 queries for the logged-in user as JSON.
     """
+    flush_user(request.user)
     queries = VoiceQuery.objects.filter(user=request.user).order_by('-timestamp')[:20]
     return JsonResponse({
         'history': [